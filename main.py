@@ -1,52 +1,427 @@
 import os
 import sys
+import json
+import glob
+import fnmatch
+import hashlib
+import argparse
+import time
+import threading
+import traceback
 import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def run_script(script_path):
-    print(f"\nRunning script: {script_path}")
-    # Set the working directory for the script to its own directory.
+base_dir = os.path.abspath(os.path.dirname(__file__))
+STATE_PATH = os.path.join(base_dir, "data", "state", "pipeline_runs.json")
+# One directory per run: report.json plus the per-stage metrics and profiles.
+REPORTS_DIR = os.path.join(base_dir, "data", "state", "run_reports")
+# Settings that change what a stage writes; part of every stage's cache key.
+ENV_KEYS = ["STORAGE_FORMAT", "MERGED_LAYOUT", "SPLIT_MODE", "TRAIN_MODE", "MAX_ROUNDS", "EARLY_STOPPING_ROUNDS",
+            "LAG_FEATURES", "TRAIN_SCOPE", "TUNED_PARAMS"]
+
+print_lock = threading.Lock()
+
+
+class Stage:
+    """
+    One pipeline script with the paths it reads and writes. Dependencies are
+    derived from these paths: a stage runs after every stage that writes one
+    of its inputs, plus any stage listed in `after`. A path may be a
+    directory, which covers every path under it, or a glob pattern, for
+    outputs named by date in a directory other stages also write to. Stages
+    whose input is an external API (always_run) are never skipped.
+    """
+
+    def __init__(self, name, script, inputs=(), outputs=(), code=(), after=(), always_run=False):
+        self.name = name
+        self.script = os.path.join(base_dir, script)
+        self.inputs = [os.path.join(base_dir, p) for p in inputs]
+        self.outputs = [os.path.join(base_dir, p) for p in outputs]
+        self.code = [self.script] + [os.path.join(base_dir, p) for p in code]
+        self.after = list(after)
+        self.always_run = always_run
+
+
+COMMON_CODE = [os.path.join("scripts", "common")]
+FETCH_CODE = COMMON_CODE + [os.path.join("scripts", "ingestion")]
+MERGED = [os.path.join("data", "merged_data"), os.path.join("data", "merged_wide")]
+
+STAGES = [
+    Stage("load", os.path.join("scripts", "load", "actual_total_load.py"),
+          outputs=[os.path.join("data", "load")], code=FETCH_CODE, always_run=True),
+    Stage("generation", os.path.join("scripts", "generation", "generation_forecast_day_ahead.py"),
+          outputs=[os.path.join("data", "generation")], code=FETCH_CODE, always_run=True),
+    Stage("price", os.path.join("scripts", "price", "energy_prices.py"),
+          outputs=[os.path.join("data", "price")], code=FETCH_CODE, always_run=True),
+    Stage("merge", os.path.join("scripts", "merged_data", "merge_data.py"),
+          inputs=[os.path.join("data", d) for d in ["load", "generation", "price"]], outputs=MERGED,
+          code=FETCH_CODE),
+    Stage("process", os.path.join("scripts", "data_processing", "data_processing.py"),
+          inputs=[os.path.join("data", "merged_data")],
+          outputs=[os.path.join("models", "cleaning_params.csv"),
+                   os.path.join("data", "processed_data", "processed_dataset_*")], code=COMMON_CODE),
+    Stage("features", os.path.join("scripts", "features", "feature_store.py"),
+          inputs=[os.path.join("data", "merged_wide")], outputs=[os.path.join("data", "features")], code=COMMON_CODE),
+    Stage("split", os.path.join("scripts", "data_splitting", "train_test_split.py"),
+          inputs=MERGED, outputs=[os.path.join("data", "data_splitting")], code=COMMON_CODE),
+    Stage("train", os.path.join("scripts", "model", "xgboost_model.py"),
+          inputs=[os.path.join("data", "data_splitting"), os.path.join("data", "features"),
+                  os.path.join("models", "xgboost_params.json")] + MERGED,
+          outputs=[os.path.join("models", "registry"),
+                   os.path.join("data", "processed_data", "model_predictions.csv")], code=COMMON_CODE),
+    Stage("eda", os.path.join("scripts", "eda", "eda_analysis.py"),
+          inputs=MERGED, outputs=[os.path.join("data", "plots", "filtered_4day_generation_vs_actual_load_price.png")],
+          code=COMMON_CODE),
+    # Risk detection only runs once training has succeeded.
+    Stage("risk", os.path.join("scripts", "model", "risk_detection.py"),
+          inputs=MERGED, after=["train"], code=COMMON_CODE,
+          outputs=[os.path.join("data", "plots", name) for name in
+                   ["actual_generation_forecast_price.png", "actual_vs_generation_forecast.png",
+                    "risk_visualization.png"]]),
+]
+
+
+def path_files(path):
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        files.extend(os.path.join(root, n) for n in sorted(names) if not n.endswith(".pyc"))
+    return files
+
+
+def hash_paths(paths):
+    """
+    Content hash over every file under the given paths (names and bytes), so
+    renames and edits both change it. Missing paths hash as absent.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            digest.update(f"missing:{os.path.relpath(path, base_dir)}".encode())
+            continue
+        for file_path in path_files(path):
+            digest.update(os.path.relpath(file_path, base_dir).encode())
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(stage):
+    digest = hashlib.sha256()
+    digest.update(hash_paths(stage.inputs).encode())
+    digest.update(hash_paths(stage.code).encode())
+    digest.update(json.dumps({k: os.getenv(k) for k in ENV_KEYS}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(STATE_PATH, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def path_exists(path):
+    return bool(glob.glob(path))
+
+
+def overlaps(output, path):
+    """
+    Whether a stage writing `output` can change `path`: the same path, one
+    inside the other, or one matching the other's glob pattern.
+    """
+    return (output == path or fnmatch.fnmatch(path, output) or fnmatch.fnmatch(output, path)
+            or path.startswith(output + os.sep) or output.startswith(path + os.sep))
+
+
+def dependencies(stages):
+    deps = {}
+    for stage in stages:
+        upstream = {s.name for s in stages if s is not stage
+                    and any(overlaps(o, i) for o in s.outputs for i in stage.inputs)}
+        deps[stage.name] = upstream | (set(stage.after) & {s.name for s in stages})
+    return deps
+
+
+def run_script(name, script_path, env=None):
+    # Each script runs in its own directory; its output is prefixed with the stage name.
     script_dir = os.path.dirname(script_path)
-    print(f"Setting working directory to: {script_dir}")
-    result = subprocess.run([sys.executable, script_path], cwd=script_dir)
-    if result.returncode != 0:
-        print(f"Script {script_path} failed with return code {result.returncode}.")
-        sys.exit(result.returncode)
-    else:
-        print(f"Script {script_path} executed successfully.\n")
+    process = subprocess.Popen([sys.executable, script_path], cwd=script_dir, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, bufsize=1, env=env)
+    for line in process.stdout:
+        with print_lock:
+            print(f"[{name}] {line}", end="")
+    return process.wait()
+
+
+def stage_env(stage, report_dir=None, profile=None):
+    """
+    Environment for a stage subprocess. With a report directory, the stage
+    writes its metrics (and profile) there on exit; see scripts/common/instrumentation.py.
+    """
+    env = dict(os.environ, PIPELINE_STAGE=stage.name)
+    if report_dir is not None:
+        env["PIPELINE_METRICS_PATH"] = os.path.join(report_dir, f"{stage.name}.json")
+        if profile:
+            env["PIPELINE_PROFILE"] = profile
+    return env
+
+
+def timed_run(stage, env):
+    start = time.perf_counter()
+    returncode = run_script(stage.name, stage.script, env)
+    return returncode, time.perf_counter() - start
+
+
+def stage_record(name, status, wall_s=None, report_dir=None):
+    """
+    Report entry for one stage: its status, the wall time seen from here and,
+    when the stage wrote one, its own metrics. The difference between the two
+    wall times is interpreter startup and imports.
+    """
+    record = {"stage": name, "status": status}
+    path = os.path.join(report_dir, f"{name}.json") if report_dir is not None else None
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            record.update(json.load(f))
+        record["status"] = status
+    if wall_s is not None:
+        if "wall_s" in record:
+            record["startup_s"] = round(wall_s - record["wall_s"], 3)
+        record["wall_s"] = round(wall_s, 3)
+    return record
+
+
+def run_pipeline(stages, jobs=4, force=False, records=None, report_dir=None, profile=None):
+    """
+    Runs the stages in dependency order, with independent stages in parallel.
+    A stage is skipped when the hash of its inputs and code matches its last
+    successful run and its outputs exist. When a stage fails, only the stages
+    downstream of it are left out; the next run retries exactly those.
+    When `records` is given, a stage_record is stored there for every stage.
+    """
+    state = load_state()
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    status = {}
+    running = {}
+
+    def ready():
+        return [s for s in stages if s.name not in status and s.name not in running.values()
+                and all(status.get(d) in ("ok", "skipped") for d in deps[s.name])]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(status) < len(stages):
+            for stage in stages:
+                if stage.name not in status and any(status.get(d) in ("failed", "blocked") for d in deps[stage.name]):
+                    status[stage.name] = "blocked"
+                    if records is not None:
+                        records[stage.name] = stage_record(stage.name, "blocked")
+                    print(f"Stage {stage.name} not run: an upstream stage failed.")
+            for stage in ready():
+                key = stage_key(stage)
+                previous = state.get(stage.name, {})
+                if (not force and not stage.always_run and previous.get("key") == key
+                        and all(path_exists(o) for o in stage.outputs)):
+                    status[stage.name] = "skipped"
+                    if records is not None:
+                        records[stage.name] = stage_record(stage.name, "skipped")
+                    print(f"Stage {stage.name} is up to date (inputs and code unchanged); skipping.")
+                    continue
+                print(f"\nRunning stage {stage.name}: {stage.script}")
+                running[pool.submit(timed_run, stage, stage_env(stage, report_dir, profile))] = stage.name
+            if not running:
+                if len(status) < len(stages):
+                    continue
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                returncode, wall_s = future.result()
+                if returncode == 0:
+                    status[name] = "ok"
+                    # The key is taken after the run so it reflects the inputs the stage actually read.
+                    state[name] = {"key": stage_key(by_name[name]), "finished_at": datetime.now().isoformat()}
+                    save_state(state)
+                    print(f"Stage {name} executed successfully.")
+                else:
+                    status[name] = "failed"
+                    print(f"Stage {name} failed with return code {returncode}.")
+                if records is not None:
+                    records[name] = stage_record(name, status[name], wall_s, report_dir)
+                    records[name]["returncode"] = returncode
+    return status
+
+
+# The stages run_in_process runs, in order.
+IN_PROCESS_STAGES = ["merge", "process", "features", "split", "train", "eda", "risk"]
+
+
+def run_in_process(base_dir, records=None, report_dir=None, profile=None):
+    """
+    Runs merge, cleaning, features, split, training, EDA and risk in this process. The merged
+    frame is built once and the same object is handed to every stage, so
+    nothing is written and read back between them; the splits are views of
+    it. Outputs on disk are the same as in DAG mode. Stage metrics are
+    stored in `records` if given; when a stage raises, its record has the
+    error, the stages after it are recorded as blocked and the exception
+    is re-raised.
+    """
+    from scripts.common import instrumentation
+
+    records = {} if records is None else records
+
+    @contextmanager
+    def stage(name):
+        error = None
+        try:
+            with instrumentation.stage(name, profile=profile, profile_dir=report_dir) as metrics:
+                yield metrics
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            records[name] = {"status": "failed" if error is not None else "ok", **metrics.report()}
+            if error is not None:
+                # exit(1) in a stage is a SystemExit; its message was printed by the stage.
+                records[name]["error"] = f"{type(error).__name__}: {error}"
+
+    try:
+        return run_stages(base_dir, stage)
+    except BaseException:
+        for name in IN_PROCESS_STAGES:
+            records.setdefault(name, {"stage": name, "status": "blocked"})
+        raise
+
+
+def run_stages(base_dir, stage):
+    """
+    The stages of run_in_process; `stage(name)` records each one's metrics.
+    """
+    from scripts.common.storage import MERGED_LAYOUT
+    from scripts.merged_data.merge_data import merge_frames, read_sources, save_merged
+    from scripts.data_processing.data_processing import process_stage
+    from scripts.features.feature_store import update_store
+    from scripts.data_splitting.train_test_split import save_manifest, split_manifest, split_views
+    from scripts.model.xgboost_model import store_features, train_and_save, training_rows
+    from scripts.eda.eda_analysis import eda_stage
+    from scripts.model.risk_detection import risk_stage
+
+    with stage("merge") as metrics:
+        merged = merge_frames(*read_sources(base_dir))
+        paths = save_merged(merged, base_dir)
+        frame, frame_path = (merged.wide, paths.wide) if MERGED_LAYOUT == "wide" else (merged.long, paths.long)
+        metrics.count(rows_out=len(frame))
+
+    with stage("process") as metrics:
+        metrics.count(rows_in=len(merged.long))
+        process_stage(merged.long, base_dir)
+
+    with stage("features") as metrics:
+        store = update_store(base_dir, paths.wide, wide=merged.wide)
+
+    with stage("split") as metrics:
+        manifest = split_manifest(frame, frame_path)
+        save_manifest(manifest, os.path.join(base_dir, "data", "data_splitting"))
+        splits = split_views(frame, manifest)
+        metrics.count(rows_in=len(frame), rows_out=sum(len(split) for split in splits))
+
+    with stage("train") as metrics:
+        features = store_features(manifest, base_dir)
+        df_train, df_val = training_rows(splits.train, features), training_rows(splits.validation, features)
+        df_test = training_rows(splits.test, features)
+        metrics.count(rows_in=len(df_train) + len(df_val) + len(df_test))
+        training = train_and_save(df_train, df_val, base_dir, store.data_version if features is not None else None,
+                                  df_test)
+
+    with stage("eda") as metrics:
+        metrics.count(rows_in=len(frame))
+        eda_stage(frame, base_dir)
+
+    with stage("risk") as metrics:
+        metrics.count(rows_in=len(frame))
+        risk = risk_stage(frame, base_dir)
+    return training, risk
+
+
+def write_run_report(report_dir, report):
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, "report.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
 
 if __name__ == "__main__":
-    # Define the base directory (this file is located in the root of the project)
-    base_dir = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description="Run the energy risk pipeline as a DAG of stages.")
+    parser.add_argument("--stages", nargs="+", choices=[s.name for s in STAGES],
+                        help="run only these stages; the outputs of the others are used as they are")
+    parser.add_argument("--jobs", type=int, default=4, help="maximum number of stages running at once")
+    parser.add_argument("--force", action="store_true", help="run every selected stage even if it is up to date")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the fetchers as usual, then everything from merge on in this process on a shared frame")
+    parser.add_argument("--report-dir", default=REPORTS_DIR,
+                        help="where the JSON run report is written, in a subdirectory per run")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"],
+                        help="profile every stage that runs and store the profiles with the run report")
+    args = parser.parse_args()
+
     print(f"Base directory is: {base_dir}\n")
-    
-    # List the scripts to run in the desired order.
-    # The order is as follows:
-    # 1. Load the Actual Total Load data.
-    # 2. Load the Generation Forecast Day-Ahead data.
-    # 3. Load the Energy Price data.
-    # 4. Merge the individual datasets into a single merged dataset.
-    # 5. Split the merged dataset into training, validation, and test sets.
-    # 6. Train the model using XGBoost.
-    # 7. Run the Exploratory Data Analysis (EDA) on the merged data.
-    # 8. Run Risk Detection after training has successfully completed.
-    scripts_to_run = [
-        os.path.join(base_dir, "scripts", "load", "actual_total_load.py"),
-        os.path.join(base_dir, "scripts", "generation", "generation_forecast_day_ahead.py"),
-        os.path.join(base_dir, "scripts", "price", "energy_prices.py"),
-        os.path.join(base_dir, "scripts", "merged_data", "merge_data.py"),
-        os.path.join(base_dir, "scripts", "data_splitting", "train_test_split.py"),
-        os.path.join(base_dir, "scripts", "model", "xgboost_model.py"),  # Model training script
-        os.path.join(base_dir, "scripts", "eda", "eda_analysis.py"),  # EDA Analysis
-    ]
-    
-    # Run each script sequentially.
-    for script in scripts_to_run:
-        run_script(script)
-    
-    print("All scripts executed successfully. Running risk detection...")
-    
-    # Run risk detection script only if all previous scripts succeeded
-    risk_detection_script = os.path.join(base_dir, "scripts", "model", "risk_detection.py")
-    run_script(risk_detection_script)
-    
+    started_at = datetime.now()
+    run_start = time.perf_counter()
+    run_dir = os.path.join(args.report_dir, started_at.strftime("%Y%m%dT%H%M%S"))
+    # Recorded with every dataset the run registers in the catalog.
+    os.environ["PIPELINE_RUN_ID"] = os.path.basename(run_dir)
+    records = {}
+    selected = [s for s in STAGES if args.stages is None or s.name in args.stages]
+    if args.in_process:
+        selected = [s for s in selected if s.always_run]
+    status = run_pipeline(selected, jobs=args.jobs, force=args.force, records=records, report_dir=run_dir,
+                          profile=args.profile)
+    error = None
+    if args.in_process and not any(result in ("failed", "blocked") for result in status.values()):
+        try:
+            run_in_process(base_dir, records=records, report_dir=run_dir, profile=args.profile)
+        except BaseException as e:
+            # The report is written and the summary printed for a failed run too.
+            error = e
+            if not isinstance(e, SystemExit):
+                traceback.print_exc()
+        status.update({name: record["status"] for name, record in records.items() if name not in status})
+
+    failed_stage = next((name for name in IN_PROCESS_STAGES if records.get(name, {}).get("status") == "failed"), None)
+    report_path = write_run_report(run_dir, {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_s": round(time.perf_counter() - run_start, 3),
+        "mode": "in-process" if args.in_process else "dag",
+        "jobs": args.jobs,
+        "force": args.force,
+        "settings": {k: os.getenv(k) for k in ENV_KEYS},
+        "stages": [records[s.name] for s in STAGES if s.name in records],
+        "failed_stage": failed_stage,
+        "error": None if error is None else f"{type(error).__name__}: {error}",
+    })
+
+    print("\nStage summary:")
+    for stage in STAGES:
+        if stage.name in status:
+            wall_s = records.get(stage.name, {}).get("wall_s")
+            print(f"  {stage.name:<12}{status[stage.name]:<10}" + (f"{wall_s:.1f}s" if wall_s is not None else ""))
+    print(f"Run report written to {report_path}")
+    if isinstance(error, KeyboardInterrupt):
+        raise error
+    if error is not None or any(result in ("failed", "blocked") for result in status.values()):
+        sys.exit(1)
     print("✅ All processes, including risk detection, completed successfully.")
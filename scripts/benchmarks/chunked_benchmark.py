@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from scripts.benchmarks.suite import START, scale_shape
+from scripts.benchmarks.synthetic import synthetic_sources
+
+STEPS = ["merge", "process", "risk"]
+SOURCE_DIRS = ["load", "generation", "price"]
+
+
+def write_sources(work_dir, n_countries, years, resolution):
+    rows = 0
+    for name, df in zip(SOURCE_DIRS, synthetic_sources(n_countries=n_countries, years=years,
+                                                       resolution=resolution, start=START)):
+        os.makedirs(os.path.join(work_dir, "data", name), exist_ok=True)
+        df.to_csv(os.path.join(work_dir, "data", name, f"all_countries_{name}_synthetic.csv.gz"), index=False)
+        rows += len(df)
+    return rows
+
+
+def run_step(step, work_dir, chunk_rows):
+    """
+    Runs one step against work_dir in this process; called in a fresh
+    subprocess per step so that its peak RSS is its own.
+    """
+    from scripts.common.storage import dataset_extension, read_dataset, write_dataset
+    from scripts.data_processing.data_processing import process_chunked, process_frame
+    from scripts.merged_data.merge_data import merge_chunked, merge_stage, output_bases
+    from scripts.model.risk_detection import (compute_risk, compute_risk_chunked, merged_columns, merged_path,
+                                              publish_risk)
+
+    merged_base = output_bases(work_dir)[0]
+    processed_base = os.path.join(work_dir, "data", "processed_data", "processed_dataset")
+    os.makedirs(os.path.dirname(processed_base), exist_ok=True)
+    if step == "merge":
+        merge_chunked(work_dir, chunk_rows) if chunk_rows else merge_stage(work_dir)
+    elif step == "process":
+        merged_file = merged_base + dataset_extension()
+        if chunk_rows:
+            process_chunked(merged_file, processed_base, chunk_rows, work_dir)
+        else:
+            write_dataset(process_frame(read_dataset(merged_file))[0], processed_base)
+    elif step == "risk":
+        path = merged_path(work_dir)
+        if chunk_rows:
+            result = compute_risk_chunked(path, chunk_rows, merged_columns())
+        else:
+            df = read_dataset(path, columns=merged_columns())
+            result = compute_risk(df)
+        publish_risk(result, work_dir)
+        result.resampled.to_pickle(os.path.join(work_dir, "risk.pkl"))
+
+
+def measure(step, work_dir, chunk_rows, verbose):
+    metrics_path = os.path.join(work_dir, f"{step}-{chunk_rows}.json")
+    env = {**os.environ, "PIPELINE_METRICS_PATH": metrics_path, "PIPELINE_STAGE": step}
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--step", step, "--work-dir", work_dir,
+                    "--chunk-rows", str(chunk_rows)], env=env, check=True,
+                   stdout=None if verbose else subprocess.DEVNULL)
+    with open(metrics_path) as f:
+        return json.load(f)
+
+
+def outputs(work_dir):
+    """
+    The step outputs of a run, read back for comparison between modes.
+    """
+    from scripts.common.storage import merged_location, read_dataset
+
+    found = {}
+    for layout in ["long", "wide"]:
+        directory, prefix = merged_location(work_dir, layout)
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(prefix):
+                found[layout] = read_dataset(os.path.join(directory, name))
+    processed_dir = os.path.join(work_dir, "data", "processed_data")
+    for name in sorted(os.listdir(processed_dir)):
+        found["processed"] = read_dataset(os.path.join(processed_dir, name))
+    found["risk"] = pd.read_pickle(os.path.join(work_dir, "risk.pkl"))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak memory and wall time of merge, cleaning and risk in memory vs chunked, on synthetic data.")
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--countries", type=int, default=3, help="countries at scale 1")
+    parser.add_argument("--years", type=float, default=1, help="years of history at scale 1")
+    parser.add_argument("--resolution", default="PT60M", choices=["PT15M", "PT30M", "PT60M"])
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--verbose", action="store_true", help="show the steps' own output")
+    parser.add_argument("--step", choices=STEPS, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.step:
+        run_step(args.step, args.work_dir, args.chunk_rows)
+        return
+
+    n_countries, years = scale_shape(args.scale, args.countries, args.years)
+    results = []
+    runs = {}
+    with tempfile.TemporaryDirectory() as sources_dir:
+        rows = write_sources(sources_dir, n_countries, years, args.resolution)
+        print(f"{n_countries} countries x {years:g} years at {args.resolution}: {rows} source rows")
+        for chunk_rows in [0, args.chunk_rows]:
+            mode = f"chunked ({chunk_rows} rows)" if chunk_rows else "in memory"
+            with tempfile.TemporaryDirectory() as work_dir:
+                os.makedirs(os.path.join(work_dir, "data"))
+                for name in SOURCE_DIRS:
+                    os.symlink(os.path.join(sources_dir, "data", name), os.path.join(work_dir, "data", name))
+                for step in STEPS:
+                    report = measure(step, work_dir, chunk_rows, args.verbose)
+                    results.append({"step": step, "mode": mode, "wall_s": report["wall_s"],
+                                    "peak_rss_mb": report["peak_rss_mb"]})
+                    print(f"  {step:<8}{mode:<24}{report['wall_s']:>8.2f}s {report['peak_rss_mb']:>9} MB")
+                runs[mode] = outputs(work_dir)
+
+    print()
+    print(pd.DataFrame(results).pivot(index="step", columns="mode", values="peak_rss_mb")
+          .reindex(STEPS).to_string())
+    in_memory, chunked = runs.values()
+    for name in in_memory:
+        same = in_memory[name].equals(chunked.get(name))
+        print(f"{name} output {'identical' if same else 'DIFFERS'} between modes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import main as pipeline
+
+DOWNSTREAM = ["merge", "split", "train", "eda", "risk"]
+
+
+def timed(func, quiet=True):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end wall time of merge -> risk as subprocess stages vs in-process on a shared frame.")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the stages' own output")
+    args = parser.parse_args()
+
+    stages = [s for s in pipeline.STAGES if s.name in DOWNSTREAM]
+    results = []
+    for _ in range(args.repeat):
+        # force=True so no stage is skipped by the content-hash check.
+        seconds = timed(lambda: pipeline.run_pipeline(stages, force=True), quiet=not args.verbose)
+        results.append({"mode": "subprocess DAG", "seconds": seconds})
+        seconds = timed(lambda: pipeline.run_in_process(base_dir), quiet=not args.verbose)
+        results.append({"mode": "in-process", "seconds": seconds})
+
+    summary = pd.DataFrame(results).groupby("mode", sort=False)["seconds"].agg(["min", "mean"]).round(2)
+    print(f"Stages: {' -> '.join(DOWNSTREAM)} ({args.repeat} run(s) each, STORAGE_FORMAT="
+          f"{os.getenv('STORAGE_FORMAT', 'csv')}, MERGED_LAYOUT={os.getenv('MERGED_LAYOUT', 'long')})")
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
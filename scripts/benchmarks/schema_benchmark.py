@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common.schema import apply_schema, bytes_per_row
+from scripts.common.storage import is_dataset
+
+
+def best_of(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def groupby_means(df):
+    return df.groupby(["country", "measurement_type"], observed=True)["measurement"].mean()
+
+
+def load_generation_merge(df):
+    load = df.loc[df["measurement_type"] == "actual_load", ["timestamp", "country", "measurement"]]
+    generation = df.loc[df["measurement_type"] == "generation_forecast", ["timestamp", "country", "measurement"]]
+    return load.merge(generation, on=["timestamp", "country"], suffixes=("_load", "_generation"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and groupby/merge time with and without the shared schema.")
+    parser.add_argument("--input", help="merged CSV dataset (default: first one in data/merged_data)")
+    args = parser.parse_args()
+
+    merged_dir = os.path.join(base_dir, "data", "merged_data")
+    input_path = args.input
+    if input_path is None:
+        files = sorted(f for f in os.listdir(merged_dir) if is_dataset(f) and f.endswith(".csv.gz"))
+        if not files:
+            print("No merged CSV dataset found; run scripts/merged_data/merge_data.py first.")
+            sys.exit(1)
+        input_path = os.path.join(merged_dir, files[0])
+
+    raw = pd.read_csv(input_path, compression="gzip")
+    raw["timestamp"] = pd.to_datetime(raw["timestamp"], utc=True)
+    typed = apply_schema(raw)
+
+    results = []
+    for name, df in [("raw", raw), ("schema", typed)]:
+        results.append({
+            "frame": name,
+            "rows": len(df),
+            "bytes_per_row": round(bytes_per_row(df), 1),
+            "total_mb": round(df.memory_usage(deep=True).sum() / 1e6, 1),
+            "groupby_s": round(best_of(lambda: groupby_means(df)), 4),
+            "merge_s": round(best_of(lambda: load_generation_merge(df)), 4),
+        })
+    print(pd.DataFrame(results).to_string(index=False))
+    print("\nColumn dtypes with the shared schema:")
+    print(typed.dtypes.to_string())
+
+
+if __name__ == "__main__":
+    main()
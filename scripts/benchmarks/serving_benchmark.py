@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common.schema import TIMEZONE
+from scripts.serving.predictor import Predictor
+
+SERVICE = os.path.join(base_dir, "scripts", "serving", "service.py")
+# Server settings compared: micro-batching as configured by default, and
+# every request scored on its own.
+MODES = {"batched": [], "unbatched": ["--batch-max-rows", "1"]}
+
+
+def sample_payloads(predictor: Predictor, n_requests: int, rows: int, seed: int = 42) -> list:
+    """
+    Request bodies of `rows` random (country, hour) rows of the feature store.
+    """
+    rng = np.random.default_rng(seed)
+    keys = predictor.store_keys[rng.integers(0, len(predictor.store_keys), n_requests * rows)]
+    countries = np.asarray(predictor.categories)[keys >> 40]
+    timestamps = pd.to_datetime((keys & ((1 << 40) - 1)) * 1_000_000_000, utc=True).tz_convert(TIMEZONE)
+    texts = [t.isoformat() for t in timestamps]
+    return [json.dumps({"rows": [{"country": countries[k], "timestamp": texts[k]}
+                                 for k in range(r * rows, (r + 1) * rows)]}).encode() for r in range(n_requests)]
+
+
+def summary(latencies: list, wall: float, rows: int) -> dict:
+    ms = np.asarray(latencies) * 1e3
+    return {"requests": len(ms), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3), "req_s": round(len(ms) / wall, 1),
+            "rows_s": round(len(ms) * rows / wall, 1)}
+
+
+def direct(predictor: Predictor, payloads: list, rows: int) -> dict:
+    """
+    Parsing and scoring one request at a time in this process, without HTTP.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for body in payloads:
+        t = time.perf_counter()
+        predictor.predict(predictor.parse(json.loads(body)["rows"]))
+        latencies.append(time.perf_counter() - t)
+    return summary(latencies, time.perf_counter() - start, rows)
+
+
+async def client(port: int, payloads: list, latencies: list):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for body in payloads:
+        t = time.perf_counter()
+        writer.write(b"POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+        status = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        response = await reader.readexactly(length)
+        if b" 200 " not in status:
+            raise RuntimeError(f"{status.decode().strip()}: {response[:200].decode()}")
+        latencies.append(time.perf_counter() - t)
+    writer.close()
+
+
+async def load(port: int, payloads: list, concurrency: int, rows: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, payloads[k::concurrency], latencies) for k in range(concurrency)))
+    return summary(latencies, time.perf_counter() - start, rows)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(mode: str, model: str):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, SERVICE, "--port", str(port), "--model", model, *MODES[mode]],
+                               stdout=subprocess.PIPE, text=True)
+    output = []
+    for line in process.stdout:
+        if line.startswith("Serving"):
+            return process, port
+        output.append(line)
+    process.kill()
+    raise RuntimeError("The service did not start:\n" + "".join(output[-20:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="p50/p99 latency and throughput of the prediction service, with and without micro-batching, "
+                    "against the serving model and feature store of this repo.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64], help="concurrent connections")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 24], help="rows per request")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per measurement")
+    parser.add_argument("--model", default="generation_forecast")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    predictor = Predictor(base_dir, args.model)
+    print(f"{predictor.name} v{predictor.version}, {os.cpu_count()} core(s); client and service share them.")
+    results = []
+    for rows in args.rows:
+        payloads = sample_payloads(predictor, args.requests, rows)
+        direct(predictor, payloads[:50], rows)
+        report = direct(predictor, payloads, rows)
+        results.append({"mode": "direct", "rows": rows, "concurrency": 1, **report})
+        print(f"  direct     {rows:>4} rows  x1    p50 {report['p50_ms']:>8.2f} ms  p99 {report['p99_ms']:>8.2f} ms  "
+              f"{report['req_s']:>8.0f} req/s")
+        for mode in MODES:
+            process, port = start_service(mode, args.model)
+            try:
+                asyncio.run(load(port, payloads[:50], 1, rows))
+                for concurrency in args.concurrency:
+                    report = asyncio.run(load(port, payloads, concurrency, rows))
+                    results.append({"mode": mode, "rows": rows, "concurrency": concurrency, **report})
+                    print(f"  {mode:<10} {rows:>4} rows  x{concurrency:<4} p50 {report['p50_ms']:>8.2f} ms  "
+                          f"p99 {report['p99_ms']:>8.2f} ms  {report['req_s']:>8.0f} req/s")
+            finally:
+                process.terminate()
+                process.wait()
+
+    print()
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False))
+    if args.json:
+        df.to_json(args.json, orient="records", indent=2)
+
+
+if __name__ == "__main__":
+    main()
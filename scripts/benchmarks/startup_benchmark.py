@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+import main as pipeline
+
+
+def stage_module(stage):
+    return os.path.splitext(os.path.relpath(stage.script, base_dir))[0].replace(os.sep, ".")
+
+
+def import_times(module):
+    """
+    Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+    and returns (total import seconds, {top-level package: seconds}). Each
+    module's own ("self") time is charged to its top-level package, so a
+    package imported by another is still counted under its own name.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=base_dir,
+                            capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(own) / 1e6
+    return sum(packages.values()), dict(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of every pipeline stage (python -X importtime).")
+    parser.add_argument("--stages", nargs="+", choices=[s.name for s in pipeline.STAGES])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is kept")
+    parser.add_argument("--top", type=int, default=4, help="heaviest packages listed per stage")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for stage in pipeline.STAGES:
+        if args.stages and stage.name not in args.stages:
+            continue
+        module = stage_module(stage)
+        total, packages = min((import_times(module) for _ in range(args.repeat)), key=lambda r: r[0])
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        results.append({"stage": stage.name, "import_s": round(total, 3),
+                        "heaviest": ", ".join(f"{name} {seconds:.2f}s" for name, seconds in heaviest)})
+        print(f"  {stage.name:<12}{total:>7.3f}s")
+
+    print()
+    print(pd.DataFrame(results).to_string(index=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common.storage import is_dataset, read_dataset, write_dataset
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def disk_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gzip CSV and partitioned Parquet for the merged dataset.")
+    parser.add_argument("--input", help="merged dataset to use (default: first one in data/merged_data)")
+    parser.add_argument("--start", default=None, help="start of the filtered read (default: last month in the data)")
+    args = parser.parse_args()
+
+    merged_dir = os.path.join(base_dir, "data", "merged_data")
+    input_path = args.input
+    if input_path is None:
+        files = sorted(f for f in os.listdir(merged_dir) if is_dataset(f)) if os.path.isdir(merged_dir) else []
+        if not files:
+            print("No merged dataset found; run scripts/merged_data/merge_data.py first.")
+            sys.exit(1)
+        input_path = os.path.join(merged_dir, files[0])
+    df = read_dataset(input_path)
+    print(f"Benchmarking with {input_path}: {len(df)} rows")
+
+    start = pd.Timestamp(args.start) if args.start else df["timestamp"].max().normalize() - pd.Timedelta(days=30)
+    columns = ["timestamp", "country", "measurement"]
+    filters = {"columns": columns, "start": start, "measurement_types": ["generation_forecast"]}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage_format in ["csv", "parquet"]:
+            base = os.path.join(tmp, f"merged_{storage_format}")
+            path, write_seconds = timed(lambda: write_dataset(df, base, partitioned=True, storage_format=storage_format))
+            full, full_seconds = timed(lambda: read_dataset(path))
+            filtered, filtered_seconds = timed(lambda: read_dataset(path, **filters))
+            results.append({
+                "format": storage_format,
+                "size_mb": round(disk_size(path) / 1e6, 2),
+                "write_s": round(write_seconds, 3),
+                "read_full_s": round(full_seconds, 3),
+                "read_filtered_s": round(filtered_seconds, 3),
+                "filtered_rows": len(filtered),
+            })
+    print(f"Filtered read: columns={columns}, generation_forecast since {start.date()}")
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import matplotlib.pyplot as plt
+
+from scripts.benchmarks.synthetic import synthetic_document, synthetic_sources
+from scripts.common import instrumentation
+from scripts.common.storage import MERGED_LAYOUT
+from scripts.data_splitting.train_test_split import split_dataset
+from scripts.eda.eda_analysis import eda_stage
+from scripts.generation.generation_forecast_day_ahead import parse_and_format_generation_forecast
+from scripts.load.actual_total_load import parse_and_format_data
+from scripts.merged_data.merge_data import merge_frames, save_merged
+from scripts.model.risk_detection import risk_stage
+from scripts.model.xgboost_model import train_model, training_rows
+from scripts.price.energy_prices import parse_and_format_prices
+
+RESULTS_DIR = os.path.join(base_dir, "data", "benchmarks")
+# (documentType, value tag, parser) of each fetcher's XML parsing.
+DECODERS = {
+    "load_decode": ("A65", "quantity", parse_and_format_data),
+    "generation_decode": ("A71", "quantity", parse_and_format_generation_forecast),
+    "price_decode": ("A44", "price.amount", parse_and_format_prices),
+}
+# Both model paths of the training stage (TRAIN_MODE): native xgb.train and the one-hot scikit-learn wrapper.
+TRAIN_MODES = ["native", "onehot"]
+BENCHMARKS = [*DECODERS, "merge", "merge_write", "split", *(f"train_{mode}" for mode in TRAIN_MODES), "risk", "eda"]
+# Synthetic history ends well before today, so the fetchers' "not in the future" filter keeps every row.
+START = "2010-01-01"
+
+
+def scale_shape(scale, countries, years):
+    """
+    Countries and years for a scale factor: countries grow first (up to 10x,
+    about the number of real bidding zones), then the history gets longer.
+    """
+    country_factor = min(scale, 10)
+    return countries * country_factor, years * scale / country_factor
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=base_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=base_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def versions():
+    found = {"python": platform.python_version()}
+    for name in ["numpy", "pandas", "sklearn", "xgboost", "matplotlib", "pyarrow"]:
+        try:
+            found[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return found
+
+
+def benchmark_cases(n_countries, years, resolution, work_dir, selected=BENCHMARKS):
+    """
+    Yields (name, rows, setup, run) per benchmark. setup() runs untimed and
+    returns the argument for run(); the stages that follow the merge share
+    one merged frame, as in the in-process pipeline. Data is only generated
+    for the selected benchmarks.
+    """
+    for name, (document_type, value_tag, parse) in DECODERS.items():
+        if name in selected:
+            document = synthetic_document(n_series=n_countries, days=int(round(years * 365)), resolution=resolution,
+                                          start=f"{START}T00:00", document_type=document_type, value_tag=value_tag)
+            yield name, document.count(b"<Point>"), lambda document=document: document, \
+                lambda doc, parse=parse: parse(doc, "Synthetic", 1)
+    if not set(selected) - set(DECODERS):
+        return
+
+    sources = synthetic_sources(n_countries=n_countries, years=years, resolution=resolution, start=START)
+    rows = sum(len(df) for df in sources)
+    # merge_frames renames columns in place, so every run gets fresh copies.
+    yield "merge", rows, lambda: [df.copy() for df in sources], lambda frames: merge_frames(*frames)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        merged = merge_frames(*[df.copy() for df in sources])
+    frame = merged.wide if MERGED_LAYOUT == "wide" else merged.long
+    yield "merge_write", len(merged.long), lambda: merged, lambda result: save_merged(result, work_dir)
+    yield "split", len(frame), lambda: frame, split_dataset
+
+    splits = split_dataset(frame)
+    for mode in TRAIN_MODES:
+        yield f"train_{mode}", len(splits.train), \
+            lambda: (training_rows(splits.train), training_rows(splits.validation)), \
+            lambda data, mode=mode: train_model(*data, mode=mode)
+    yield "risk", len(frame), lambda: frame, lambda df: risk_stage(df, work_dir)
+    yield "eda", len(frame), lambda: frame, lambda df: eda_stage(df, work_dir)
+
+
+def run_case(name, setup, run, repeat, verbose):
+    best = None
+    for _ in range(repeat):
+        argument = setup()
+        # The peak of the run alone, not of building its input.
+        instrumentation.reset_peak_rss()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+            with instrumentation.stage(name) as metrics:
+                run(argument)
+        plt.close("all")
+        report = metrics.report()
+        if best is None or report["wall_s"] < best["wall_s"]:
+            best = report
+    return best
+
+
+def run_in_subprocess(args, scale, name, work_dir):
+    """
+    Runs one benchmark in a fresh process that builds its own input, so its
+    peak RSS is not raised by earlier benchmarks. Returns (rows, report).
+    """
+    result_path = os.path.join(work_dir, f"{scale}-{name}.json")
+    command = [sys.executable, os.path.abspath(__file__), "--case", name, "--result", result_path,
+               "--scales", str(scale), "--countries", str(args.countries), "--years", str(args.years),
+               "--resolution", args.resolution, "--repeat", str(args.repeat)]
+    subprocess.run(command + (["--verbose"] if args.verbose else []), check=True,
+                   stdout=None if args.verbose else subprocess.DEVNULL)
+    with open(result_path) as f:
+        result = json.load(f)
+    return result["rows"], result["report"]
+
+
+def run_single(args):
+    n_countries, years = scale_shape(args.scales[0], args.countries, args.years)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, rows, setup, run in benchmark_cases(n_countries, years, args.resolution, work_dir, [args.case]):
+            if name == args.case:
+                report = run_case(name, setup, run, args.repeat, args.verbose)
+                break
+    with open(args.result, "w") as f:
+        json.dump({"rows": rows, "report": report}, f)
+
+
+def latest_results(exclude=None):
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json")) if os.path.isdir(RESULTS_DIR) else []
+    files = [os.path.join(RESULTS_DIR, f) for f in files if os.path.join(RESULTS_DIR, f) != exclude]
+    return files[-1] if files else None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    keys = ["scale", "benchmark"]
+    merged = pd.DataFrame(current["results"])[keys + ["wall_s"]].merge(
+        pd.DataFrame(previous["results"])[keys + ["wall_s"]], on=keys, suffixes=("", "_previous"))
+    if merged.empty:
+        print(f"\nNo benchmarks in common with {previous_path}.")
+        return
+    merged["ratio"] = (merged["wall_s"] / merged["wall_s_previous"]).round(2)
+    print(f"\nCompared with {os.path.basename(previous_path)} (commit {previous.get('commit')}); "
+          f"ratio > 1 is slower:")
+    print(merged.to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time every pipeline stage on synthetic data at several scales (fully offline); each "
+                    "benchmark runs in its own process so its peak RSS is its own.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--countries", type=int, default=3, help="countries at scale 1")
+    parser.add_argument("--years", type=float, default=1, help="years of history at scale 1")
+    parser.add_argument("--resolution", default="PT60M", choices=["PT15M", "PT30M", "PT60M"])
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per benchmark; the fastest is kept")
+    parser.add_argument("--compare", metavar="RESULTS_JSON",
+                        help="results file to compare with (default: the latest one in data/benchmarks)")
+    parser.add_argument("--no-save", action="store_true", help="do not store the results")
+    parser.add_argument("--verbose", action="store_true", help="show the stages' own output")
+    parser.add_argument("--case", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_single(args)
+        return
+
+    results = []
+    for scale in args.scales:
+        n_countries, years = scale_shape(scale, args.countries, args.years)
+        print(f"Scale {scale}x: {n_countries} countries x {years:g} years at {args.resolution}")
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in [name for name in BENCHMARKS if name in args.benchmarks]:
+                rows, report = run_in_subprocess(args, scale, name, work_dir)
+                results.append({"scale": scale, "benchmark": name, "rows": rows, "wall_s": report["wall_s"],
+                                "cpu_s": report["cpu_s"], "peak_rss_mb": report["peak_rss_mb"],
+                                "rows_per_s": int(rows / report["wall_s"]) if report["wall_s"] else None})
+                print(f"  {name:<18}{report['wall_s']:>9.3f}s  {rows} rows")
+
+    current = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "versions": versions(),
+        "settings": {"countries": args.countries, "years": args.years, "resolution": args.resolution,
+                     "repeat": args.repeat, "STORAGE_FORMAT": os.getenv("STORAGE_FORMAT", "csv"),
+                     "MERGED_LAYOUT": MERGED_LAYOUT},
+        "results": results,
+    }
+    print()
+    print(pd.DataFrame(results).to_string(index=False))
+
+    results_path = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        results_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{current['commit']}.json")
+        with open(results_path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults saved to {results_path}")
+
+    previous_path = args.compare or latest_results(exclude=results_path)
+    if previous_path:
+        compare(current, previous_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+GL_NAMESPACE = "urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0"
+
+RESOLUTION_MINUTES = {"PT15M": 15, "PT30M": 30, "PT60M": 60}
+
+
+def synthetic_document(n_series=1, days=365, resolution="PT60M", start="2020-01-01T00:00",
+                       document_type="A65", namespace=GL_NAMESPACE, value_tag="quantity", seed=0):
+    """
+    Builds an ENTSO-E style XML document with n_series TimeSeries, each holding
+    one Period of `days` days at the given resolution. Returns bytes.
+    """
+    rng = np.random.default_rng(seed)
+    step = RESOLUTION_MINUTES[resolution]
+    n_points = days * 1440 // step
+    period_start = np.datetime64(start, "m")
+    period_end = period_start + np.timedelta64(n_points * step, "m")
+    interval = (f"<timeInterval><start>{period_start}Z</start>"
+                f"<end>{period_end}Z</end></timeInterval>")
+
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<GL_MarketDocument xmlns="{namespace}">',
+             f"<mRID>synthetic</mRID><type>{document_type}</type>"]
+    for series in range(n_series):
+        values = rng.normal(5000, 800, n_points).round(0)
+        points = "".join(
+            f"<Point><position>{i}</position><{value_tag}>{v:.0f}</{value_tag}></Point>"
+            for i, v in enumerate(values, start=1)
+        )
+        parts.append(f"<TimeSeries><mRID>{series + 1}</mRID><Period>{interval}"
+                     f"<resolution>{resolution}</resolution>{points}</Period></TimeSeries>")
+    parts.append("</GL_MarketDocument>")
+    return "".join(parts).encode("utf-8")
+
+
+SOURCE_COLUMNS = {"actual_load": "load_value", "generation_forecast": "generation_forecast",
+                  "energy_price": "energy_price"}
+
+
+def synthetic_sources(n_countries=3, years=1, resolution="PT60M", start="2020-01-01", seed=0):
+    """
+    Load, generation and price frames shaped like the fetchers' outputs, for
+    n_countries countries over `years` years at the given resolution, with a
+    daily cycle and noise. Returns (df_load, df_generation, df_price).
+    """
+    rng = np.random.default_rng(seed)
+    step = RESOLUTION_MINUTES[resolution]
+    timestamps = pd.date_range(start, periods=int(years * 365 * 1440 // step), freq=f"{step}min")
+    countries = [f"Country{i:03d}" for i in range(n_countries)]
+    n = len(timestamps)
+    daily = np.sin(2 * np.pi * (timestamps.hour.to_numpy() + timestamps.minute.to_numpy() / 60) / 24)
+
+    base = np.repeat(rng.uniform(2000, 60000, n_countries), n)
+    load = base * (1 + 0.15 * np.tile(daily, n_countries)) + rng.normal(0, 0.02, n * n_countries) * base
+    values = {
+        "actual_load": load,
+        "generation_forecast": load * rng.normal(1.0, 0.05, len(load)),
+        "energy_price": 80 + 30 * np.tile(daily, n_countries) + rng.normal(0, 15, len(load)),
+    }
+    all_timestamps = np.tile(timestamps, n_countries)
+    frames = []
+    for data_type, column in SOURCE_COLUMNS.items():
+        frames.append(pd.DataFrame({
+            "timestamp": all_timestamps,
+            column: values[data_type].round(2),
+            "day_of_week": np.tile(timestamps.dayofweek, n_countries),
+            "country": np.repeat(countries, n),
+            "data_type": data_type,
+        }))
+    return tuple(frames)
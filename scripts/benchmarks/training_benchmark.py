@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.benchmarks.suite import START, scale_shape
+from scripts.benchmarks.synthetic import synthetic_sources
+
+MODES = ["onehot", "native"]
+
+
+def write_training_rows(path, n_countries, years, resolution):
+    """
+    Training and validation rows of the synthetic merged frame, split as the
+    pipeline splits it, pickled for the per-mode subprocesses.
+    """
+    from scripts.common.storage import MERGED_LAYOUT
+    from scripts.data_splitting.train_test_split import split_dataset
+    from scripts.merged_data.merge_data import merge_frames
+    from scripts.model.xgboost_model import training_rows
+
+    sources = synthetic_sources(n_countries=n_countries, years=years, resolution=resolution, start=START)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        merged = merge_frames(*sources)
+    frame = merged.wide if MERGED_LAYOUT == "wide" else merged.long
+    splits = split_dataset(frame)
+    df_train, df_val = training_rows(splits.train), training_rows(splits.validation)
+    pd.to_pickle((df_train, df_val), path)
+    return len(df_train), len(df_val)
+
+
+def run_mode(mode, data_path, result_path):
+    """
+    Trains one mode on the pickled rows; called in a fresh subprocess per
+    mode so that its peak RSS is its own.
+    """
+    from scripts.common import instrumentation
+    from scripts.model.xgboost_model import train_model
+
+    # Imported up front for both modes, so only training is timed.
+    import sklearn.preprocessing
+    import xgboost
+
+    df_train, df_val = pd.read_pickle(data_path)
+    data_rss = instrumentation.peak_rss_mb()
+    with instrumentation.stage(f"train-{mode}") as metrics:
+        result = train_model(df_train, df_val, mode)
+    report = metrics.report()
+    trees = result.model.num_boosted_rounds() if mode == "native" else result.model.get_booster().num_boosted_rounds()
+    with open(result_path, "w") as f:
+        json.dump({"wall_s": report["wall_s"], "cpu_s": report["cpu_s"], "peak_rss_mb": report["peak_rss_mb"],
+                   "training_rss_mb": round(report["peak_rss_mb"] - data_rss, 1), "rmse": round(result.rmse, 3),
+                   "trees": trees}, f)
+
+
+def country_scaling(data_path, worker_counts):
+    """
+    Wall time of the per-country training at each pool size, in this process.
+    """
+    import xgboost  # noqa: F401 (imported before timing, as in run_mode)
+    from scripts.model.xgboost_model import train_countries
+
+    df_train, df_val = pd.read_pickle(data_path)
+    results = []
+    for workers in worker_counts:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            models = train_countries(df_train, df_val, workers)
+            wall = time.perf_counter() - start
+        results.append({"workers": workers, "models": len(models), "wall_s": round(wall, 3),
+                        "model_s": round(sum(seconds for _, seconds in models.values()), 3)})
+        print(f"  {workers:>3} worker(s) {wall:>8.2f}s")
+    df = pd.DataFrame(results)
+    df["speedup"] = (df["wall_s"].iloc[0] / df["wall_s"]).round(2)
+    return df
+
+
+def measure(mode, data_path, work_dir, verbose):
+    result_path = os.path.join(work_dir, f"{mode}.json")
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--data", data_path,
+                    "--result", result_path], check=True, stdout=None if verbose else subprocess.DEVNULL)
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Training time, peak memory and validation RMSE of the one-hot and native XGBoost paths, "
+                    "on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--countries", type=int, default=3, help="countries at scale 1")
+    parser.add_argument("--years", type=float, default=1, help="years of history at scale 1")
+    parser.add_argument("--resolution", default="PT60M", choices=["PT15M", "PT30M", "PT60M"])
+    parser.add_argument("--verbose", action="store_true", help="show the training output")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="also time per-country training (TRAIN_SCOPE=country) at these pool sizes, "
+                             "at the largest scale")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.data, args.result)
+        return
+
+    results = []
+    for scale in args.scales:
+        n_countries, years = scale_shape(scale, args.countries, args.years)
+        with tempfile.TemporaryDirectory() as work_dir:
+            data_path = os.path.join(work_dir, "training_rows.pkl")
+            train_rows, val_rows = write_training_rows(data_path, n_countries, years, args.resolution)
+            print(f"Scale {scale}x: {n_countries} countries x {years:g} years, "
+                  f"{train_rows} training / {val_rows} validation rows")
+            for mode in MODES:
+                report = measure(mode, data_path, work_dir, args.verbose)
+                results.append({"scale": scale, "mode": mode, **report})
+                print(f"  {mode:<8}{report['wall_s']:>8.2f}s {report['training_rss_mb']:>8} MB  "
+                      f"RMSE {report['rmse']:.2f} ({report['trees']} trees)")
+            if args.workers and scale == max(args.scales):
+                print(f"Per-country training on {os.cpu_count()} core(s):")
+                scaling = country_scaling(data_path, args.workers)
+
+    print()
+    print("training_rss_mb is the peak RSS added by training, on top of the loaded rows.")
+    print(pd.DataFrame(results).to_string(index=False))
+    if args.workers:
+        print()
+        print(scaling.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
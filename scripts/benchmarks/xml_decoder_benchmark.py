@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.benchmarks.synthetic import synthetic_document
+from scripts.load.actual_total_load import parse_and_format_data
+
+
+def legacy_parse(xml_data, country_name, timezone_offset):
+    """
+    The ET.fromstring / per-Point strptime parser the load fetcher used before
+    the streaming decoder, kept as the benchmark baseline.
+    """
+    current_time = datetime.now()
+    root = ET.fromstring(xml_data)
+    ns = {'ns': 'urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0'}
+    formatted_data = []
+    for ts in root.findall('.//ns:TimeSeries', ns):
+        time_period = ts.find('.//ns:Period', ns)
+        if time_period is None:
+            continue
+        period_start_el = time_period.find('.//ns:timeInterval/ns:start', ns)
+        if period_start_el is None:
+            continue
+        period_start = period_start_el.text
+        for point in time_period.findall('.//ns:Point', ns):
+            pos_el = point.find('.//ns:position', ns)
+            quantity_el = point.find('.//ns:quantity', ns)
+            if pos_el is None or quantity_el is None:
+                continue
+            position = int(pos_el.text)
+            timestamp_utc = datetime.strptime(period_start, "%Y-%m-%dT%H:%MZ") + timedelta(hours=position - 1)
+            timestamp_local = timestamp_utc + timedelta(hours=timezone_offset)
+            if timestamp_local > current_time:
+                continue
+            formatted_data.append({
+                'timestamp': timestamp_local,
+                'load_value': quantity_el.text,
+                'day_of_week': timestamp_local.weekday(),
+                'country': country_name,
+                'data_type': 'actual_load'
+            })
+    return pd.DataFrame(formatted_data).sort_values(by='timestamp').reset_index(drop=True)
+
+
+def measure(parse, xml_data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = parse(xml_data, "Synthetic", 1)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    parse(xml_data, "Synthetic", 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(df), best, peak
+
+
+def count_points(xml_data):
+    return xml_data.count(b"<Point>")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the streaming XML decoder with the legacy parser.")
+    parser.add_argument("--series", type=int, default=10, help="TimeSeries elements in the document")
+    parser.add_argument("--days", type=int, default=365, help="days per TimeSeries (hourly points)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    xml_data = synthetic_document(n_series=args.series, days=args.days)
+    print(f"Synthetic document: {args.series} series x {args.days} days, {len(xml_data) / 1e6:.1f} MB")
+
+    # Throughput is counted in input points: the streaming parser also rolls
+    # overlapping series up to one row per hour, so its output is smaller.
+    n_points = count_points(xml_data)
+    results = []
+    for name, parse in [("legacy", legacy_parse), ("streaming", parse_and_format_data)]:
+        rows, seconds, peak = measure(parse, xml_data, args.repeat)
+        results.append({"parser": name, "rows_out": rows, "seconds": round(seconds, 3),
+                        "points_per_second": int(n_points / seconds), "peak_mb": round(peak / 1e6, 1)})
+    report = pd.DataFrame(results)
+    print(report.to_string(index=False))
+    print(f"Speed-up: {results[0]['seconds'] / results[1]['seconds']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common.schema import TIMEZONE, apply_schema
+from scripts.common.storage import is_dataset
+
+# Per base directory, next to the other pipeline state.
+CATALOG_NAME = os.path.join("data", "state", "catalog.sqlite")
+
+# Where each kind of dataset lives, for indexing files written before the catalog existed.
+KIND_LOCATIONS = {
+    "load": (os.path.join("data", "load"), "all_countries_"),
+    "generation": (os.path.join("data", "generation"), "all_countries_"),
+    "price": (os.path.join("data", "price"), "all_countries_"),
+    "merged_long": (os.path.join("data", "merged_data"), "merged_dataset_"),
+    "merged_wide": (os.path.join("data", "merged_wide"), "merged_wide_"),
+    "processed": (os.path.join("data", "processed_data"), "processed_dataset_"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    rows INTEGER,
+    start_ts TEXT,
+    end_ts TEXT,
+    schema_hash TEXT,
+    columns TEXT,
+    bytes INTEGER,
+    run_id TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS datasets_latest ON datasets (kind, created_at);
+CREATE INDEX IF NOT EXISTS datasets_range ON datasets (kind, start_ts, end_ts);
+"""
+
+
+def catalog_path(base_dir):
+    return os.path.join(base_dir, CATALOG_NAME)
+
+
+def connect(base_dir):
+    path = catalog_path(base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The fetchers register their outputs concurrently.
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def utc_text(value):
+    """
+    A timestamp as sortable UTC text; naive values are stored wall-clock time.
+    """
+    if value is None or pd.isna(value):
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(TIMEZONE)
+    return timestamp.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def schema_of(df):
+    """
+    Columns and dtypes as consumers see them (after the shared schema), and their hash.
+    """
+    columns = [[column, str(dtype)] for column, dtype in apply_schema(df.iloc[:0]).dtypes.items()]
+    encoded = json.dumps(columns)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16], encoded
+
+
+def relative(base_dir, path):
+    return os.path.relpath(os.path.abspath(path), base_dir)
+
+
+def register(base_dir, kind, path, df=None, rows=None, start=None, end=None, schema=None):
+    """
+    Records a stage output. Row count, time range and schema come from df
+    when it is the written frame; otherwise from rows/start/end and the
+    (possibly empty) `schema` frame. Rewriting a path replaces its entry.
+    """
+    if df is not None:
+        rows = len(df)
+        schema = df
+        if "timestamp" in df.columns and len(df):
+            start, end = df["timestamp"].min(), df["timestamp"].max()
+    schema_hash, columns = schema_of(schema) if schema is not None else (None, None)
+    size = None
+    if os.path.exists(path):
+        size = os.path.getsize(path) if os.path.isfile(path) else sum(
+            os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    connection = connect(base_dir)
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (relative(base_dir, path), kind, rows, utc_text(start), utc_text(end), schema_hash, columns, size,
+             # Set by main.py for every stage of a run.
+             os.getenv("PIPELINE_RUN_ID"), datetime.now().isoformat(timespec="microseconds")))
+    connection.close()
+    return path
+
+
+def index_existing(base_dir, kind):
+    """
+    Registers the files of a kind found on disk without an entry (written
+    before the catalog, or by hand), with their modification time as age.
+    Only metadata is recorded; the data is not read.
+    """
+    directory, prefix = KIND_LOCATIONS[kind]
+    directory = os.path.join(base_dir, directory)
+    if not os.path.isdir(directory):
+        return 0
+    names = [f for f in os.listdir(directory) if f.startswith(prefix) and is_dataset(f)]
+    added = 0
+    connection = connect(base_dir)
+    with connection:
+        for name in names:
+            path = os.path.join(directory, name)
+            created_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="microseconds")
+            added += connection.execute("INSERT OR IGNORE INTO datasets (path, kind, bytes, created_at) VALUES (?, ?, ?, ?)",
+                               (relative(base_dir, path), kind, os.path.getsize(path), created_at)).rowcount
+    connection.close()
+    if added:
+        print(f"Catalog: indexed {added} existing {kind} file(s) from {directory}")
+    return added
+
+
+def find(base_dir, kind, start=None, end=None):
+    """
+    Path of the newest `kind` dataset, or of the newest one whose time range
+    covers [start, end] when given; None when there is none. Entries whose
+    files are gone are dropped on the way. When there is no entry at all,
+    the files already on disk are indexed first.
+    """
+    query = "SELECT path FROM datasets WHERE kind = ?"
+    parameters = [kind]
+    if start is not None:
+        query += " AND start_ts <= ?"
+        parameters.append(utc_text(start))
+    if end is not None:
+        query += " AND end_ts >= ?"
+        parameters.append(utc_text(end))
+    query += " ORDER BY created_at DESC, path DESC"
+
+    for attempt in range(2):
+        connection = connect(base_dir)
+        with connection:
+            found = None
+            for row in connection.execute(query, parameters).fetchall():
+                if os.path.exists(os.path.join(base_dir, row["path"])):
+                    found = os.path.join(base_dir, row["path"])
+                    break
+                connection.execute("DELETE FROM datasets WHERE path = ?", (row["path"],))
+        connection.close()
+        # Indexed files have no time range, so they cannot answer a range query.
+        if found or attempt or start is not None or end is not None or kind not in KIND_LOCATIONS \
+                or not index_existing(base_dir, kind):
+            return found
+    return None
+
+
+def latest(base_dir, kind):
+    return find(base_dir, kind)
+
+
+def covering(base_dir, kind, start, end):
+    return find(base_dir, kind, start, end)
+
+
+def merged_kind(layout):
+    return f"merged_{layout}"
+
+
+def entry(base_dir, path):
+    """
+    The catalog row of one dataset as a dict, or None when it is not registered.
+    """
+    connection = connect(base_dir)
+    with connection:
+        row = connection.execute("SELECT * FROM datasets WHERE path = ?", (relative(base_dir, path),)).fetchone()
+    connection.close()
+    return dict(row) if row is not None else None
+
+
+def entries(base_dir, kind=None):
+    connection = connect(base_dir)
+    with connection:
+        query = "SELECT * FROM datasets" + (" WHERE kind = ?" if kind else "") + " ORDER BY kind, created_at"
+        rows = [dict(row) for row in connection.execute(query, [kind] if kind else [])]
+    connection.close()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the datasets registered in the catalog.")
+    parser.add_argument("kind", nargs="?", help="only this kind of dataset")
+    parser.add_argument("--covering", nargs=2, metavar=("START", "END"),
+                        help="print the newest dataset of KIND whose time range covers START..END")
+    args = parser.parse_args()
+
+    if args.covering:
+        if not args.kind:
+            parser.error("--covering needs a kind")
+        start = time.perf_counter()
+        path = covering(base_dir, args.kind, *args.covering)
+        print(path or "No dataset covers that range.")
+        print(f"Lookup took {(time.perf_counter() - start) * 1e3:.1f} ms")
+        return
+    df = entries(base_dir, args.kind)
+    print(df.drop(columns=["columns"]).to_string(index=False) if not df.empty else "The catalog is empty.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set by main.py for each stage it runs as a subprocess: the stage's metrics
+# are written there as JSON when the process exits.
+METRICS_PATH = os.getenv("PIPELINE_METRICS_PATH")
+STAGE_NAME = os.getenv("PIPELINE_STAGE", os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0])
+# "cprofile" or "pyinstrument"; the profile is written next to the metrics file.
+PROFILER = os.getenv("PIPELINE_PROFILE")
+
+COUNTERS = ["rows_in", "rows_out", "bytes_read", "bytes_written", "http_requests", "cache_hits", "cache_misses"]
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, or None where it is not available.
+    """
+    # ru_maxrss survives exec, so a subprocess would report its parent's peak
+    # if that is higher; VmHWM belongs to this process image alone.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def reset_peak_rss():
+    """
+    Restarts the peak RSS from the current RSS, so a later peak is that of
+    the code run after the reset. Returns False where that is not possible
+    (outside Linux); peak_rss_mb() then keeps the peak of the whole process.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "total_s": round(sum(ordered), 4),
+        "mean_s": round(sum(ordered) / len(ordered), 4),
+        "p50_s": round(ordered[len(ordered) // 2], 4),
+        "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "max_s": round(ordered[-1], 4),
+    }
+
+
+class StageMetrics:
+    """
+    Wall time, CPU time, peak RSS and I/O counters of one stage. Counters are
+    updated from any thread; the fetchers call the API from a thread pool.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.http_latencies = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.wall_s = None
+        self.cpu_s = None
+        self.profile_path = None
+
+    def count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    def record_http(self, seconds):
+        with self.lock:
+            self.counters["http_requests"] += 1
+            self.http_latencies.append(seconds)
+
+    def finish(self):
+        self.wall_s = time.perf_counter() - self.started
+        self.cpu_s = time.process_time() - self.cpu_started
+        return self
+
+    def report(self):
+        if self.wall_s is None:
+            self.finish()
+        with self.lock:
+            return {
+                "stage": self.name,
+                "wall_s": round(self.wall_s, 3),
+                "cpu_s": round(self.cpu_s, 3),
+                # Process-wide peak: for in-process stages this is the peak up to the end of the stage.
+                "peak_rss_mb": None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+                **self.counters,
+                "http_latency": latency_summary(self.http_latencies),
+                "profile": self.profile_path,
+            }
+
+
+process_metrics = StageMetrics(STAGE_NAME)
+_active = [process_metrics]
+_active_lock = threading.Lock()
+
+
+def current():
+    with _active_lock:
+        return _active[-1]
+
+
+def count(**increments):
+    current().count(**increments)
+
+
+def record_http(seconds):
+    current().record_http(seconds)
+
+
+def record_read(path, rows=0):
+    count(rows_in=rows, bytes_read=path_size(path) if os.path.exists(path) else 0)
+
+
+def record_written(path, rows=0):
+    count(rows_out=rows, bytes_written=path_size(path) if os.path.exists(path) else 0)
+
+
+class Profiler:
+    """
+    Thin wrapper over cProfile or pyinstrument (optional dependency) that
+    writes a .prof or .html file on stop.
+    """
+
+    def __init__(self, kind):
+        if kind not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler {kind!r}; use 'cprofile' or 'pyinstrument'.")
+        self.kind = kind
+        if kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as PyinstrumentProfiler
+            except ImportError:
+                raise ImportError("PIPELINE_PROFILE=pyinstrument needs pyinstrument: pip install pyinstrument")
+            self.profiler = PyinstrumentProfiler()
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def extension(self):
+        return ".html" if self.kind == "pyinstrument" else ".prof"
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self, path_without_extension):
+        path = path_without_extension + self.extension()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+            with open(path, "w") as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(path)
+        return path
+
+
+@contextmanager
+def stage(name, profile=None, profile_dir=None):
+    """
+    Collects metrics for the enclosed code as stage `name`, for stages run in
+    this process. Yields the StageMetrics; its report() is final on exit.
+    """
+    metrics = StageMetrics(name)
+    profiler = Profiler(profile) if profile else None
+    with _active_lock:
+        _active.append(metrics)
+    if profiler is not None:
+        profiler.start()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            metrics.profile_path = profiler.stop(os.path.join(profile_dir or ".", name))
+        metrics.finish()
+        with _active_lock:
+            _active.remove(metrics)
+
+
+def _write_process_metrics(profiler):
+    if profiler is not None:
+        process_metrics.profile_path = profiler.stop(os.path.splitext(METRICS_PATH)[0])
+    report = process_metrics.report()
+    os.makedirs(os.path.dirname(METRICS_PATH) or ".", exist_ok=True)
+    with open(METRICS_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if METRICS_PATH:
+    _process_profiler = Profiler(PROFILER) if PROFILER else None
+    if _process_profiler is not None:
+        _process_profiler.start()
+    atexit.register(_write_process_metrics, _process_profiler)
@@ -0,0 +1,25 @@
+import os
+
+# Plots are written to data/plots; SHOW_PLOTS=1 also opens each one in a window.
+SHOW_PLOTS = os.getenv("SHOW_PLOTS") == "1"
+
+
+def pyplot():
+    """
+    matplotlib.pyplot, imported on first use so stages that do not plot never
+    load it. The non-interactive Agg backend is forced unless SHOW_PLOTS=1.
+    """
+    import matplotlib
+    if not SHOW_PLOTS:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def done(plt):
+    """
+    Ends the current figure once saved: shown with SHOW_PLOTS=1, closed otherwise.
+    """
+    if SHOW_PLOTS:
+        plt.show()
+    plt.close()
@@ -0,0 +1,82 @@
+import pandas as pd
+
+# The fetchers shift UTC by a fixed +1 hour (timezone_offset = 1), so stored
+# timestamps are wall-clock times in a fixed UTC+01:00 zone without DST.
+# "Etc/GMT-1" is that zone (the sign is inverted in the tz database).
+TIMEZONE = "Etc/GMT-1"
+
+CATEGORY_COLUMNS = ["country", "measurement_type", "data_type", "zone"]
+INT_COLUMNS = {"hour": "int8", "day": "int8", "month": "int8", "day_of_week": "int8", "year": "int16"}
+FLOAT_COLUMNS = ["load_value", "generation_forecast", "energy_price", "measurement", "normalized_measurement"]
+
+# Value column of each measurement_type in the wide (country, timestamp) table.
+MEASUREMENT_COLUMNS = {"actual_load": "load_value", "generation_forecast": "generation_forecast",
+                       "energy_price": "energy_price"}
+
+
+def to_timestamps(values):
+    timestamps = pd.to_datetime(values, errors="coerce")
+    if getattr(timestamps.dt, "tz", None) is None:
+        return timestamps.dt.tz_localize(TIMEZONE)
+    return timestamps.dt.tz_convert(TIMEZONE)
+
+
+def apply_schema(df):
+    """
+    Casts the columns of any stage frame to the shared compact dtypes:
+    tz-aware timestamps, categorical labels, small integer calendar fields and
+    float32 measurements. Columns the frame does not have are ignored.
+    """
+    df = df.copy()
+    if "timestamp" in df.columns:
+        df["timestamp"] = to_timestamps(df["timestamp"])
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    for column, dtype in INT_COLUMNS.items():
+        # Rows without a value keep a nullable integer instead of falling back to float.
+        if column in df.columns:
+            df[column] = df[column].astype(dtype if df[column].notna().all() else dtype.capitalize())
+    for column in FLOAT_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32")
+    return df
+
+
+def measurement_rows(df, measurement_type):
+    """
+    Rows of one measurement_type with its value in "measurement", from either
+    the long merged table or the wide one.
+    """
+    if "measurement_type" in df.columns:
+        return df[df["measurement_type"] == measurement_type]
+    column = MEASUREMENT_COLUMNS[measurement_type]
+    df = df[df[column].notna()].copy()
+    df["measurement_type"] = pd.Categorical([measurement_type] * len(df))
+    df["measurement"] = df[column]
+    return df
+
+
+def bytes_per_row(df):
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
+
+
+def arrow_schema(columns):
+    """
+    Arrow schema for the given column names, matching apply_schema. Label
+    columns are stored as dictionary-encoded strings.
+    """
+    import pyarrow as pa
+    fields = []
+    for name in columns:
+        if name == "timestamp":
+            fields.append(pa.field(name, pa.timestamp("ns", tz=TIMEZONE)))
+        elif name in CATEGORY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif name in INT_COLUMNS:
+            fields.append(pa.field(name, getattr(pa, INT_COLUMNS[name])()))
+        elif name in FLOAT_COLUMNS:
+            fields.append(pa.field(name, pa.float32()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
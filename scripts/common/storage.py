@@ -0,0 +1,344 @@
+import os
+import gzip
+import itertools
+import pickle
+import shutil
+import hashlib
+import tempfile
+
+import pandas as pd
+
+from scripts.common import instrumentation
+from scripts.common.schema import TIMEZONE, apply_schema, arrow_schema, to_timestamps
+
+# "csv" keeps the gzip CSV hand-offs; "parquet" switches every stage to the
+# partitioned Parquet layout below. pyarrow is only needed for "parquet".
+STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "csv")
+PARTITION_COLUMNS = ["measurement_type", "country", "partition_month"]
+# "long" keeps one row per measurement; "wide" makes the split, training, EDA
+# and risk stages read the aligned (country, timestamp) table instead.
+MERGED_LAYOUT = os.getenv("MERGED_LAYOUT", "long")
+# Rows per chunk for the chunked (out-of-core) mode of the merge, cleaning and
+# risk stages; 0 keeps the in-memory path. The output is the same either way.
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "0"))
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("STORAGE_FORMAT=parquet needs pyarrow: pip install pyarrow")
+
+
+def dataset_extension(storage_format=STORAGE_FORMAT):
+    return ".parquet" if storage_format == "parquet" else ".csv.gz"
+
+
+def is_dataset(name):
+    return name.endswith(".csv.gz") or name.endswith(".parquet")
+
+
+def merged_location(base_dir, layout=MERGED_LAYOUT):
+    """
+    Directory and file prefix of the merged datasets for the given layout.
+    """
+    if layout == "wide":
+        return os.path.join(base_dir, "data", "merged_wide"), "merged_wide_"
+    return os.path.join(base_dir, "data", "merged_data"), "merged_dataset_"
+
+
+def write_partitioned(df, path, basename_template="part-{i}.parquet", replace=True):
+    """
+    Writes df as a hive-partitioned Parquet dataset under path
+    (measurement_type=.../country=.../partition_month=YYYY-MM/part-0.parquet).
+    With replace=False the files are added to an existing dataset; the
+    basename_template must then differ between calls.
+    """
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    df = apply_schema(df)
+    df["partition_month"] = df["timestamp"].dt.strftime("%Y-%m")
+    # Partition values live in directory names, so they are plain strings there.
+    for column in PARTITION_COLUMNS:
+        df[column] = df[column].astype(str)
+    schema = arrow_schema([c for c in df.columns if c not in PARTITION_COLUMNS])
+    schema = pa.schema(list(schema) + [pa.field(c, pa.string()) for c in PARTITION_COLUMNS])
+    table = pa.Table.from_pandas(df[list(schema.names)], schema=schema, preserve_index=False)
+    if replace and os.path.exists(path):
+        shutil.rmtree(path)
+    partitioning = ds.partitioning(pa.schema([schema.field(name) for name in PARTITION_COLUMNS]), flavor="hive")
+    ds.write_dataset(table, path, format="parquet", partitioning=partitioning, basename_template=basename_template,
+                     max_rows_per_group=1 << 20, existing_data_behavior="overwrite_or_ignore")
+
+
+def localize(value):
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize(TIMEZONE) if timestamp.tzinfo is None else timestamp.tz_convert(TIMEZONE)
+
+
+def month_range(start, end):
+    first, last = (localize(value).tz_localize(None).to_period("M") for value in (start, end))
+    return [str(m) for m in pd.period_range(first, last, freq="M")]
+
+
+def read_partitioned(path, columns=None, start=None, end=None, measurement_types=None, countries=None):
+    """
+    Reads a partitioned Parquet dataset. Column selection and the
+    measurement_type/country/date filters are pushed down, so partitions and
+    row groups outside the request are never read.
+    """
+    require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    expression = None
+
+    def add(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+
+    if measurement_types is not None:
+        add(ds.field("measurement_type").isin(list(measurement_types)))
+    if countries is not None:
+        add(ds.field("country").isin(list(countries)))
+    if start is not None or end is not None:
+        months = month_range(start or "1900-01-01", end or "2100-12-31")
+        add(ds.field("partition_month").isin(months))
+        if start is not None:
+            add(ds.field("timestamp") >= localize(start))
+        if end is not None:
+            add(ds.field("timestamp") <= localize(end))
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+    if "partition_month" in df.columns:
+        df = df.drop(columns="partition_month")
+    return df
+
+
+def read_dataset(path, columns=None, start=None, end=None, measurement_types=None, countries=None):
+    """
+    Reads a stage output in either format and returns it with the shared
+    schema applied. For CSV and single Parquet files the same filters are
+    applied after loading, so callers do not need to know which format is
+    in use.
+    """
+    df = _read_dataset(path, columns, start, end, measurement_types, countries)
+    instrumentation.record_read(path, len(df))
+    return df
+
+
+def _read_dataset(path, columns, start, end, measurement_types, countries):
+    if path.endswith(".parquet") and os.path.isdir(path):
+        return apply_schema(read_partitioned(path, columns, start, end, measurement_types, countries))
+
+    filter_columns = [c for c, wanted in [("timestamp", start is not None or end is not None),
+                                          ("measurement_type", measurement_types is not None),
+                                          ("country", countries is not None)] if wanted]
+    usecols = None if columns is None else list(dict.fromkeys(list(columns) + filter_columns))
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=usecols)
+    else:
+        df = pd.read_csv(path, compression="gzip", usecols=usecols)
+    if "timestamp" in df.columns:
+        df["timestamp"] = to_timestamps(df["timestamp"])
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df["timestamp"] >= localize(start)
+    if end is not None:
+        mask &= df["timestamp"] <= localize(end)
+    if measurement_types is not None:
+        mask &= df["measurement_type"].isin(list(measurement_types))
+    if countries is not None:
+        mask &= df["country"].isin(list(countries))
+    df = df[mask] if not mask.all() else df
+    df = df[list(columns)] if columns is not None else df
+    return apply_schema(df)
+
+
+def write_dataset(df, path_without_extension, partitioned=False, storage_format=STORAGE_FORMAT):
+    """
+    Writes a stage output in the configured format and returns the path used.
+    """
+    path = path_without_extension + dataset_extension(storage_format)
+    if storage_format == "parquet":
+        if partitioned:
+            write_partitioned(df, path)
+        else:
+            require_pyarrow()
+            df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, compression="gzip")
+    instrumentation.record_written(path, len(df))
+    return path
+
+
+def remove_dataset(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def iter_dataset(path, chunk_rows, columns=None):
+    """
+    Yields a stage output in file order, in chunks of at most chunk_rows rows
+    with the shared schema applied. Values are the same as read_dataset's.
+    """
+    if path.endswith(".parquet"):
+        require_pyarrow()
+        import pyarrow.dataset as ds
+        import pyarrow as pa
+        dataset = ds.dataset(path, format="parquet", partitioning="hive" if os.path.isdir(path) else None)
+        # A partitioned dataset yields at least one batch per file; small ones are
+        # combined so that chunks stay near chunk_rows.
+        batches, rows = [], 0
+        for batch in itertools.chain(dataset.to_batches(columns=columns, batch_size=chunk_rows), [None]):
+            if batch is not None:
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows < chunk_rows:
+                    continue
+            if not batches:
+                break
+            df = pa.Table.from_batches(batches).to_pandas()
+            batches, rows = [], 0
+            if "partition_month" in df.columns:
+                df = df.drop(columns="partition_month")
+            instrumentation.count(rows_in=len(df))
+            yield apply_schema(df)
+    else:
+        for df in pd.read_csv(path, compression="gzip", usecols=columns, chunksize=chunk_rows):
+            if "timestamp" in df.columns:
+                df["timestamp"] = to_timestamps(df["timestamp"])
+            instrumentation.count(rows_in=len(df))
+            yield apply_schema(df)
+    instrumentation.count(bytes_read=instrumentation.path_size(path))
+
+
+class DatasetWriter:
+    """
+    Writes a stage output chunk by chunk in the layout write_dataset would use
+    for the whole frame, so large outputs are never held in memory. CSV goes
+    to a single gzip stream; Parquet gets one file (or partition file) per chunk.
+    """
+
+    def __init__(self, path_without_extension, partitioned=False, storage_format=STORAGE_FORMAT):
+        self.base = path_without_extension
+        self.path = path_without_extension + dataset_extension(storage_format)
+        self.partitioned = partitioned
+        self.storage_format = storage_format
+        self.rows = 0
+        self.parts = 0
+        self.columns = None
+        # Empty frame with the output's columns, and its time range, for the catalog.
+        self.schema = None
+        self.start = None
+        self.end = None
+        self.file = None
+        self.parquet_writer = None
+        remove_dataset(self.path)
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            self.schema = df.iloc[:0]
+        if df.empty:
+            return
+        if "timestamp" in df.columns and df["timestamp"].notna().any():
+            first, last = df["timestamp"].min(), df["timestamp"].max()
+            self.start = first if self.start is None else min(self.start, first)
+            self.end = last if self.end is None else max(self.end, last)
+        if self.storage_format == "parquet":
+            self._write_parquet(df)
+        else:
+            if self.file is None:
+                self.file = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+            df.to_csv(self.file, index=False, header=self.rows == 0)
+        self.rows += len(df)
+        self.parts += 1
+
+    def _write_parquet(self, df):
+        require_pyarrow()
+        if self.partitioned:
+            write_partitioned(df, self.path, basename_template=f"part-{self.parts}-{{i}}.parquet", replace=False)
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        df = apply_schema(df)
+        schema = arrow_schema(df.columns)
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(self.path, schema)
+        self.parquet_writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+
+    def close(self):
+        """
+        Finishes the output and returns its path. An output without rows is
+        written like write_dataset writes an empty frame.
+        """
+        if self.rows == 0:
+            return write_dataset(pd.DataFrame(columns=self.columns or []), self.base,
+                                 storage_format=self.storage_format)
+        if self.file is not None:
+            self.file.close()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        instrumentation.record_written(self.path, self.rows)
+        return self.path
+
+
+class Spool:
+    """
+    Temporary on-disk partitions for the chunked stages: chunks are appended
+    to the partition of their key in arrival order and read back one
+    partition at a time, so memory is bounded by the largest partition.
+    """
+
+    def __init__(self, directory=None):
+        self.tmp = tempfile.TemporaryDirectory(dir=directory, prefix="spool_")
+        self.keys = []
+        self.templates = {}
+
+    def _path(self, key):
+        return os.path.join(self.tmp.name, hashlib.sha1(repr(key).encode()).hexdigest() + ".pkl")
+
+    def append(self, key, df):
+        if key not in self.templates:
+            self.keys.append(key)
+            self.templates[key] = df.iloc[:0]
+        if df.empty:
+            return
+        with open(self._path(key), "ab") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def append_groups(self, df, by):
+        """
+        Appends the rows of df to the partition of their value of `by` (a
+        column name or an aligned Series), keeping their order.
+        """
+        for key, part in df.groupby(by, sort=False, observed=True, dropna=False):
+            self.append(key, part)
+
+    def read(self, key):
+        frames = []
+        path = self._path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                while True:
+                    try:
+                        frames.append(pickle.load(f))
+                    except EOFError:
+                        break
+        if not frames:
+            return self.templates.get(key, pd.DataFrame())
+        return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+    def close(self):
+        self.tmp.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
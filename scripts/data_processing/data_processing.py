@@ -1,4 +1,7 @@
 import os
+import sys
+import argparse
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
@@ -6,45 +9,160 @@ from dotenv import load_dotenv
 load_dotenv()
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-merged_file = os.path.join(base_dir, "data", "merged_data", "merged_dataset_20250206.csv.gz")
-processed_dir = os.path.join(base_dir, "data", "processed_data")
-os.makedirs(processed_dir, exist_ok=True)
-processed_file = os.path.join(processed_dir, "processed_dataset_20250206.csv.gz")
+from scripts.common import catalog, instrumentation
+from scripts.common.storage import CHUNK_ROWS, DatasetWriter, Spool, iter_dataset, read_dataset, write_dataset
 
-try:
-    df = pd.read_csv(merged_file, compression="gzip")
-except Exception as e:
-    print(f"Error loading the merged dataset: {e}")
-    exit(1)
+# Fitted per-group bounds and scaling, for inference to clean new rows the same way.
+PARAMS_PATH = os.path.join(base_dir, "models", "cleaning_params.csv")
 
+GROUP_KEYS = ["country", "measurement_type"]
+INPUT_COLUMNS = ["timestamp", "country", "measurement_type", "measurement"]
 
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+def latest_merged(base_dir):
+    # Cleaning works on the long table, whichever layout the other stages read.
+    merged_file = catalog.latest(base_dir, catalog.merged_kind("long"))
+    if merged_file is None:
+        print("Error: No merged dataset found in the catalog.")
+        sys.exit(1)
+    return merged_file
 
-df = df.dropna(subset=['timestamp', 'measurement'])
+def valid_rows(df):
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    return df.dropna(subset=['timestamp', 'measurement'] + GROUP_KEYS)
 
-# Outlier Removal
-def remove_outliers(group):
-    Q1 = group['measurement'].quantile(0.25)
-    Q3 = group['measurement'].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return group[(group['measurement'] >= lower_bound) & (group['measurement'] <= upper_bound)]
+def group_keys(df):
+    # Plain strings, so keys compare equal across chunks whose categories differ.
+    return [df[key].astype(str) for key in GROUP_KEYS]
 
-df = df.groupby('measurement_type').apply(remove_outliers).reset_index(drop=True)
+def param_positions(df, params):
+    """
+    Row of params for each row of df, -1 where the group was not fitted.
+    """
+    index = pd.MultiIndex.from_frame(params[GROUP_KEYS].astype(str))
+    return index.get_indexer(pd.MultiIndex.from_arrays(group_keys(df)))
 
-# Normalization:
-def normalize(group):
-    min_val = group['measurement'].min()
-    max_val = group['measurement'].max()
-    if max_val != min_val:
-        group['normalized_measurement'] = (group['measurement'] - min_val) / (max_val - min_val)
-    else:
-        group['normalized_measurement'] = 0.0
-    return group
+def fit_params(df):
+    """
+    Per (country, measurement_type): the quartiles and 1.5 x IQR bounds of
+    the measurements, then the min and max of the rows within the bounds.
+    One groupby per statistic, sorted by the keys.
+    """
+    keys = group_keys(df)
+    grouped = df['measurement'].groupby(keys, sort=True)
+    params = grouped.quantile([0.25, 0.75]).unstack()
+    params.columns = ['q1', 'q3']
+    params['iqr'] = params['q3'] - params['q1']
+    params['lower_bound'] = params['q1'] - 1.5 * params['iqr']
+    params['upper_bound'] = params['q3'] + 1.5 * params['iqr']
+    params['rows'] = grouped.size()
+
+    positions = params.index.get_indexer(pd.MultiIndex.from_arrays(keys))
+    values = df['measurement'].to_numpy()
+    inliers = (values >= params['lower_bound'].to_numpy()[positions]) & \
+              (values <= params['upper_bound'].to_numpy()[positions])
+    kept = df['measurement'][inliers].groupby([key[inliers] for key in keys], sort=True)
+    params['min'] = kept.min()
+    params['max'] = kept.max()
+    params['inliers'] = kept.size().reindex(params.index, fill_value=0)
+    return params.reset_index()
+
+def clean(df, params):
+    """
+    Drops the outliers of df and adds normalized_measurement, using fitted
+    params. Rows keep their order; rows of groups without params are dropped.
+    """
+    positions = param_positions(df, params)
+    values = df['measurement'].to_numpy()
+    fitted = {column: params[column].to_numpy()[positions] for column in ['lower_bound', 'upper_bound', 'min', 'max']}
+    keep = (positions >= 0) & (values >= fitted['lower_bound']) & (values <= fitted['upper_bound'])
+
+    df = df[keep].copy()
+    values, low, high = values[keep], fitted['min'][keep], fitted['max'][keep]
+    span = high - low
+    # Constant groups normalize to 0.
+    df['normalized_measurement'] = np.where(span != 0, (values - low) / np.where(span != 0, span, 1), 0.0)
+    return df
+
+def process_frame(df):
+    """
+    Fits the cleaning params on df and applies them. Returns (cleaned, params).
+    """
+    df = valid_rows(df)
+    params = fit_params(df)
+    return clean(df, params), params
+
+def process_chunked(input_path, output_base, chunk_rows, base_dir=base_dir):
+    """
+    Same output as process_frame with bounded memory, in two streaming
+    passes: the first spools the measurements by group and fits each group
+    on its own, the second cleans the input chunk by chunk with the params.
+    Returns (output path, params).
+    """
+    with Spool() as spool:
+        for chunk in iter_dataset(input_path, chunk_rows, columns=INPUT_COLUMNS):
+            rows = valid_rows(chunk)
+            spool.append_groups(rows[GROUP_KEYS + ['measurement']], group_keys(rows))
+        params = [fit_params(spool.read(key)) for key in spool.keys]
+    params = pd.concat(params).sort_values(GROUP_KEYS, kind='stable').reset_index(drop=True) if params \
+        else fit_params(pd.DataFrame({'country': [], 'measurement_type': [], 'measurement': np.array([], 'float32')}))
+
+    writer = DatasetWriter(output_base)
+    for chunk in iter_dataset(input_path, chunk_rows):
+        writer.write(clean(valid_rows(chunk), params))
+    processed_file = writer.close()
+    catalog.register(base_dir, "processed", processed_file, rows=writer.rows,
+                     start=writer.start, end=writer.end, schema=writer.schema)
+    return processed_file, params
 
-df = df.groupby('measurement_type').apply(normalize).reset_index(drop=True)
+def save_params(params, path=PARAMS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    params.to_csv(path, index=False)
+    instrumentation.record_written(path, len(params))
+    print(f"Cleaning parameters for {len(params)} groups saved to {path}")
+    return path
+
+def load_params(path=PARAMS_PATH):
+    return pd.read_csv(path, dtype={key: str for key in GROUP_KEYS})
+
+def output_base(base_dir):
+    directory = os.path.join(base_dir, "data", "processed_data")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"processed_dataset_{datetime.now().strftime('%Y%m%d')}")
+
+def process_stage(merged_df, base_dir):
+    """
+    Cleans a long merged frame, writes the processed dataset and the params.
+    """
+    processed, params = process_frame(merged_df)
+    processed_file = write_dataset(processed, output_base(base_dir))
+    catalog.register(base_dir, "processed", processed_file, processed)
+    print(f"Processed dataset saved to {processed_file}")
+    save_params(params, os.path.join(base_dir, "models", os.path.basename(PARAMS_PATH)))
+    return processed, params
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove outliers from the latest merged dataset and normalize it "
+                                                 "per (country, measurement_type).")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="stream the input in chunks of this many rows, one group in memory at a time (0: in memory)")
+    args = parser.parse_args()
+    merged_file = latest_merged(base_dir)
+    print(f"Processing {merged_file}")
+
+    if args.chunk_rows:
+        processed_file, params = process_chunked(merged_file, output_base(base_dir), args.chunk_rows)
+        print(f"Processed dataset saved to {processed_file}")
+        save_params(params)
+    else:
+        try:
+            df = read_dataset(merged_file)
+        except Exception as e:
+            print(f"Error loading the merged dataset: {e}")
+            exit(1)
+        process_stage(df, base_dir)
 
-df.to_csv(processed_file, index=False, compression="gzip")
-print(f"Processed dataset saved to {processed_file}")
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,216 @@
 import os
+import sys
+import json
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from sklearn.model_selection import train_test_split
 from dotenv import load_dotenv
 
-def get_single_file(directory):
-    try:
-        files = [f for f in os.listdir(directory) if f.endswith(".csv.gz")]
-        if files:
-            files.sort()  # sort alphabetically
-            return os.path.join(directory, files[0])
-        else:
-            return None
-    except Exception as e:
-        print(f"Error listing files in {directory}: {e}")
-        return None
-
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-merged_dir = os.path.join(base_dir, "data", "merged_data")
-merged_file = get_single_file(merged_dir)
+from scripts.common import catalog, instrumentation
+from scripts.common.schema import TIMEZONE
+from scripts.common.storage import MERGED_LAYOUT, read_dataset
 
-if merged_file is None:
-    print(f"Error: No merged dataset file found in {merged_dir}")
-    exit(1)
-else:
-    print(f"Using merged dataset file: {merged_file}")
+load_dotenv()
 
-try:
-    merged_df = pd.read_csv(merged_file, compression="gzip")
-except Exception as e:
-    print(f"Error loading the merged dataset: {e}")
-    exit(1)
+splits_dir = os.path.join(base_dir, "data", "data_splitting")
+MANIFEST_NAME = "split_manifest.json"
+# "chronological" splits by time (no future rows in training); "random" is the
+# former stratified shuffle, kept for comparison.
+SPLIT_MODE = os.getenv("SPLIT_MODE", "chronological")
+# Expanding-window folds over the train + validation period, for model selection.
+ROLLING_FOLDS = int(os.getenv("ROLLING_FOLDS", "3"))
+SPLIT_FRACTIONS = {"train": 0.6, "validation": 0.2, "test": 0.2}
 
-merged_df['timestamp'] = pd.to_datetime(merged_df['timestamp'], errors='coerce')
 
-if merged_df['measurement_type'].isnull().any():
-    print("Warning: Dropping rows with missing 'measurement_type' values for stratification.")
-    merged_df = merged_df.dropna(subset=['measurement_type'])
+class Splits(NamedTuple):
+    train: object
+    validation: object
+    test: object
 
-# Split test set
-train_val_df, test_df = train_test_split(
-    merged_df,
-    test_size=0.20,
-    random_state=42,
-    stratify=merged_df['measurement_type']
-)
 
-# Further split the remaining 80% into training and validation sets
-train_df, val_df = train_test_split(
-    train_val_df,
-    test_size=0.25,  
-    random_state=42,
-    stratify=train_val_df['measurement_type']
-)
+def stratify_column_for(merged_df: pd.DataFrame) -> str:
+    # The wide table has one row per (country, timestamp), so it is stratified by country.
+    return 'measurement_type' if 'measurement_type' in merged_df.columns else 'country'
 
+def random_positions(merged_df: pd.DataFrame) -> Splits:
+    """
+    Row positions of the 60/20/20 stratified train/validation/test split.
+    """
+    # scikit-learn (and scipy under it) is only needed for random splits.
+    from sklearn.model_selection import train_test_split
 
-print("Shape of training set:", train_df.shape)
-print("Shape of validation set:", val_df.shape)
-print("Shape of test set:", test_df.shape)
+    stratify_column = stratify_column_for(merged_df)
+    labels = merged_df[stratify_column]
+    positions = np.arange(len(merged_df))
+    if labels.isnull().any():
+        print(f"Warning: Dropping rows with missing '{stratify_column}' values for stratification.")
+        positions = positions[labels.notna().to_numpy()]
 
-splits_dir = os.path.join(base_dir, "data", "data_splitting")
-os.makedirs(splits_dir, exist_ok=True)
+    # Split test set
+    train_val, test = train_test_split(
+        positions,
+        test_size=0.20,
+        random_state=42,
+        stratify=labels.iloc[positions]
+    )
+
+    # Further split the remaining 80% into training and validation sets
+    train, val = train_test_split(
+        train_val,
+        test_size=0.25,
+        random_state=42,
+        stratify=labels.iloc[train_val]
+    )
+    return Splits(train, val, test)
+
+def cut_points(timestamps: np.ndarray, fractions) -> list:
+    """
+    Timestamps at which the sorted rows reach each cumulative fraction. Rows
+    of one timestamp always fall on the same side of a cut.
+    """
+    ordered = np.sort(timestamps)
+    return [ordered[min(int(len(ordered) * f), len(ordered) - 1)] for f in np.cumsum(fractions)[:-1]]
+
+def iso(value) -> str:
+    return pd.Timestamp(value, tz="UTC").tz_convert(TIMEZONE).isoformat()
+
+def chronological_manifest(timestamps: pd.Series, n_folds: int = ROLLING_FOLDS) -> dict:
+    """
+    Time boundaries [start, end) of the train/validation/test periods, cut at
+    60/20/20 of the rows, plus expanding-window folds over train + validation:
+    fold k trains on everything before its origin and validates on the block
+    after it.
+    """
+    values = timestamps.dropna().dt.tz_convert("UTC").dt.tz_localize(None).to_numpy().view("int64")
+    if not len(values):
+        print("Error: No rows with a timestamp to split.")
+        sys.exit(1)
+    # The last period ends just after the last row.
+    first, last = values.min(), values.max() + pd.Timedelta(seconds=1).value
+    train_end, validation_end = cut_points(values, list(SPLIT_FRACTIONS.values()))
+    bounds = [first, train_end, validation_end, last]
+    periods = {name: [iso(bounds[i]), iso(bounds[i + 1])] for i, name in enumerate(SPLIT_FRACTIONS)}
+
+    history = values[values < validation_end]
+    origins = cut_points(history, [1 / (n_folds + 1)] * (n_folds + 1)) + [validation_end] if n_folds else []
+    folds = [{"train": [iso(first), iso(origins[k])], "validation": [iso(origins[k]), iso(origins[k + 1])]}
+             for k in range(len(origins) - 1)]
+    return {"periods": periods, "folds": folds}
+
+def split_manifest(merged_df: pd.DataFrame, dataset_path: str = None, mode: str = SPLIT_MODE) -> dict:
+    """
+    Split description over one merged dataset: time boundaries in
+    chronological mode, row positions (kept in memory under "positions",
+    saved as .npy) in random mode. No rows are copied.
+    """
+    manifest = {
+        "mode": mode,
+        "dataset": os.path.relpath(dataset_path, base_dir) if dataset_path else None,
+        "rows": len(merged_df),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    if mode == "chronological":
+        manifest.update(chronological_manifest(merged_df['timestamp']))
+    elif mode == "random":
+        manifest["positions"] = random_positions(merged_df)
+    else:
+        print(f"Error: Unknown SPLIT_MODE {mode!r}; use 'chronological' or 'random'.")
+        sys.exit(1)
+    return manifest
+
+def period_rows(timestamps: pd.Series, start: str, end: str):
+    """
+    Rows of [start, end): a slice when the timestamps are sorted, so the
+    split is a view of the frame; positions otherwise.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if timestamps.is_monotonic_increasing:
+        return slice(timestamps.searchsorted(start, side="left"), timestamps.searchsorted(end, side="left"))
+    return np.flatnonzero(((timestamps >= start) & (timestamps < end)).to_numpy())
+
+def manifest_positions(merged_df: pd.DataFrame, manifest: dict) -> Splits:
+    if manifest["mode"] == "random":
+        return Splits(*manifest["positions"])
+    return Splits(*(period_rows(merged_df['timestamp'], *manifest["periods"][name]) for name in Splits._fields))
+
+def fold_positions(merged_df: pd.DataFrame, manifest: dict) -> list:
+    """
+    (train, validation) rows of each rolling-origin fold, as for manifest_positions.
+    """
+    return [(period_rows(merged_df['timestamp'], *fold["train"]), period_rows(merged_df['timestamp'], *fold["validation"]))
+            for fold in manifest.get("folds", [])]
+
+def split_views(merged_df: pd.DataFrame, manifest: dict) -> Splits:
+    return Splits(*(merged_df.iloc[p] for p in manifest_positions(merged_df, manifest)))
+
+def split_dataset(merged_df: pd.DataFrame) -> Splits:
+    return split_views(merged_df, split_manifest(merged_df))
+
+def save_manifest(manifest: dict, splits_dir: str = splits_dir) -> str:
+    os.makedirs(splits_dir, exist_ok=True)
+    manifest = dict(manifest)
+    positions = manifest.pop("positions", None)
+    for name in Splits._fields:
+        path = os.path.join(splits_dir, f"{name}_positions.npy")
+        if positions is None:
+            # Left over from an earlier random split.
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        np.save(path, np.asarray(getattr(positions, name), dtype="int64"))
+        manifest.setdefault("positions", {})[name] = os.path.basename(path)
+    path = os.path.join(splits_dir, MANIFEST_NAME)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    instrumentation.record_written(path)
+    print(f"Split manifest saved to {path}")
+    return path
+
+def load_manifest(splits_dir: str = splits_dir) -> dict:
+    path = os.path.join(splits_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        print(f"Error: No split manifest at {path}; run train_test_split.py first.")
+        sys.exit(1)
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest["mode"] == "random":
+        manifest["positions"] = Splits(*(np.load(os.path.join(splits_dir, manifest["positions"][name]))
+                                         for name in Splits._fields))
+    return manifest
+
+def main():
+    merged_file = catalog.latest(base_dir, catalog.merged_kind(MERGED_LAYOUT))
+
+    if merged_file is None:
+        print(f"Error: No {MERGED_LAYOUT} merged dataset found in the catalog")
+        exit(1)
+    else:
+        print(f"Using merged dataset file: {merged_file}")
+
+    # Chronological splits only need the timestamps.
+    try:
+        if SPLIT_MODE == "chronological":
+            merged_df = read_dataset(merged_file, columns=['timestamp'])
+        else:
+            merged_df = read_dataset(merged_file)
+    except Exception as e:
+        print(f"Error loading the merged dataset: {e}")
+        exit(1)
 
-train_output_path = os.path.join(splits_dir, "train_dataset.csv.gz")
-val_output_path = os.path.join(splits_dir, "validation_dataset.csv.gz")
-test_output_path = os.path.join(splits_dir, "test_dataset.csv.gz")
+    manifest = split_manifest(merged_df, merged_file)
+    for name, rows in zip(Splits._fields, manifest_positions(merged_df, manifest)):
+        print(f"Rows in {name} set:", len(merged_df.iloc[rows]))
+    for k, fold in enumerate(manifest.get("folds", [])):
+        print(f"Fold {k}: train {fold['train'][0]} to {fold['train'][1]}, "
+              f"validation to {fold['validation'][1]}")
 
-train_df.to_csv(train_output_path, index=False, compression="gzip")
-val_df.to_csv(val_output_path, index=False, compression="gzip")
-test_df.to_csv(test_output_path, index=False, compression="gzip")
+    save_manifest(manifest)
 
-print(f"Training set saved to {train_output_path}")
-print(f"Validation set saved to {val_output_path}")
-print(f"Test set saved to {test_output_path}")
+if __name__ == "__main__":
+    main()
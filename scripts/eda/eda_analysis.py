@@ -1,9 +1,16 @@
 import os
+import sys
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import numpy as np
 
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import catalog, instrumentation, plotting
+from scripts.common.schema import MEASUREMENT_COLUMNS
+from scripts.common.storage import MERGED_LAYOUT, read_dataset
+
 def detect_outliers(series, threshold=3):
     mean_val = series.mean()
     std_dev = series.std()
@@ -18,22 +25,21 @@ def remove_outliers(df, column):
     df_cleaned = df[~outliers]
     return df_cleaned
 
-def main():
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    merged_dir = os.path.join(base_dir, "data", "merged_data")
-    
-    files = [f for f in os.listdir(merged_dir) if f.startswith("merged_dataset_") and f.endswith(".csv.gz")]
-    files.sort()
-    if not files:
-        print("Error: No merged dataset found.")
-        return
-    
-    merged_file = os.path.join(merged_dir, files[-1])
-    df = pd.read_csv(merged_file, compression="gzip")
-    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-    
-    pivot = df.pivot_table(index="timestamp", columns="measurement_type", values="measurement", aggfunc="mean")
-    pivot = pivot.dropna()
+def measurement_pivot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean of each measurement across countries per timestamp, from either
+    merged layout. Hours missing any measurement are dropped.
+    """
+    if "measurement_type" not in df.columns:
+        # Already aligned per (country, timestamp): average across countries per hour.
+        value_columns = {column: name for name, column in MEASUREMENT_COLUMNS.items()}
+        pivot = df.groupby("timestamp")[list(value_columns)].mean().rename(columns=value_columns)
+    else:
+        pivot = df.pivot_table(index="timestamp", columns="measurement_type", values="measurement", aggfunc="mean", observed=True)
+    return pivot.dropna()
+
+def eda_stage(merged_df: pd.DataFrame, base_dir: str) -> str:
+    pivot = measurement_pivot(merged_df)
     
     # Resample data to 4-day averages
     pivot_weekly = pivot.resample("5D").mean()
@@ -44,6 +50,8 @@ def main():
             pivot_weekly = remove_outliers(pivot_weekly, col)
     
     # Plot results
+    plt = plotting.pyplot()
+    import matplotlib.dates as mdates
     fig, ax1 = plt.subplots(figsize=(12, 5), constrained_layout=True)
     if "actual_load" in pivot_weekly.columns:
         ax1.plot(pivot_weekly.index, pivot_weekly["actual_load"], label="Actual Load (4-Day Avg)", marker="o", linestyle="-")
@@ -69,8 +77,24 @@ def main():
     os.makedirs(plots_dir, exist_ok=True)
     plot_path = os.path.join(plots_dir, "filtered_4day_generation_vs_actual_load_price.png")
     plt.savefig(plot_path)
+    instrumentation.record_written(plot_path)
     print(f"Filtered 4-day average plot with energy price saved to: {plot_path}")
-    plt.show()
+    plotting.done(plt)
+    return plot_path
+
+def main():
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    merged_file = catalog.latest(base_dir, catalog.merged_kind(MERGED_LAYOUT))
+    if merged_file is None:
+        print("Error: No merged dataset found.")
+        return
+    
+    if MERGED_LAYOUT == "wide":
+        df = read_dataset(merged_file, columns=["timestamp"] + list(MEASUREMENT_COLUMNS.values()))
+    else:
+        df = read_dataset(merged_file, columns=["timestamp", "measurement_type", "measurement"])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    eda_stage(df, base_dir)
 
 if __name__ == "__main__":
     main()
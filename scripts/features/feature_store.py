@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import catalog, instrumentation
+from scripts.common.storage import read_dataset, remove_dataset, write_dataset
+
+# Bump when the definition of a feature changes; a new version is stored in its own directory.
+FEATURE_VERSION = 1
+STORE_DIR = os.path.join("data", "features")
+MANIFEST_NAME = "store.json"
+
+KEYS = ["country", "timestamp"]
+VALUE_COLUMNS = ["load_value", "generation_forecast", "energy_price"]
+# Features of hour t only use values from t - HORIZON or earlier, so they are
+# known a day ahead, when the forecast for t is made.
+HORIZON = pd.Timedelta(hours=24)
+LAGS = {"lag_24h": pd.Timedelta(hours=24), "lag_168h": pd.Timedelta(hours=168)}
+# Rolling windows ending at t - HORIZON.
+WINDOWS = {"24h": pd.Timedelta(hours=24), "168h": pd.Timedelta(hours=168)}
+RATIOS = {"price_load_ratio": ("energy_price", "load_value"),
+          "generation_load_ratio": ("generation_forecast", "load_value")}
+RATIO_INPUTS = ["lag_24h", "mean_168h"]
+# History needed before an hour to compute its features.
+LOOKBACK = max(max(LAGS.values()), HORIZON + max(WINDOWS.values()))
+# Appends are written as parts; past this many they are compacted into one.
+MAX_PARTS = int(os.getenv("FEATURE_STORE_MAX_PARTS", "24"))
+
+FEATURE_COLUMNS = ([f"{column}_{lag}" for column in VALUE_COLUMNS for lag in LAGS]
+                   + [f"{column}_{stat}_{window}" for column in VALUE_COLUMNS for window in WINDOWS
+                      for stat in ["mean", "std"]]
+                   + [f"{name}_{suffix}" for name in RATIOS for suffix in RATIO_INPUTS])
+
+
+class UpdateResult(NamedTuple):
+    path: str
+    data_version: str
+    rows_added: int
+    rebuilt: bool
+
+
+def definition() -> dict:
+    return {"version": FEATURE_VERSION, "horizon": str(HORIZON),
+            "lags": {name: str(lag) for name, lag in LAGS.items()},
+            "windows": {name: str(window) for name, window in WINDOWS.items()},
+            "ratios": RATIOS, "ratio_inputs": RATIO_INPUTS}
+
+
+def store_dir(base_dir: str = base_dir) -> str:
+    digest = hashlib.sha256(json.dumps(definition(), sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(base_dir, STORE_DIR, f"v{FEATURE_VERSION}-{digest}")
+
+
+def source_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per (country, timestamp) with the measured values, sorted by key.
+    """
+    df = df[KEYS + [c for c in VALUE_COLUMNS if c in df.columns]].dropna(subset=KEYS)
+    df = df.assign(country=df["country"].astype(str), **{c: np.nan for c in VALUE_COLUMNS if c not in df.columns})
+    df = df.sort_values(KEYS, kind="stable").drop_duplicates(KEYS, keep="last")
+    return df.reset_index(drop=True)
+
+
+def positions(history: pd.DataFrame, keys: pd.DataFrame, offset=pd.Timedelta(0)) -> np.ndarray:
+    """
+    Row of history at (country, timestamp - offset) for each key, -1 where there is none.
+    """
+    index = pd.MultiIndex.from_arrays([history["country"], history["timestamp"]])
+    return index.get_indexer(pd.MultiIndex.from_arrays([keys["country"].astype(str), keys["timestamp"] - offset]))
+
+
+def take(values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    result = np.full(len(rows), np.nan, dtype="float32")
+    found = rows >= 0
+    result[found] = values[rows[found]]
+    return result
+
+
+def compute_features(history: pd.DataFrame, keys: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Features of every (country, timestamp) in keys (default: the rows of
+    history) from the values in history, as returned by source_rows. Lags
+    are exact-time lookups and the windows are time-based, so a missing hour
+    stays missing instead of shifting the other rows. One groupby-rolling
+    pass per window over all countries.
+    """
+    keys = history[KEYS] if keys is None else keys[KEYS]
+    by_country = history.set_index("timestamp").groupby("country", sort=False)[VALUE_COLUMNS]
+    window_stats = {}
+    for name, window in WINDOWS.items():
+        rolling = by_country.rolling(window)
+        # Rows come back grouped by country in the order of history, which is sorted by key.
+        for stat, frame in [("mean", rolling.mean()), ("std", rolling.std())]:
+            for column in VALUE_COLUMNS:
+                window_stats[f"{column}_{stat}_{name}"] = frame[column].to_numpy("float32")
+
+    features = keys.reset_index(drop=True)
+    features["country"] = features["country"].astype(str)
+    current = positions(history, keys)
+    for column in VALUE_COLUMNS:
+        features[column] = take(history[column].to_numpy("float32"), current)
+    for name, lag in LAGS.items():
+        rows = positions(history, keys, lag)
+        for column in VALUE_COLUMNS:
+            features[f"{column}_{name}"] = take(history[column].to_numpy("float32"), rows)
+    rows = positions(history, keys, HORIZON)
+    for name, values in window_stats.items():
+        features[name] = take(values, rows)
+    for name, (numerator, denominator) in RATIOS.items():
+        for suffix in RATIO_INPUTS:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = features[f"{numerator}_{suffix}"].to_numpy() / features[f"{denominator}_{suffix}"].to_numpy()
+            features[f"{name}_{suffix}"] = np.where(np.isfinite(ratio), ratio, np.nan).astype("float32")
+    return features
+
+
+def horizon_keys(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    The hours after each country's last row, up to HORIZON ahead at the
+    country's usual step: their features are already known.
+    """
+    frames = []
+    for country, timestamps in history.groupby("country", sort=False)["timestamp"]:
+        steps = timestamps.diff().dropna()
+        step = steps.mode().iloc[0] if len(steps) else pd.Timedelta(hours=1)
+        last = timestamps.iloc[-1]
+        future = pd.date_range(last + step, last + HORIZON, freq=step)
+        frames.append(pd.DataFrame({"country": country, "timestamp": future}))
+    return pd.concat(frames, ignore_index=True) if frames else history[KEYS].iloc[:0]
+
+
+def load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(directory: str, manifest: dict) -> str:
+    content = {key: manifest[key] for key in ["parts", "ends", "source"]}
+    manifest["data_version"] = hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+    manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    instrumentation.record_written(path)
+    return path
+
+
+def read_parts(directory: str, manifest: dict, columns=None, start=None, end=None, countries=None,
+               horizon=True) -> pd.DataFrame:
+    names = [part["path"] for part in manifest["parts"]] + ([manifest["horizon"]] if horizon and manifest.get("horizon")
+                                                              else [])
+    frames = [read_dataset(os.path.join(directory, name), columns=columns, start=start, end=end, countries=countries)
+              for name in names]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=columns or KEYS + VALUE_COLUMNS + FEATURE_COLUMNS)
+    df = pd.concat(frames, ignore_index=True)
+    df["country"] = df["country"].astype(str)
+    for column in df.columns.intersection(VALUE_COLUMNS + FEATURE_COLUMNS):
+        df[column] = df[column].astype("float32")
+    return df
+
+
+def stored_ends(history: pd.DataFrame, manifest: dict) -> pd.Series:
+    """
+    Last stored hour of each row's country, NaT for countries not stored yet.
+    """
+    return pd.to_datetime(history["country"].map(manifest["ends"]), utc=True)
+
+
+def matches_source(directory: str, manifest: dict, history: pd.DataFrame) -> bool:
+    """
+    Whether the source still has the values of the stored tail (the source
+    rows of the LOOKBACK before the last stored hours), which new hours are
+    computed from. Revisions further back are not detected; --rebuild
+    recomputes everything.
+    """
+    tail = source_rows(read_dataset(os.path.join(directory, manifest["tail"])))
+    ends = stored_ends(history, manifest)
+    covered = history[ends.notna() & (history["timestamp"] <= ends)].reset_index(drop=True)
+    if len(tail) != len(covered) or not tail["country"].equals(covered["country"]) \
+            or not (tail["timestamp"].to_numpy() == covered["timestamp"].to_numpy()).all():
+        return False
+    return all(np.array_equal(tail[c].to_numpy("float32"), covered[c].to_numpy("float32"), equal_nan=True)
+               for c in VALUE_COLUMNS)
+
+
+def write_part(directory: str, df: pd.DataFrame, name: str) -> dict:
+    path = write_dataset(df, os.path.join(directory, name))
+    return {"path": os.path.basename(path), "rows": len(df)}
+
+
+def part_name() -> str:
+    return f"part-{datetime.now():%Y%m%dT%H%M%S%f}"
+
+
+def update_store(base_dir: str = base_dir, source_path: str = None, wide: pd.DataFrame = None,
+                 rebuild: bool = False) -> UpdateResult:
+    """
+    Brings the store up to date with a wide merged dataset (the latest in
+    the catalog by default; `wide` is its frame when already in memory).
+    Only the hours after each country's last stored hour are computed, from
+    the source rows of the LOOKBACK before them. The store is rebuilt when
+    the source revised those rows, starts before the store, or with
+    rebuild=True.
+    """
+    source_path = source_path or catalog.latest(base_dir, catalog.merged_kind("wide"))
+    if source_path is None:
+        print("Error: No wide merged dataset found in the catalog.")
+        sys.exit(1)
+    directory = store_dir(base_dir)
+    os.makedirs(directory, exist_ok=True)
+    manifest = None if rebuild else load_manifest(directory)
+
+    def read_source(since):
+        if wide is not None:
+            return source_rows(wide if since is None else wide[wide["timestamp"] >= since])
+        return source_rows(read_dataset(source_path, columns=KEYS + VALUE_COLUMNS, start=since))
+
+    since = None
+    if manifest is not None and manifest["ends"]:
+        since = min(pd.Timestamp(end) for end in manifest["ends"].values()) - LOOKBACK
+        entry = catalog.entry(base_dir, source_path)
+        if entry and entry["start_ts"] and entry["start_ts"] < catalog.utc_text(manifest["start"]):
+            print("The source starts before the feature store; rebuilding it.")
+            manifest = None
+    history = read_source(since if manifest is not None else None)
+    if manifest is not None and manifest["ends"] and not matches_source(directory, manifest, history):
+        print("The source revised rows the stored features were computed from; rebuilding the feature store.")
+        manifest = None
+        history = read_source(None)
+
+    rebuilt = manifest is None
+    if rebuilt:
+        for name in os.listdir(directory):
+            remove_dataset(os.path.join(directory, name))
+        manifest = {"definition": definition(), "parts": [], "ends": {}, "start": None, "tail": None, "horizon": None}
+    ends = stored_ends(history, manifest)
+    new = history[ends.isna() | (history["timestamp"] > ends)]
+
+    if len(new):
+        features = compute_features(history, new)[KEYS + FEATURE_COLUMNS]
+        manifest["parts"].append(write_part(directory, features, part_name()))
+        if len(manifest["parts"]) > MAX_PARTS:
+            compacted = read_parts(directory, manifest, horizon=False)
+            old_parts = manifest["parts"]
+            manifest["parts"] = [write_part(directory, compacted, part_name())]
+            for part in old_parts:
+                remove_dataset(os.path.join(directory, part["path"]))
+
+        manifest["ends"].update({country: end.isoformat() for country, end in
+                                 new.groupby("country", sort=False)["timestamp"].max().items()})
+        first = new["timestamp"].min()
+        manifest["start"] = min(first, pd.Timestamp(manifest["start"])).isoformat() if manifest["start"] \
+            else first.isoformat()
+        # The source rows the next update computes from, to check them for revisions.
+        tail_start = min(pd.Timestamp(end) for end in manifest["ends"].values()) - LOOKBACK
+        manifest["tail"] = write_part(directory, history[history["timestamp"] >= tail_start], "tail")["path"]
+        # The hours just past the data, whose features are already known; replaced on every update.
+        manifest["horizon"] = write_part(directory, compute_features(history, horizon_keys(history))[KEYS + FEATURE_COLUMNS],
+                                         "horizon")["path"]
+        manifest["source"] = os.path.relpath(source_path, base_dir)
+        save_manifest(directory, manifest)
+        catalog.register(base_dir, "features", directory, rows=sum(part["rows"] for part in manifest["parts"]),
+                         start=manifest["start"], end=max(pd.Timestamp(e) for e in manifest["ends"].values()),
+                         schema=features.iloc[:0])
+    instrumentation.count(rows_in=len(history), rows_out=len(new))
+    print(f"Feature store {directory}: {'rebuilt with' if rebuilt else 'added'} {len(new)} rows, "
+          f"data version {manifest.get('data_version')}")
+    return UpdateResult(directory, manifest.get("data_version"), len(new), rebuilt)
+
+
+def read_features(base_dir: str = base_dir, start=None, end=None, countries=None) -> pd.DataFrame:
+    """
+    Stored features (with the hours just past the data) for the given
+    period and countries.
+    """
+    directory = store_dir(base_dir)
+    manifest = load_manifest(directory)
+    if manifest is None:
+        print(f"Error: No feature store at {directory}; run scripts/features/feature_store.py first.")
+        sys.exit(1)
+    return read_parts(directory, manifest, columns=KEYS + FEATURE_COLUMNS, start=start, end=end, countries=countries)
+
+
+def data_version(base_dir: str = base_dir) -> str:
+    manifest = load_manifest(store_dir(base_dir))
+    return manifest.get("data_version") if manifest else None
+
+
+def join_features(df: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
+    """
+    df with the features of its (country, timestamp) added; NaN where the store has none.
+    """
+    rows = positions(features, df)
+    df = df.copy()
+    for column in FEATURE_COLUMNS:
+        df[column] = take(features[column].to_numpy("float32"), rows)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the lag and rolling feature store from the latest wide "
+                                                 "merged dataset.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every stored hour")
+    args = parser.parse_args()
+    update_store(base_dir, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
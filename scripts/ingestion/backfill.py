@@ -0,0 +1,149 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from scripts.common import catalog, instrumentation
+from scripts.ingestion.client import NoData
+from scripts.ingestion.incremental import save_high_water_marks
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CHECKPOINT_DIR = os.path.join(base_dir, "data", "backfill")
+
+
+def split_period(start_date, end_date, timezone_offset, chunk_days=None):
+    """
+    Splits the local days start_date..end_date (inclusive) into UTC request
+    windows. Chunks follow calendar months unless chunk_days is given.
+    """
+    chunks = []
+    chunk_start = start_date
+    last = end_date + timedelta(days=1)
+    while chunk_start < last:
+        if chunk_days:
+            chunk_end = chunk_start + timedelta(days=chunk_days)
+        elif chunk_start.month == 12:
+            chunk_end = chunk_start.replace(year=chunk_start.year + 1, month=1, day=1)
+        else:
+            chunk_end = chunk_start.replace(month=chunk_start.month + 1, day=1)
+        chunk_end = min(chunk_end, last)
+        chunks.append((
+            (chunk_start - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M"),
+            (chunk_end - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M"),
+        ))
+        chunk_start = chunk_end
+    return chunks
+
+
+def checkpoint_path(data_type, country_name, chunk, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, data_type, country_name, f"{chunk[0]}_{chunk[1]}.csv.gz")
+
+
+def empty_marker_path(path):
+    return path.replace(".csv.gz", ".empty")
+
+
+def is_done(path):
+    return os.path.exists(path) or os.path.exists(empty_marker_path(path))
+
+
+def write_checkpoint(path, df):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if df is None or df.empty:
+        # Remember chunks without data so a resumed run does not ask for them again.
+        open(empty_marker_path(path), "w").close()
+        return
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, index=False, compression="gzip")
+    os.replace(tmp_path, path)
+
+
+def backfill(engine, document, data_type, country_codes, parse, start_date, end_date,
+             timezone_offset, chunk_days=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Fetches every (country, chunk) pair in parallel and checkpoints each
+    finished chunk to disk. Chunks that already have a checkpoint are skipped,
+    so an interrupted backfill resumes where it stopped.
+    """
+    chunks = split_period(start_date, end_date, timezone_offset, chunk_days)
+    jobs = [(country_name, chunk) for country_name in country_codes for chunk in chunks]
+    pending = [job for job in jobs if not is_done(checkpoint_path(data_type, job[0], job[1], checkpoint_dir))]
+    print(f"Backfill {data_type}: {len(chunks)} chunks x {len(country_codes)} countries, "
+          f"{len(jobs) - len(pending)} already done, {len(pending)} to fetch.")
+
+    def fetch_chunk(job):
+        country_name, chunk = job
+        path = checkpoint_path(data_type, country_name, chunk, checkpoint_dir)
+        failed = False
+        for country_code in country_codes[country_name]:
+            xml_data = engine.fetch_document(document, country_code, chunk[0], chunk[1])
+            if isinstance(xml_data, NoData):
+                continue
+            if not xml_data:
+                failed = True
+                continue
+            df = parse(xml_data, country_name)
+            if not df.empty:
+                write_checkpoint(path, df)
+                return len(df)
+        if failed:
+            # A code that failed may still have data: leave the chunk unmarked so it is retried.
+            return None
+        # Every code answered that it has no data for the chunk.
+        write_checkpoint(path, None)
+        return 0
+
+    results = engine.map(fetch_chunk, pending)
+    failed = [job for job, rows in results.items() if rows is None]
+    if failed:
+        print(f"{len(failed)} chunks failed and will be retried on the next run.")
+    return collect_checkpoints(data_type, country_codes, chunks, checkpoint_dir), failed
+
+
+def collect_checkpoints(data_type, country_codes, chunks, checkpoint_dir=CHECKPOINT_DIR):
+    frames = []
+    for country_name in country_codes:
+        for chunk in chunks:
+            path = checkpoint_path(data_type, country_name, chunk, checkpoint_dir)
+            if os.path.exists(path):
+                frames.append(pd.read_csv(path, compression="gzip"))
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df.dropna(subset=["timestamp"])
+
+
+def run_backfill(engine, document, data_type, country_codes, parse, output_dir, file_prefix,
+                 backfill_start, end_date, timezone_offset, chunk_days=None, allow_partial=False):
+    """
+    Runs a backfill from backfill_start (YYYY-MM-DD) to end_date and writes the
+    assembled <file_prefix>_<start>_to_<end>.csv.gz. Nothing is written while
+    chunks are still missing, unless allow_partial is set.
+    """
+    start_date = datetime.strptime(backfill_start, "%Y-%m-%d")
+    df, failed = backfill(engine, document, data_type, country_codes, parse,
+                          start_date, end_date, timezone_offset, chunk_days)
+    if failed and not allow_partial:
+        print("Backfill incomplete; rerun the same command to resume, or pass --allow-partial to save what finished.")
+        return None
+    if df.empty:
+        print(f"Backfill returned no {data_type} data.")
+        return None
+    df = df.sort_values(by=["timestamp", "country"]).reset_index(drop=True)
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(
+        output_dir, f"{file_prefix}_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv.gz"
+    )
+    df.to_csv(output_path, index=False, compression="gzip")
+    instrumentation.record_written(output_path, len(df))
+    # The datasets are kept per kind in data/<kind>.
+    catalog.register(base_dir, os.path.basename(output_dir), output_path, df)
+    if failed:
+        # A high-water mark past a missing chunk would make incremental runs skip it.
+        print(f"Saved {len(df)} backfilled {data_type} rows to {output_path}; {len(failed)} chunks are missing, "
+              f"rerun the same command to fill them.")
+        return output_path
+    save_high_water_marks(data_type, df.groupby("country")["timestamp"].max().to_dict())
+    print(f"Saved {len(df)} backfilled {data_type} rows to {output_path}")
+    return output_path
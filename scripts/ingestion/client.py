@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import instrumentation
+
+DEFAULT_CACHE_DIR = os.getenv("ENTSOE_CACHE_DIR", os.path.join(base_dir, "data", "cache", "entsoe"))
+# Responses for periods that are still open (end after today's UTC midnight) are refreshed after this many seconds.
+OPEN_PERIOD_TTL = int(os.getenv("ENTSOE_OPEN_PERIOD_TTL", "3600"))
+
+CACHE_KEY_FIELDS = ["documentType", "processType", "domain", "periodStart", "periodEnd"]
+DOMAIN_PARAMS = ["outBiddingZone_Domain", "in_Domain", "biddingZone_Domain"]
+RETRY_STATUS = {429, 500, 502, 503, 504}
+ACKNOWLEDGEMENT = "Acknowledgement_MarketDocument"
+
+
+class NoData(str):
+    """
+    An answer that the query is valid but has no data, as opposed to None
+    for a request that failed. Empty, so it is falsy like a missing answer.
+    """
+
+
+NO_DATA = NoData()
+
+
+def is_no_data(status_code, text):
+    """
+    ENTSO-E answers "No matching data found" with an acknowledgement
+    document, with status 200 or 400.
+    """
+    if ACKNOWLEDGEMENT not in text[:2000]:
+        return False
+    return status_code == 200 or "No matching data found" in text
+
+
+def cache_key(params):
+    domain = next((params[p] for p in DOMAIN_PARAMS if p in params), "")
+    values = {**params, "domain": domain}
+    return tuple(values.get(field, "") for field in CACHE_KEY_FIELDS)
+
+
+def is_closed_period(params, now=None):
+    """
+    A period is closed once it ends at or before today's UTC midnight; its data will not change anymore.
+    """
+    now = now or datetime.now(timezone.utc)
+    period_end = datetime.strptime(params["periodEnd"], "%Y%m%d%H%M").replace(tzinfo=timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return period_end <= today
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw XML responses, one gzip file per (documentType,
+    processType, domain, periodStart, periodEnd) key.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, open_period_ttl=OPEN_PERIOD_TTL):
+        self.cache_dir = cache_dir
+        self.open_period_ttl = open_period_ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        digest = hashlib.sha1("|".join(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key[0]}_{key[2]}_{digest[:16]}.xml.gz")
+
+    def get(self, params):
+        path = self.path_for(cache_key(params))
+        if not os.path.exists(path):
+            return None
+        if not is_closed_period(params) and time.time() - os.path.getmtime(path) > self.open_period_ttl:
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def put(self, params, text):
+        path = self.path_for(cache_key(params))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+class EntsoeClient:
+    """
+    ENTSO-E API client with a pooled Session, exponential backoff with jitter
+    on 429/5xx and an optional on-disk response cache.
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=10, retries=5, pool_size=8,
+                 cache=None, rate_limiter=None, backoff_base=1.0, backoff_cap=30.0):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {"requests": 0, "cache_hits": 0, "cache_misses": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self.stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def get(self, params):
+        """
+        Returns the response text for the query, from the cache when possible,
+        NO_DATA when the API has no data for it, or None when the request failed.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(params)
+            if cached is not None:
+                size = len(cached.encode("utf-8"))
+                self._count(cache_hits=1, bytes_saved=size)
+                instrumentation.count(cache_hits=1, bytes_read=size)
+                return cached
+            self._count(cache_misses=1)
+            instrumentation.count(cache_misses=1)
+
+        query = dict(params)
+        if self.api_key:
+            query["securityToken"] = self.api_key
+        label = ", ".join(f"{k}={v}" for k, v in params.items())
+        for attempt in range(self.retries):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                started = time.perf_counter()
+                try:
+                    response = self.session.get(self.base_url, params=query, timeout=self.timeout)
+                finally:
+                    instrumentation.record_http(time.perf_counter() - started)
+                self._count(requests=1, bytes_downloaded=len(response.content))
+                instrumentation.count(bytes_read=len(response.content))
+                # "No matching data" answers are never cached: the data may still be published.
+                if is_no_data(response.status_code, response.text):
+                    return NO_DATA
+                if response.status_code == 200:
+                    text = response.text
+                    if self.cache is not None:
+                        self.cache.put(params, text)
+                    return text
+                if response.status_code not in RETRY_STATUS:
+                    print(f"Request [{label}] failed with status {response.status_code}; not retrying.")
+                    return None
+                retry_after = response.headers.get("Retry-After")
+                print(f"Attempt {attempt+1}/{self.retries} for [{label}]: status {response.status_code}")
+            except requests.RequestException as e:
+                print(f"Attempt {attempt+1}/{self.retries} for [{label}] failed: {e}")
+            if attempt + 1 < self.retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        return None
+
+    def report(self):
+        stats = dict(self.stats)
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        stats["cache_hit_rate"] = stats["cache_hits"] / lookups if lookups else 0.0
+        print(f"HTTP requests: {stats['requests']}, cache hits: {stats['cache_hits']}/{lookups} "
+              f"({stats['cache_hit_rate']:.1%}), downloaded: {stats['bytes_downloaded'] / 1e6:.2f} MB, "
+              f"saved by cache: {stats['bytes_saved'] / 1e6:.2f} MB")
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+def cache_index(cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Lists cached responses with their size, for inspecting the cache from the command line.
+    """
+    entries = []
+    for name in sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []:
+        if name.endswith(".xml.gz"):
+            path = os.path.join(cache_dir, name)
+            entries.append({"file": name, "bytes": os.path.getsize(path),
+                            "modified": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")})
+    return entries
+
+
+if __name__ == "__main__":
+    entries = cache_index()
+    print(json.dumps(entries, indent=2))
+    print(f"{len(entries)} cached responses, {sum(e['bytes'] for e in entries) / 1e6:.2f} MB on disk")
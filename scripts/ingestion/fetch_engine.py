@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from scripts.common import instrumentation
+from scripts.ingestion.client import EntsoeClient, ResponseCache
+
+load_dotenv()
+
+API_KEY = os.getenv("API_KEY")
+BASE_URL = os.getenv("ENTSOE_BASE_URL", "https://web-api.tp.entsoe.eu/api")
+
+# ENTSO-E allows 400 requests per minute per security token; stay a bit below it.
+DEFAULT_MAX_WORKERS = int(os.getenv("ENTSOE_MAX_WORKERS", "8"))
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("ENTSOE_REQUESTS_PER_MINUTE", "350"))
+USE_CACHE = os.getenv("ENTSOE_CACHE", "1") != "0"
+
+# Each document type only differs in its query parameters, so new ones are added here.
+DOCUMENT_TYPES = {
+    "actual_load": {"documentType": "A65", "processType": "A16", "domain_param": "outBiddingZone_Domain"},
+    "generation_forecast": {"documentType": "A71", "processType": "A01", "domain_param": "in_Domain"},
+    "energy_price": {"documentType": "A44", "domain_param": ["in_Domain", "out_Domain"]},
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_params(document, domain, start_str, end_str):
+    spec = DOCUMENT_TYPES[document]
+    params = {"documentType": spec["documentType"]}
+    if spec.get("processType"):
+        params["processType"] = spec["processType"]
+    domain_params = spec["domain_param"]
+    for domain_param in domain_params if isinstance(domain_params, list) else [domain_params]:
+        params[domain_param] = domain
+    params["periodStart"] = start_str
+    params["periodEnd"] = end_str
+    return params
+
+
+class FetchEngine:
+    """
+    Runs ENTSO-E requests on a bounded thread pool, sharing one rate limiter
+    between all workers so the API quota is respected.
+    """
+
+    def __init__(self, base_url=BASE_URL, api_key=API_KEY, max_workers=DEFAULT_MAX_WORKERS,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, timeout=10, retries=5, use_cache=USE_CACHE):
+        self.max_workers = max_workers
+        rate = requests_per_minute / 60.0
+        self.bucket = TokenBucket(rate, capacity=max(1, max_workers))
+        self.client = EntsoeClient(
+            base_url, api_key=api_key, timeout=timeout, retries=retries, pool_size=max_workers,
+            cache=ResponseCache() if use_cache else None, rate_limiter=self.bucket
+        )
+
+    def fetch(self, params):
+        """
+        Rate-limited, cached GET with retries. Returns the response text or None.
+        """
+        return self.client.get(params)
+
+    def fetch_document(self, document, domain, start_str, end_str):
+        return self.fetch(build_params(document, domain, start_str, end_str))
+
+    def map(self, func, items):
+        """
+        Calls func(item) for every item on the thread pool and returns
+        {item: result}. Failures are reported and stored as None.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except Exception as e:
+                    print(f"Task for {item} failed: {e}")
+                    results[item] = None
+        return results
+
+
+def fetch_first_available(engine, document, country_codes, start_str, end_str, parse, windows=None):
+    """
+    Fetches every country concurrently. For each country the EIC codes are
+    tried in order and the first non-empty parsed DataFrame is kept.
+    `windows` optionally maps a country to its own (start, end) and restricts
+    the fetch to those countries.
+    """
+    countries = [name for name in country_codes if windows is None or name in windows]
+
+    def fetch_country(country_name):
+        start, end = windows[country_name] if windows is not None else (start_str, end_str)
+        for country_code in country_codes[country_name]:
+            xml_data = engine.fetch_document(document, country_code, start, end)
+            if not xml_data:
+                print(f"No XML data returned for {country_name} using code {country_code}.")
+                continue
+            df = parse(xml_data, country_name)
+            if not df.empty:
+                instrumentation.count(rows_in=len(df))
+                print(f"{country_name} ({country_code}): {len(df)} rows.")
+                return df
+            print(f"Parsed DataFrame for {country_name} ({country_code}) is empty.")
+        return None
+
+    results = engine.map(fetch_country, countries)
+    # Keep the country order of the input mapping so the output is deterministic.
+    return [results[name] for name in countries if results.get(name) is not None]
@@ -0,0 +1,323 @@
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from scripts.common import catalog, instrumentation
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+STATE_PATH = os.path.join(base_dir, "data", "state", "high_water_marks.json")
+# Re-fetch this many hours before the high-water mark so late revisions are picked up.
+OVERLAP_HOURS = int(os.getenv("INCREMENTAL_OVERLAP_HOURS", "48"))
+KEY_COLUMNS = ["timestamp", "country", "data_type"]
+# Every incremental run appends a gzip member that repeats the overlap; once
+# this many have been appended, the dataset is rewritten without the rows
+# they superseded, so plain readers only see duplicates for a few runs and
+# reads do not slow down with the number of past runs.
+COMPACT_AFTER_MEMBERS = int(os.getenv("INCREMENTAL_COMPACT_MEMBERS", "8"))
+
+state_lock = threading.Lock()
+
+
+def dataset_range(path):
+    match = re.search(r"_(\d{8})_to_(\d{8})\.csv\.gz$", path)
+    return match.group(1), match.group(2)
+
+
+def load_high_water_marks(data_type, state_path=STATE_PATH):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        state = json.load(f)
+    return {country: pd.Timestamp(ts) for country, ts in state.get(data_type, {}).items()}
+
+
+def load_appended_members(data_type, state_path=STATE_PATH):
+    """
+    Members appended to the data_type dataset since it was last written whole.
+    """
+    if not os.path.exists(state_path):
+        return 0
+    with open(state_path) as f:
+        return json.load(f).get("appended_members", {}).get(data_type, 0)
+
+
+@contextmanager
+def locked_state(state_path):
+    """
+    Holds the state file's lock, across threads and, where fcntl exists,
+    across processes: the fetchers run in parallel and share the file.
+    """
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    with state_lock, open(f"{state_path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def save_high_water_marks(data_type, marks, state_path=STATE_PATH, appended_members=0):
+    """
+    Stores the marks and the appended member count; after a full write of
+    the dataset there are none. The file is replaced whole, so readers
+    never see a partly written one.
+    """
+    state_path = str(state_path)
+    with locked_state(state_path):
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        state[data_type] = {country: str(ts) for country, ts in sorted(marks.items())}
+        state.setdefault("appended_members", {})[data_type] = appended_members
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(state_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, state_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def marks_from_dataset(path):
+    """
+    Rebuilds the high-water marks from an existing dataset. Only needed the
+    first time, before a state file exists.
+    """
+    df = pd.read_csv(path, usecols=["timestamp", "country"], compression="gzip")
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df.groupby("country")["timestamp"].max().to_dict()
+
+
+def delta_windows(marks, countries, start_date, end_date, timezone_offset, overlap_hours=OVERLAP_HOURS):
+    """
+    Returns {country: (utc_start, utc_end)} covering only the hours after each
+    country's high-water mark (minus the overlap). Countries without a mark get
+    the full window.
+    """
+    utc_end = (end_date + timedelta(days=1)) - timedelta(hours=timezone_offset)
+    full_start = start_date - timedelta(hours=timezone_offset)
+    windows = {}
+    for country in countries:
+        if country in marks:
+            start = marks[country].to_pydatetime() - timedelta(hours=timezone_offset + overlap_hours)
+            start = max(start, full_start)
+        else:
+            start = full_start
+        if start < utc_end:
+            windows[country] = (start.strftime("%Y%m%d%H%M"), utc_end.strftime("%Y%m%d%H%M"))
+    return windows
+
+
+def append_delta(path, delta_df, appended_members=0, compact_after=COMPACT_AFTER_MEMBERS):
+    """
+    Appends rows as a new gzip member, so the cost is proportional to the delta
+    and the existing history is never decompressed or rewritten; except once
+    `compact_after` members have been appended since the last full write
+    (`appended_members` before this one), when the dataset is compacted.
+    Returns the new count of appended members.
+    """
+    with gzip.open(path, "rt") as f:
+        columns = f.readline().strip().split(",")
+    size_before = os.path.getsize(path)
+    with gzip.open(path, "at") as f:
+        delta_df[columns].to_csv(f, header=False, index=False)
+    instrumentation.count(rows_out=len(delta_df), bytes_written=os.path.getsize(path) - size_before)
+    appended_members += 1
+    if compact_after and appended_members >= compact_after:
+        rows = compact(path)
+        print(f"Compacted {path} after {appended_members} appended runs ({rows} rows)")
+        return 0
+    return appended_members
+
+
+def read_gzip_members(path):
+    """
+    Returns the decompressed bytes of every gzip member in the file. A full
+    fetch writes one member; each incremental run appends another.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    members = []
+    while data:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        members.append(decompressor.decompress(data) + decompressor.flush())
+        data = decompressor.unused_data
+    return members
+
+
+class GzipMemberStream(io.RawIOBase):
+    """
+    Binary stream over a single member of a multi-member gzip file,
+    decompressed block by block. Compressed bytes read past the end of the
+    member are left in `data` for the next member.
+    """
+
+    def __init__(self, f, data, block_size):
+        self.f = f
+        self.data = data
+        self.block_size = block_size
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer and not self.decompressor.eof:
+            if not self.data:
+                self.data = self.f.read(self.block_size)
+                if not self.data:
+                    break
+            self.buffer = self.decompressor.decompress(self.data, max(len(b), 1))
+            self.data = self.decompressor.unused_data if self.decompressor.eof else self.decompressor.unconsumed_tail
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def iter_gzip_members(path, block_size=1 << 20):
+    """
+    Streaming counterpart of read_gzip_members: yields one file-like object
+    per member. Each one is drained before the next member is yielded.
+    """
+    with open(path, "rb") as f:
+        data = f.read(block_size)
+        while data:
+            stream = GzipMemberStream(f, data, block_size)
+            yield io.BufferedReader(stream, block_size)
+            while stream.read(block_size):
+                pass
+            data = stream.data or f.read(block_size)
+
+
+def upsert(frames, keys):
+    """
+    The rows of frames, given in the order they were written, without those
+    whose key appears in a later frame. Rows within one frame are kept as
+    written. One pass over all frames: each key keeps the rows of the last
+    frame it appears in.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    member = pd.Series(np.repeat(np.arange(len(frames)), [len(frame) for frame in frames]))
+    latest = member.groupby([df[key] for key in keys], sort=False, dropna=False).transform("max")
+    return df[(member == latest).to_numpy()].reset_index(drop=True)
+
+
+def read_upserted(path, key_columns=KEY_COLUMNS, **read_csv_kwargs):
+    """
+    Reads an incrementally maintained dataset. Rows appended by a later run
+    replace the rows with the same key from earlier runs, in one pass over
+    all members.
+    """
+    members = read_gzip_members(path)
+    df = pd.read_csv(io.BytesIO(members[0]), **read_csv_kwargs)
+    frames = [df] + [pd.read_csv(io.BytesIO(member), header=None, names=list(df.columns), **read_csv_kwargs)
+                     for member in members[1:]]
+    df = upsert(frames, [c for c in key_columns if c in df.columns])
+    instrumentation.record_read(path, len(df))
+    return df
+
+
+def iter_upserted_chunks(path, chunk_rows, **read_csv_kwargs):
+    """
+    Reads an incrementally maintained dataset in chunks without applying the
+    upserts: yields (member index, chunk) in file order. upsert() over the
+    members' rows in member order gives read_upserted's result, also on any
+    subset of rows that contains every row of the keys it holds.
+    """
+    with gzip.open(path, "rt") as f:
+        columns = f.readline().strip().split(",")
+    for index, stream in enumerate(iter_gzip_members(path)):
+        header = {} if index == 0 else {"header": None, "names": columns}
+        for chunk in pd.read_csv(stream, chunksize=chunk_rows, **header, **read_csv_kwargs):
+            instrumentation.count(rows_in=len(chunk))
+            yield index, chunk
+    instrumentation.count(bytes_read=os.path.getsize(path))
+
+
+def compact(path):
+    """
+    Rewrites an incrementally maintained dataset as a single member without
+    the superseded rows. Values are read as text, so they are written back
+    exactly as they were.
+    """
+    df = read_upserted(path, dtype=str, keep_default_na=False)
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, index=False, compression="gzip")
+    os.replace(tmp_path, path)
+    instrumentation.record_written(path, len(df))
+    return len(df)
+
+
+def incremental_update(data_type, output_dir, file_prefix, country_codes,
+                       start_date, end_date, timezone_offset, fetch, state_path=STATE_PATH):
+    """
+    Fetches only the rows after each country's high-water mark and upserts them
+    into the existing dataset, the newest one the catalog knows for the output
+    directory (files written before the catalog are indexed first). Falls back
+    to a full fetch when there is none, or when it is not an appendable CSV.
+
+    `fetch(windows)` must return a list of parsed DataFrames for the given
+    {country: (utc_start, utc_end)} windows.
+    """
+    kind = os.path.basename(output_dir)
+    existing = catalog.latest(base_dir, kind)
+    if existing is None:
+        print(f"No existing {data_type} dataset in {output_dir}; running a full fetch.")
+        return None
+    if not os.path.basename(existing).startswith(file_prefix) or not existing.endswith(".csv.gz"):
+        print(f"The newest {kind} dataset {existing} cannot be appended to; running a full fetch.")
+        return None
+
+    marks = load_high_water_marks(data_type, state_path)
+    if not marks:
+        print(f"No stored high-water marks for {data_type}; rebuilding them from {existing}.")
+        marks = marks_from_dataset(existing)
+
+    windows = delta_windows(marks, country_codes, start_date, end_date, timezone_offset)
+    print(f"Incremental {data_type}: {len(windows)} countries need data after their high-water mark.")
+    frames = fetch(windows) if windows else []
+    frames = [df for df in frames if df is not None and not df.empty]
+
+    if frames:
+        delta_df = pd.concat(frames, ignore_index=True)
+        delta_df["timestamp"] = pd.to_datetime(delta_df["timestamp"], errors="coerce")
+        delta_df = delta_df.dropna(subset=["timestamp"]).sort_values(by=["timestamp", "country"])
+        appended = append_delta(existing, delta_df, load_appended_members(data_type, state_path))
+        print(f"Upserted {len(delta_df)} {data_type} rows into {existing}")
+        for country, ts in delta_df.groupby("country")["timestamp"].max().items():
+            marks[country] = max(ts, marks.get(country, ts))
+    else:
+        appended = load_appended_members(data_type, state_path)
+        print(f"No new {data_type} rows.")
+
+    save_high_water_marks(data_type, marks, state_path, appended_members=appended)
+
+    first_day, last_day = dataset_range(existing)
+    new_end = max(last_day, end_date.strftime("%Y%m%d"))
+    renamed = os.path.join(output_dir, f"{file_prefix}_{first_day}_to_{new_end}.csv.gz")
+    if renamed != existing:
+        os.replace(existing, renamed)
+        print(f"Dataset renamed to {renamed}")
+    # Rows are not counted here, which would mean reading the whole dataset back.
+    catalog.register(base_dir, kind, renamed,
+                     start=pd.Timestamp(first_day), end=pd.Timestamp(new_end) + timedelta(days=1, seconds=-1))
+    return renamed
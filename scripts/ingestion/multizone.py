@@ -0,0 +1,109 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from scripts.common import instrumentation
+from scripts.ingestion.fetch_engine import fetch_first_available
+from scripts.ingestion.zones import ZONE_SINCE
+
+
+def zone_active(code, end_str):
+    """
+    Whether the zone existed before the end of the UTC window end_str.
+    """
+    since = ZONE_SINCE.get(code)
+    return since is None or datetime.strptime(since, "%Y-%m-%d") < datetime.strptime(end_str, "%Y%m%d%H%M")
+
+
+def expected_zone_counts(countries, timestamps, bidding_zones):
+    """
+    Number of zones that partition each row's country at its timestamp.
+    """
+    countries = np.asarray(countries)
+    timestamps = pd.DatetimeIndex(timestamps)
+    expected = np.zeros(len(countries), dtype=np.int64)
+    for country, zones in bidding_zones.items():
+        rows = countries == country
+        for code in zones.values():
+            since = ZONE_SINCE.get(code)
+            expected[rows] += 1 if since is None else timestamps[rows] >= pd.Timestamp(since)
+    return expected
+
+
+def fetch_zones(engine, document, bidding_zones, start_str, end_str, parse):
+    """
+    Queries every zone of every split country concurrently and returns one
+    DataFrame of per-zone rows with an extra `zone` column.
+    """
+    jobs = [(country_name, zone, code) for country_name, zones in bidding_zones.items()
+            for zone, code in zones.items() if zone_active(code, end_str)]
+
+    def fetch_zone(job):
+        country_name, zone, code = job
+        xml_data = engine.fetch_document(document, code, start_str, end_str)
+        if not xml_data:
+            print(f"No XML data returned for {country_name} zone {zone} ({code}).")
+            return None
+        df = parse(xml_data, country_name)
+        if df.empty:
+            print(f"Parsed DataFrame for {country_name} zone {zone} is empty.")
+            return None
+        instrumentation.count(rows_in=len(df))
+        df["zone"] = zone
+        return df
+
+    results = engine.map(fetch_zone, jobs)
+    frames = [results[job] for job in jobs if results.get(job) is not None]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def country_totals(zone_df, value_column, bidding_zones):
+    """
+    Sums aligned zone series into one series per country. An hour is only
+    kept when every zone of the country at that time reported it, so a
+    missing zone never shows up as a drop in the total.
+    """
+    grouped = zone_df.groupby(["country", "timestamp", "data_type"], sort=True)[value_column]
+    totals = grouped.agg(["sum", "count"]).reset_index()
+    expected = expected_zone_counts(totals["country"], totals["timestamp"], bidding_zones)
+    incomplete = totals["count"] < expected
+    if incomplete.any():
+        print(f"Dropping {int(incomplete.sum())} country-hours with missing zones.")
+    totals = totals[~incomplete].rename(columns={"sum": value_column})
+    totals["day_of_week"] = totals["timestamp"].dt.dayofweek
+    return totals[["timestamp", value_column, "day_of_week", "country", "data_type"]].reset_index(drop=True)
+
+
+def fetch_with_zones(engine, document, value_column, country_codes, bidding_zones, start_str, end_str, parse):
+    """
+    Countries with a single zone use the usual first-available fetch; split
+    countries are fetched zone by zone and summed. Returns (country frames,
+    per-zone DataFrame).
+    """
+    single = {name: codes for name, codes in country_codes.items() if name not in bidding_zones}
+    split = {name: zones for name, zones in bidding_zones.items() if name in country_codes}
+    all_data = fetch_first_available(engine, document, single, start_str, end_str, parse)
+    zone_df = fetch_zones(engine, document, split, start_str, end_str, parse)
+    if not zone_df.empty:
+        all_data.append(country_totals(zone_df, value_column, split))
+    return all_data, zone_df
+
+
+def save_zones(zone_df, output_path, label):
+    """
+    Writes the per-zone rows of a country file to zones/all_zones_<...> next
+    to it. Returns the path, or None when there are no zone rows.
+    """
+    if zone_df is None or zone_df.empty:
+        return None
+    zones_dir = os.path.join(os.path.dirname(output_path), "zones")
+    os.makedirs(zones_dir, exist_ok=True)
+    zones_path = os.path.join(zones_dir, os.path.basename(output_path).replace("all_countries_", "all_zones_"))
+    zone_df.sort_values(by=["country", "zone", "timestamp"]).to_csv(zones_path, index=False, compression="gzip")
+    instrumentation.record_written(zones_path, len(zone_df))
+    print(f"Saved per-zone {label} data to {zones_path}")
+    return zones_path
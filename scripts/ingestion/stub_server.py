@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_FIXTURES_DIR = os.path.join(base_dir, "data", "fixtures", "entsoe")
+
+DOMAIN_PARAMS = ["outBiddingZone_Domain", "in_Domain", "in_Domain.mRID", "biddingZone_Domain"]
+
+
+def find_fixture(fixtures_dir, query):
+    """
+    Recorded responses are stored as <documentType>_<domain>.xml, with
+    <documentType>.xml as a fallback for any domain.
+    """
+    document_type = query.get("documentType", [""])[0]
+    domain = next((query[p][0] for p in DOMAIN_PARAMS if p in query), "")
+    for name in [f"{document_type}_{domain}.xml", f"{document_type}.xml"]:
+        path = os.path.join(fixtures_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def make_handler(fixtures_dir):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            self.server.requests.append(query)
+            with self.server.lock:
+                status = self.server.statuses.pop(0) if self.server.statuses else 200
+            if status != 200:
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            path = find_fixture(fixtures_dir, query)
+            if path is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            with open(path, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def make_server(fixtures_dir=DEFAULT_FIXTURES_DIR, port=0, statuses=()):
+    """
+    The first requests are answered with `statuses` in order (200 serves the
+    fixture), the rest with the fixtures. server.requests lists the queries.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fixtures_dir))
+    server.statuses = list(statuses)
+    server.requests = []
+    server.lock = threading.Lock()
+    return server
+
+
+def serve_in_thread(fixtures_dir=DEFAULT_FIXTURES_DIR, port=0, statuses=()):
+    """
+    Starts the stub server on a background thread. Returns (server, base_url);
+    call server.shutdown() when done.
+    """
+    server = make_server(fixtures_dir, port, statuses)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    fixtures_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_FIXTURES_DIR
+    server = make_server(fixtures_dir, port)
+    print(f"Serving recorded ENTSO-E XML from {fixtures_dir} at http://127.0.0.1:{port}/api")
+    print("Point the fetchers at it with ENTSOE_BASE_URL.")
+    server.serve_forever()
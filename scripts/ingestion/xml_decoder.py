@@ -0,0 +1,154 @@
+import io
+import re
+from array import array
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_resolution(text):
+    """
+    Converts an ISO-8601 duration such as PT60M, PT15M or P1D to minutes.
+    """
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?", text or "")
+    if not match or not any(match.groups()):
+        raise ValueError(f"Unsupported resolution: {text}")
+    days, hours, minutes = (int(g) if g else 0 for g in match.groups())
+    return days * 1440 + hours * 60 + minutes
+
+
+def expand_variable_blocks(position, value, n_positions):
+    """
+    Curve type A03 omits a point when its value equals the previous one. Fills
+    positions 1..n_positions, each taking the value of the last point at or
+    before it.
+    """
+    full = np.arange(1, n_positions + 1, dtype=np.int64)
+    idx = np.searchsorted(position, full, side="right") - 1
+    valid = idx >= 0
+    return full[valid], value[idx[valid]]
+
+
+def decode_points(xml_data, value_tag="quantity"):
+    """
+    Streams an ENTSO-E document with iterparse and returns its points as typed
+    NumPy arrays: series (TimeSeries index), period_start (datetime64[m], UTC),
+    resolution (minutes), position and value. Elements are cleared as soon as
+    they are consumed, so memory stays proportional to the number of points,
+    not the XML tree. Periods published with curve type A03 are expanded so
+    every position of the period is present.
+    """
+    if isinstance(xml_data, str):
+        xml_data = xml_data.encode("utf-8")
+
+    series_ids, starts, resolutions, counts = [], [], [], []
+    position_chunks, value_chunks = [], []
+    positions = array("q")
+    values = array("d")
+
+    series = -1
+    curve_type = "A01"
+    in_period = in_interval = False
+    period_start = period_end = resolution = None
+    position = value = None
+
+    for event, elem in ET.iterparse(io.BytesIO(xml_data), events=("start", "end")):
+        name = local_name(elem.tag)
+        if event == "start":
+            if name == "TimeSeries":
+                series += 1
+                curve_type = "A01"
+            elif name == "Period":
+                in_period = True
+                period_start = period_end = resolution = None
+                positions = array("q")
+                values = array("d")
+            elif name == "timeInterval" and in_period:
+                in_interval = True
+            elif name == "Point":
+                position = value = None
+            continue
+
+        if name == "start" and in_interval:
+            period_start = elem.text
+        elif name == "end" and in_interval:
+            period_end = elem.text
+        elif name == "timeInterval":
+            in_interval = False
+        elif name == "resolution" and in_period:
+            resolution = elem.text
+        elif name == "curveType":
+            curve_type = elem.text
+        elif name == "position":
+            position = elem.text
+        elif name == value_tag:
+            value = elem.text
+        elif name == "Point":
+            if position is not None and value is not None:
+                positions.append(int(position))
+                values.append(float(value))
+            elem.clear()
+        elif name == "Period":
+            in_period = False
+            elem.clear()
+            # Points without a usable period header are dropped, as before.
+            if period_start is None or resolution is None or not positions:
+                continue
+            step = parse_resolution(resolution)
+            start = np.datetime64(period_start.rstrip("Z"), "m")
+            period_positions = np.frombuffer(positions, dtype=np.int64)
+            period_values = np.frombuffer(values, dtype=np.float64)
+            if curve_type == "A03":
+                order = np.argsort(period_positions, kind="stable")
+                period_positions, period_values = period_positions[order], period_values[order]
+                if period_end is not None:
+                    end = np.datetime64(period_end.rstrip("Z"), "m")
+                    n_positions = int((end - start) // np.timedelta64(step, "m"))
+                else:
+                    n_positions = int(period_positions[-1])
+                period_positions, period_values = expand_variable_blocks(period_positions, period_values, n_positions)
+            series_ids.append(series)
+            starts.append(start)
+            resolutions.append(step)
+            counts.append(len(period_positions))
+            position_chunks.append(period_positions)
+            value_chunks.append(period_values)
+        elif name == "TimeSeries":
+            elem.clear()
+
+    counts = np.asarray(counts, dtype=np.int64)
+    return {
+        "series": np.repeat(np.asarray(series_ids, dtype=np.int32), counts),
+        "period_start": np.repeat(np.asarray(starts, dtype="datetime64[m]"), counts),
+        "resolution": np.repeat(np.asarray(resolutions, dtype=np.int32), counts),
+        "position": np.concatenate(position_chunks).astype(np.int32) if position_chunks else np.empty(0, np.int32),
+        "value": np.concatenate(value_chunks) if value_chunks else np.empty(0, np.float64),
+    }
+
+
+def point_timestamps(points):
+    """
+    Vectorized timestamp of every point: period_start + (position - 1) * resolution.
+    """
+    offsets = ((points["position"].astype(np.int64) - 1) * points["resolution"]).astype("timedelta64[m]")
+    return points["period_start"] + offsets
+
+
+def hourly_values(points, series_agg="mean"):
+    """
+    Rolls points of any resolution up to hourly values (UTC) and returns a
+    Series indexed by hour. With series_agg="mean" every point in the hour is
+    averaged in one groupby; otherwise each TimeSeries is averaged first and
+    overlapping TimeSeries are combined with series_agg (e.g. "max").
+    """
+    hours = point_timestamps(points).astype("datetime64[h]").astype("datetime64[ns]")
+    df = pd.DataFrame({"series": points["series"], "timestamp": hours, "value": points["value"]})
+    if series_agg == "mean":
+        return df.groupby("timestamp")["value"].mean()
+    per_series = df.groupby(["timestamp", "series"])["value"].mean()
+    return per_series.groupby(level="timestamp").agg(series_agg)
@@ -0,0 +1,85 @@
+COUNTRY_CODES = {
+    "Albania": ["10YAL-KESH-----5"],
+    "Austria": ["10YAT-APG------L"],
+    "Belgium": ["10YBE----------2"],
+    "Bosnia_and_Herzegovina": ["10YBA-JPCC-----D"],
+    "Bulgaria": ["10YCA-BULGARIA-R"],
+    "Croatia": ["10YHR-HEP------M"],
+    "Czech_Republic": ["10YCZ-CEPS-----N"],
+    "Denmark": ["10Y1001A1001A65H", "10Y1001A1001A64J", "10YDK-1--------W", "10YDK-2--------M"],
+    "Estonia": ["10Y1001A1001A39I"],
+    "Finland": ["10YFI-1--------U"],
+    "France": ["10YFR-RTE------C"],
+    "Georgia": ["10Y1001A1001B012"],
+    "Germany": ["10Y1001A1001A83F", "10Y1001A1001A63L", "10YDE-ENBW-----N", "10YDE-EON------1", "10YDE-RWENET---I", "10YDE-VE-------2"],
+    "Greece": ["10YGR-HTSO-----Y"],
+    "Hungary": ["10YHU-MAVIR----U"],
+    "Ireland": ["10Y1001A1001A016", "10YIE-1001A00010", "10Y1001A1001A59C", "10Y1001A1001A63L"],
+    "Italy": ["10Y1001A1001A67D", "10Y1001A1001A68B", "10Y1001A1001A70O", "10Y1001A1001A71M", "10Y1001A1001A75E", "10Y1001A1001A74G", "10Y1001A1001A73I", "10Y1001A1001A788", "10Y1001A1001A796"],
+    "Kosovo": ["10Y1001C--00100H"],
+    "Latvia": ["10YLV-1001A00074"],
+    "Lithuania": ["10YLT-1001A0008Q"],
+    "Luxembourg": ["10YLU-CEGEDEL-NQ"],
+    "Montenegro": ["10YCS-CG-TSO---S"],
+    "Netherlands": ["10YNL----------L"],
+    "North_Macedonia": ["10YMK-MEPSO----8"],
+    "Norway": ["10YNO-0--------C", "10YNO-1--------2", "10YNO-2--------T", "10YNO-3--------J", "10YNO-4--------9", "10Y1001A1001A48H"],
+    "Poland": ["10YPL-AREA-----S"],
+    "Portugal": ["10YPT-REN------W"],
+    "Romania": ["10YRO-TEL------P"],
+    "Serbia": ["10YCS-SERBIATSOV"],
+    "Spain": ["10YES-REE------0"],
+    "Sweden": ["10Y1001A1001A44P", "10Y1001A1001A45N", "10Y1001A1001A46L", "10Y1001A1001A47J"],
+    "Switzerland": ["10YCH-SWISSGRIDZ"]
+}
+
+# Zones that together partition each split country, so per-zone series can be
+# summed into a country total without double counting. Aggregate codes from
+# COUNTRY_CODES (e.g. the whole-country or coupled-market areas) are left out.
+BIDDING_ZONES = {
+    "Denmark": {"DK1": "10YDK-1--------W", "DK2": "10YDK-2--------M"},
+    "Germany": {
+        "50Hertz": "10YDE-VE-------2",
+        "Amprion": "10YDE-RWENET---I",
+        "TenneT": "10YDE-EON------1",
+        "TransnetBW": "10YDE-ENBW-----N",
+    },
+    "Ireland": {"IE": "10YIE-1001A00010", "NI": "10Y1001A1001A016"},
+    "Italy": {
+        "IT-North": "10Y1001A1001A73I",
+        "IT-Centre-North": "10Y1001A1001A70O",
+        "IT-Centre-South": "10Y1001A1001A71M",
+        "IT-South": "10Y1001A1001A788",
+        "IT-Calabria": "10Y1001C--00096J",
+        "IT-Sicily": "10Y1001A1001A75E",
+        "IT-Sardinia": "10Y1001A1001A74G",
+    },
+    "Norway": {
+        "NO1": "10YNO-1--------2",
+        "NO2": "10YNO-2--------T",
+        "NO3": "10YNO-3--------J",
+        "NO4": "10YNO-4--------9",
+        "NO5": "10Y1001A1001A48H",
+    },
+    "Sweden": {
+        "SE1": "10Y1001A1001A44P",
+        "SE2": "10Y1001A1001A45N",
+        "SE3": "10Y1001A1001A46L",
+        "SE4": "10Y1001A1001A47J",
+    },
+}
+
+# First local day of zones introduced after the others; before it the
+# remaining zones of the country partition it on their own.
+ZONE_SINCE = {
+    # Split from IT-South in the 2021 Italian zone reconfiguration.
+    "10Y1001C--00096J": "2021-01-01",
+}
+
+# Day-ahead prices are published per bidding zone, which for some countries is
+# not the first code in COUNTRY_CODES (DE-LU since Oct 2018, the Irish SEM).
+PRICE_COUNTRY_CODES = {
+    **COUNTRY_CODES,
+    "Germany": ["10Y1001A1001A82H", "10Y1001A1001A63L"],
+    "Ireland": ["10Y1001A1001A59C", "10YIE-1001A00010"],
+}
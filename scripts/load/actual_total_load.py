@@ -1,19 +1,22 @@
 import os
-import requests
+import sys
+import argparse
 import pandas as pd
 from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
-from dotenv import load_dotenv
-import time  # For retries
-import requests_cache
 
-requests_cache.clear()
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-load_dotenv()
+from scripts.common import catalog, instrumentation
+from scripts.ingestion.backfill import run_backfill
+from scripts.ingestion.fetch_engine import FetchEngine, fetch_first_available
+from scripts.ingestion.incremental import incremental_update, save_high_water_marks
+from scripts.ingestion.multizone import fetch_with_zones, save_zones
+from scripts.ingestion.xml_decoder import decode_points, hourly_values
+from scripts.ingestion.zones import BIDDING_ZONES, COUNTRY_CODES as country_codes
 
 # Constants
-API_KEY = os.getenv("API_KEY")
-BASE_URL = "https://web-api.tp.entsoe.eu/api"
 days_back = 365  
 last_day = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
 end_date = datetime.strptime(last_day, "%Y-%m-%d")
@@ -23,103 +26,24 @@ utc_start = (start_date - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M
 utc_end = ((end_date + timedelta(days=1)) - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M")
 
 current_time = datetime.now()
-
-country_codes = {
-    "Albania": ["10YAL-KESH-----5"],
-    "Austria": ["10YAT-APG------L"],
-    "Belgium": ["10YBE----------2"],
-    "Bosnia_and_Herzegovina": ["10YBA-JPCC-----D"],
-    "Bulgaria": ["10YCA-BULGARIA-R"],
-    "Croatia": ["10YHR-HEP------M"],
-    "Czech_Republic": ["10YCZ-CEPS-----N"],
-    "Denmark": ["10Y1001A1001A65H", "10Y1001A1001A64J", "10YDK-1--------W", "10YDK-2--------M"],
-    "Estonia": ["10Y1001A1001A39I"],
-    "Finland": ["10YFI-1--------U"],
-    "France": ["10YFR-RTE------C"],
-    "Georgia": ["10Y1001A1001B012"],
-    "Germany": ["10Y1001A1001A83F", "10Y1001A1001A63L", "10YDE-ENBW-----N", "10YDE-EON------1", "10YDE-RWENET---I", "10YDE-VE-------2"],
-    "Greece": ["10YGR-HTSO-----Y"],
-    "Hungary": ["10YHU-MAVIR----U"],
-    "Ireland": ["10Y1001A1001A016", "10YIE-1001A00010", "10Y1001A1001A59C", "10Y1001A1001A63L"],
-    "Italy": ["10Y1001A1001A67D", "10Y1001A1001A68B", "10Y1001A1001A70O", "10Y1001A1001A71M", "10Y1001A1001A75E", "10Y1001A1001A74G", "10Y1001A1001A73I", "10Y1001A1001A788", "10Y1001A1001A796"],
-    "Kosovo": ["10Y1001C--00100H"],
-    "Latvia": ["10YLV-1001A00074"],
-    "Lithuania": ["10YLT-1001A0008Q"],
-    "Luxembourg": ["10YLU-CEGEDEL-NQ"],
-    "Montenegro": ["10YCS-CG-TSO---S"],
-    "Netherlands": ["10YNL----------L"],
-    "North_Macedonia": ["10YMK-MEPSO----8"],
-    "Norway": ["10YNO-0--------C", "10YNO-1--------2", "10YNO-2--------T", "10YNO-3--------J", "10YNO-4--------9", "10Y1001A1001A48H"],
-    "Poland": ["10YPL-AREA-----S"],
-    "Portugal": ["10YPT-REN------W"],
-    "Romania": ["10YRO-TEL------P"],
-    "Serbia": ["10YCS-SERBIATSOV"],
-    "Spain": ["10YES-REE------0"],
-    "Sweden": ["10Y1001A1001A44P", "10Y1001A1001A45N", "10Y1001A1001A46L", "10Y1001A1001A47J"],
-    "Switzerland": ["10YCH-SWISSGRIDZ"]
-}
-
-def fetch_actual_total_load(start_str, end_str, country_code):
-    """
-    Fetches Actual Total Load data from the ENTSO-E API using documentType=A65 and processType=A16.
-    """
-    url = (f"{BASE_URL}?documentType=A65&processType=A16&outBiddingZone_Domain={country_code}"
-           f"&periodStart={start_str}&periodEnd={end_str}&securityToken={API_KEY}")
-    print("Requesting Actual Total Load URL:")
-    print(url)
-    retries = 3
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            print(f"Attempt {attempt+1}: Status Code: {response.status_code}")
-            if response.status_code == 200:
-                print("Response snippet (first 500 chars):")
-                print(response.text[:500])
-                return response.text
-            else:
-                print(f"Error {response.status_code}: {response.text}")
-        except requests.RequestException as e:
-            print(f"Attempt {attempt+1}/{retries} failed: {e}")
-            time.sleep(2)
-    return None
+FILE_PREFIX = "all_countries_actual_total_load"
 
 def parse_and_format_data(xml_data, country_name, timezone_offset):
     try:
-        root = ET.fromstring(xml_data)
-        ns = {'ns': 'urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0'}
-        time_series = root.findall('.//ns:TimeSeries', ns)
-        print(f"For {country_name}, found {len(time_series)} TimeSeries elements.")
-        
-        formatted_data = []
-        for ts in time_series:
-            time_period = ts.find('.//ns:Period', ns)
-            if time_period is None:
-                continue
-            period_start_el = time_period.find('.//ns:timeInterval/ns:start', ns)
-            if period_start_el is None:
-                continue
-            period_start = period_start_el.text  # e.g., "2025-02-03T23:00Z"
-            points = time_period.findall('.//ns:Point', ns)
-            print(f"For {country_name}, found {len(points)} Point elements.")
-            for point in points:
-                pos_el = point.find('.//ns:position', ns)
-                quantity_el = point.find('.//ns:quantity', ns)
-                if pos_el is None or quantity_el is None:
-                    continue
-                position = int(pos_el.text)
-                quantity = quantity_el.text
-                timestamp_utc = datetime.strptime(period_start, "%Y-%m-%dT%H:%MZ") + timedelta(hours=position - 1)
-                timestamp_local = timestamp_utc + timedelta(hours=timezone_offset)
-                if timestamp_local > current_time:
-                    continue
-                formatted_data.append({
-                    'timestamp': timestamp_local,
-                    'load_value': quantity,
-                    'day_of_week': timestamp_local.weekday(),
-                    'country': country_name,
-                    'data_type': 'actual_load'
-                })
-        df = pd.DataFrame(formatted_data)
+        points = decode_points(xml_data)
+        print(f"For {country_name}, decoded {len(points['value'])} Point elements "
+              f"(resolutions: {sorted(set(points['resolution'].tolist()))} min).")
+        hourly = hourly_values(points)
+        timestamps = hourly.index + pd.Timedelta(hours=timezone_offset)
+        keep = timestamps <= current_time
+        timestamps = timestamps[keep]
+        df = pd.DataFrame({
+            'timestamp': timestamps,
+            'load_value': hourly.values[keep],
+            'day_of_week': timestamps.dayofweek,
+            'country': country_name,
+            'data_type': 'actual_load'
+        })
         if df.empty:
             print("Warning: The parsed DataFrame is empty for", country_name)
         else:
@@ -132,29 +56,66 @@ def parse_and_format_data(xml_data, country_name, timezone_offset):
         return pd.DataFrame()
 
 
-all_data = []
-for country_name, codes in country_codes.items():
-    for country_code in codes:
-        print(f"\nFetching Actual Total Load data for {country_name} ({country_code})...")
-        xml_data = fetch_actual_total_load(utc_start, utc_end, country_code)
-        if xml_data:
-            df = parse_and_format_data(xml_data, country_name, timezone_offset)
-            if not df.empty:
-                print(f"Preview of formatted DataFrame for {country_name}:")
-                print(df.head())
-                all_data.append(df)
-                break
-            else:
-                print(f"Parsed DataFrame for {country_name} is empty.")
-        else:
-            print(f"No XML data returned for {country_name} using code {country_code}.")
+def parse_load(xml_data, country_name):
+    return parse_and_format_data(xml_data, country_name, timezone_offset)
+
+def main(incremental=False, backfill_start=None, chunk_days=None, allow_partial=False, zones=False):
+    engine = FetchEngine()
+    output_dir = os.path.join(base_dir, "data", "load")
+    os.makedirs(output_dir, exist_ok=True)
+
+    if backfill_start:
+        run_backfill(engine, "actual_load", "actual_load", country_codes, parse_load, output_dir, FILE_PREFIX,
+                     backfill_start, end_date, timezone_offset, chunk_days, allow_partial)
+        engine.client.report()
+        return
+
+    if incremental:
+        updated = incremental_update(
+            "actual_load", output_dir, FILE_PREFIX, country_codes, start_date, end_date, timezone_offset,
+            lambda windows: fetch_first_available(engine, "actual_load", country_codes, None, None, parse_load, windows=windows)
+        )
+        if updated is not None:
+            engine.client.report()
+            return
+
+    print(f"Fetching Actual Total Load for {len(country_codes)} countries "
+          f"({engine.max_workers} workers)...")
+    zone_df = None
+    if zones:
+        all_data, zone_df = fetch_with_zones(engine, "actual_load", "load_value", country_codes, BIDDING_ZONES,
+                                             utc_start, utc_end, parse_load)
+    else:
+        all_data = fetch_first_available(engine, "actual_load", country_codes, utc_start, utc_end, parse_load)
+
+    engine.client.report()
+
+    if all_data:
+        final_df = pd.concat(all_data, ignore_index=True)
+        final_df['timestamp'] = pd.to_datetime(final_df['timestamp'], errors='coerce')
+        final_df = final_df.sort_values(by='timestamp').dropna(subset=['timestamp'])
+        output_path = os.path.join(output_dir, f"{FILE_PREFIX}_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv.gz")
+        final_df.to_csv(output_path, index=False, compression='gzip')
+        instrumentation.record_written(output_path, len(final_df))
+        catalog.register(base_dir, "load", output_path, final_df)
+        save_high_water_marks("actual_load", final_df.groupby('country')['timestamp'].max().to_dict())
+        save_zones(zone_df, output_path, "Actual Total Load")
+        print(f"Saved Actual Total Load data to {output_path}")
+    else:
+        print("No Actual Total Load data available.")
 
-if all_data:
-    final_df = pd.concat(all_data, ignore_index=True)
-    final_df['timestamp'] = pd.to_datetime(final_df['timestamp'], errors='coerce')
-    final_df = final_df.sort_values(by='timestamp').dropna(subset=['timestamp'])
-    output_path = os.path.join("..", "..", "data", "load", f"all_countries_actual_total_load_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv.gz")
-    final_df.to_csv(output_path, index=False, compression='gzip')
-    print(f"Saved Actual Total Load data to {output_path}")
-else:
-    print("No Actual Total Load data available.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch ENTSO-E Actual Total Load for all countries.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch hours after the stored high-water mark and upsert them")
+    parser.add_argument("--backfill-start", metavar="YYYY-MM-DD",
+                        help="fetch history from this date in checkpointed chunks (resumable)")
+    parser.add_argument("--chunk-days", type=int,
+                        help="backfill chunk size in days (default: calendar months)")
+    parser.add_argument("--allow-partial", action="store_true",
+                        help="save the backfilled chunks even if some failed (rerun later to fill them)")
+    parser.add_argument("--zones", action="store_true",
+                        help="fetch every bidding zone of split countries and sum them into country totals")
+    args = parser.parse_args()
+    main(incremental=args.incremental, backfill_start=args.backfill_start, chunk_days=args.chunk_days,
+         allow_partial=args.allow_partial, zones=args.zones)
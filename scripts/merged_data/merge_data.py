@@ -1,22 +1,60 @@
 import os
 import sys
+import argparse
+from typing import NamedTuple
+
 import pandas as pd
 from datetime import datetime
 
-def get_single_file(directory):
-    try:
-        files = [f for f in os.listdir(directory) if f.endswith(".csv.gz")]
-        if files:
-            files.sort() 
-            return os.path.join(directory, files[0])
-        else:
-            return None
-    except Exception as e:
-        print(f"Error listing files in {directory}: {e}")
-        return None
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-def main():
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+from scripts.common import catalog
+from scripts.common.schema import apply_schema, bytes_per_row, to_timestamps
+from scripts.common.storage import (CHUNK_ROWS, DatasetWriter, Spool, dataset_extension, merged_location,
+                                    remove_dataset, write_dataset)
+from scripts.ingestion.incremental import KEY_COLUMNS, iter_upserted_chunks, read_upserted, upsert
+
+PRICE_COLUMNS = ["timestamp", "country", "day_of_week", "measurement_type",
+                 "measurement", "measurement_unit", "hour", "day", "month", "year"]
+
+class MergeResult(NamedTuple):
+    long: pd.DataFrame
+    wide: pd.DataFrame
+
+def build_wide(frames):
+    """
+    Aligns the per-source frames on (country, timestamp) into one row per
+    country and hour with a column per measurement. Each source is reduced to
+    one value per key and sorted once, then joined with sorted outer merges.
+    """
+    keys = ["country", "timestamp"]
+    wide = None
+    for df, column in frames:
+        if column not in df.columns or df.empty:
+            continue
+        part = df[keys + [column]].copy()
+        part["timestamp"] = to_timestamps(part["timestamp"])
+        part = part.dropna(subset=["timestamp"])
+        part = part.groupby(keys, sort=True)[column].mean().reset_index()
+        wide = part if wide is None else wide.merge(part, on=keys, how="outer", sort=True)
+
+    if wide is None:
+        return pd.DataFrame(columns=keys)
+    wide["day_of_week"] = wide["timestamp"].dt.dayofweek
+    wide["hour"] = wide["timestamp"].dt.hour
+    wide["day"] = wide["timestamp"].dt.day
+    wide["month"] = wide["timestamp"].dt.month
+    wide["year"] = wide["timestamp"].dt.year
+    return apply_schema(wide)
+
+def source_files(base_dir: str) -> tuple:
+    """
+    Paths of the latest load, generation and price datasets in the catalog;
+    price is None when there is none. Exits when load or generation data is
+    missing.
+    """
     print("Base directory:", base_dir)
     
     # Directories for each dataset
@@ -24,13 +62,9 @@ def main():
     generation_dir = os.path.join(base_dir, "data", "generation")
     price_dir = os.path.join(base_dir, "data", "price")
     
-    print("Load directory:", load_dir)
-    print("Generation directory:", generation_dir)
-    print("Price directory:", price_dir)
-    
-    load_file = get_single_file(load_dir)
-    generation_file = get_single_file(generation_dir)
-    price_file = get_single_file(price_dir)
+    load_file = catalog.latest(base_dir, "load")
+    generation_file = catalog.latest(base_dir, "generation")
+    price_file = catalog.latest(base_dir, "price")
     
     if load_file:
         print("Found load file:", load_file)
@@ -46,25 +80,30 @@ def main():
     
     if price_file:
         print("Found price file:", price_file)
+    else:
+        print(f"Warning: No price CSV file found in {price_dir}. Price data will be skipped.")
+    return load_file, generation_file, price_file
+
+def read_sources(base_dir: str) -> tuple:
+    """
+    Reads the latest load, generation and price datasets (with upserts
+    applied). Exits when load or generation data is missing.
+    """
+    load_file, generation_file, price_file = source_files(base_dir)
+
+    if price_file:
         try:
-            df_price = pd.read_csv(price_file, compression="gzip")
+            df_price = read_upserted(price_file)
             print(f"Loaded price data with {df_price.shape[0]} rows.")
         except Exception as e:
             print(f"Error loading price file: {e}")
-            df_price = pd.DataFrame(columns=[
-                "timestamp", "country", "day_of_week", "measurement_type",
-                "measurement", "measurement_unit", "hour", "day", "month", "year"
-            ])
+            df_price = pd.DataFrame(columns=PRICE_COLUMNS)
     else:
-        print(f"Warning: No price CSV file found in {price_dir}. Price data will be skipped.")
-        df_price = pd.DataFrame(columns=[
-            "timestamp", "country", "day_of_week", "measurement_type",
-            "measurement", "measurement_unit", "hour", "day", "month", "year"
-        ])
+        df_price = pd.DataFrame(columns=PRICE_COLUMNS)
 
     try:
         print("Loading load data from:", load_file)
-        df_load = pd.read_csv(load_file, compression="gzip")
+        df_load = read_upserted(load_file)
         print(f"Loaded load data with {df_load.shape[0]} rows.")
     except Exception as e:
         print(f"Error loading load file: {e}")
@@ -72,12 +111,20 @@ def main():
     
     try:
         print("Loading generation data from:", generation_file)
-        df_generation = pd.read_csv(generation_file, compression="gzip")
+        df_generation = read_upserted(generation_file)
         print(f"Loaded generation data with {df_generation.shape[0]} rows.")
     except Exception as e:
         print(f"Error loading generation file: {e}")
         sys.exit(1)
     
+    return df_load, df_generation, df_price
+
+def merge_frames(df_load: pd.DataFrame, df_generation: pd.DataFrame, df_price: pd.DataFrame,
+                 verbose: bool = True) -> MergeResult:
+    """
+    Builds the long merged table (one row per measurement) and the wide
+    (country, timestamp) table from the source frames.
+    """
     if 'data_type' in df_load.columns:
         df_load.rename(columns={'data_type': 'measurement_type'}, inplace=True)
     else:
@@ -116,19 +163,133 @@ def main():
     merged_df['month'] = merged_df['timestamp'].dt.month
     merged_df['year'] = merged_df['timestamp'].dt.year
     
-    merged_df.sort_values(by=["timestamp", "country"], inplace=True)
+    # Stable, so rows of one (timestamp, country) keep the source order; the chunked merge relies on it.
+    merged_df.sort_values(by=["timestamp", "country"], inplace=True, kind="stable")
 
-    merged_dir = os.path.join(base_dir, "data", "merged_data")
-    os.makedirs(merged_dir, exist_ok=True)
-    merged_output_path = os.path.join(merged_dir, f"merged_dataset_{datetime.now().strftime('%Y%m%d')}.csv.gz")
-    
+    raw_bytes = bytes_per_row(merged_df)
+    merged_df = apply_schema(merged_df)
+    wide_df = build_wide([(df_load, 'load_value'), (df_generation, 'generation_forecast'), (df_price, 'energy_price')])
+    if verbose:
+        print(f"Memory per row: {raw_bytes:.0f} bytes before schema, {bytes_per_row(merged_df):.0f} bytes after "
+              f"({merged_df.memory_usage(deep=True).sum() / 1e6:.1f} MB total).")
+        print(f"Wide dataset: {len(wide_df)} (country, timestamp) rows for {len(merged_df)} long rows, "
+              f"{bytes_per_row(wide_df):.0f} bytes per row.")
+    return MergeResult(merged_df, wide_df)
+
+def save_merged(result: MergeResult, base_dir: str) -> MergeResult:
+    """
+    Writes both merged tables, replacing today's outputs, and returns their paths.
+    """
+    merged_df, wide_df = result
+    merged_output_base, wide_output_base = output_bases(base_dir)
+    merged_output_path = merged_output_base + dataset_extension()
 
     if os.path.exists(merged_output_path):
-        os.remove(merged_output_path)
+        remove_dataset(merged_output_path)
         print(f"Existing file at {merged_output_path} removed.")
     
-    merged_df.to_csv(merged_output_path, index=False, compression="gzip")
+    write_dataset(merged_df, merged_output_base, partitioned=True)
+    catalog.register(base_dir, catalog.merged_kind("long"), merged_output_path, merged_df)
     print(f"Merged dataset saved to {merged_output_path}")
-    
+
+    remove_dataset(wide_output_base + dataset_extension())
+    wide_output_path = write_dataset(wide_df, wide_output_base)
+    catalog.register(base_dir, catalog.merged_kind("wide"), wide_output_path, wide_df)
+    print(f"Wide dataset saved to {wide_output_path}")
+    return MergeResult(merged_output_path, wide_output_path)
+
+def output_bases(base_dir: str) -> tuple:
+    """
+    Output paths (without extension) of today's long and wide merged datasets.
+    """
+    merged_dir = os.path.join(base_dir, "data", "merged_data")
+    os.makedirs(merged_dir, exist_ok=True)
+    wide_dir, wide_prefix = merged_location(base_dir, "wide")
+    os.makedirs(wide_dir, exist_ok=True)
+    today = datetime.now().strftime('%Y%m%d')
+    return os.path.join(merged_dir, f"merged_dataset_{today}"), os.path.join(wide_dir, f"{wide_prefix}{today}")
+
+def merge_stage(base_dir: str) -> MergeResult:
+    result = merge_frames(*read_sources(base_dir))
+    save_merged(result, base_dir)
+    return result
+
+def month_key(timestamps: pd.Series) -> pd.Series:
+    # "YYYY-MM" of the stored wall-clock timestamps; months sort like the
+    # timestamps and rows without one go last, like NaT in the sort.
+    return timestamps.astype(str).str[:7].where(timestamps.notna(), "NaT")
+
+def merge_chunked(base_dir: str, chunk_rows: int) -> MergeResult:
+    """
+    Out-of-core merge with the same output as merge_stage. The sources are
+    streamed in chunks of chunk_rows and spooled to disk by month; every step
+    of the merge (upserts, the sort, the wide alignment) only relates rows of
+    the same timestamp, so each month is merged on its own and appended in
+    order. The wide table is ordered by country, so its monthly parts are
+    spooled again and written country by country. Returns the output paths.
+    """
+    sources = dict(zip(["load", "generation", "price"], source_files(base_dir)))
+    merged_output_base, wide_output_base = output_bases(base_dir)
+
+    with Spool() as spool:
+        members = {name: [] for name in sources}
+        templates = {}
+        months = set()
+        for name, path in sources.items():
+            if path is None:
+                templates[name] = pd.DataFrame(columns=PRICE_COLUMNS)
+                continue
+            templates[name] = pd.read_csv(path, nrows=0)
+            for member, chunk in iter_upserted_chunks(path, chunk_rows):
+                templates[name] = chunk.iloc[:0]
+                if member not in members[name]:
+                    members[name].append(member)
+                for month, part in chunk.groupby(month_key(chunk["timestamp"]), sort=False):
+                    months.add(month)
+                    spool.append((name, month, member), part)
+        months = sorted(months)
+        print(f"Spooled {len(sources)} sources into {len(months)} monthly partitions.")
+
+        merged_writer = DatasetWriter(merged_output_base, partitioned=True)
+        countries = []
+        long_rows = 0
+        for month in months:
+            frames = []
+            for name in sources:
+                parts = [spool.read((name, month, member)).reset_index(drop=True) for member in members[name]
+                         if (name, month, member) in spool.templates]
+                frames.append(upsert(parts, [c for c in KEY_COLUMNS if c in parts[0].columns]) if parts
+                              else templates[name].copy())
+            merged_df, wide_df = merge_frames(*frames, verbose=False)
+            merged_writer.write(merged_df)
+            long_rows += len(merged_df)
+            for country, part in wide_df.groupby("country", sort=False, observed=True):
+                if country not in countries:
+                    countries.append(country)
+                spool.append(("wide", country), part)
+        merged_output_path = merged_writer.close()
+        catalog.register(base_dir, catalog.merged_kind("long"), merged_output_path, rows=merged_writer.rows,
+                         start=merged_writer.start, end=merged_writer.end, schema=merged_writer.schema)
+        print(f"Merged dataset saved to {merged_output_path} ({long_rows} rows)")
+
+        wide_writer = DatasetWriter(wide_output_base)
+        for country in sorted(countries):
+            wide_writer.write(apply_schema(spool.read(("wide", country))))
+        wide_output_path = wide_writer.close()
+        catalog.register(base_dir, catalog.merged_kind("wide"), wide_output_path, rows=wide_writer.rows,
+                         start=wide_writer.start, end=wide_writer.end, schema=wide_writer.schema)
+        print(f"Wide dataset saved to {wide_output_path} ({wide_writer.rows} rows)")
+    return MergeResult(merged_output_path, wide_output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the load, generation and price datasets.")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="stream the sources in chunks of this many rows and merge month by month (0: in memory)")
+    args = parser.parse_args()
+    if args.chunk_rows:
+        merge_chunked(base_dir, args.chunk_rows)
+    else:
+        merge_stage(base_dir)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import json
+import math
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import NamedTuple
+
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import instrumentation
+
+# Every trained model is kept here as a numbered version of its name.
+REGISTRY_DIR = os.path.join("models", "registry")
+REGISTRY_NAME = "registry.sqlite"
+# A retrain is promoted to serving only when its RMSE is no worse than the
+# serving model's (on the same rows when it could be rescored). Setting this
+# fraction above 0 also promotes retrains that are up to that much worse.
+PROMOTION_TOLERANCE = float(os.getenv("PROMOTION_TOLERANCE", "0"))
+# Fixed-path copies of the serving version of a name, for consumers that do
+# not read the registry; rewritten whenever the serving version changes.
+SERVING_FILES = {
+    "generation_forecast": os.path.join("models", "xgboost_generation_forecast_model.joblib"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rmse REAL,
+    serving_rmse REAL,
+    metrics TEXT,
+    params TEXT,
+    data_version TEXT,
+    run_id TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (name, version)
+);
+CREATE INDEX IF NOT EXISTS models_status ON models (name, status);
+"""
+
+
+class Registration(NamedTuple):
+    name: str
+    version: int
+    path: str
+    promoted: bool
+
+
+def registry_dir(base_dir):
+    return os.path.join(base_dir, REGISTRY_DIR)
+
+
+def connect(base_dir):
+    path = os.path.join(registry_dir(base_dir), REGISTRY_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def model_path(base_dir, name, version, suffix=".joblib"):
+    # Names like "generation_forecast/DE" become one directory per name.
+    directory = os.path.join(registry_dir(base_dir), *[re.sub(r"[^\w.-]", "_", part) for part in name.split("/")])
+    return os.path.join(directory, f"v{version:04d}{suffix}")
+
+
+def save_model_file(model, base_dir, name, version):
+    """
+    Boosters are saved in XGBoost's own UBJ format, which loads without
+    unpickling and across XGBoost versions; other models with joblib.
+    """
+    import joblib
+    import xgboost as xgb
+
+    native = isinstance(model, xgb.Booster)
+    path = model_path(base_dir, name, version, ".ubj" if native else ".joblib")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if native:
+        model.save_model(path)
+    else:
+        joblib.dump(model, path)
+    instrumentation.record_written(path)
+    return path
+
+
+def load_model_file(path):
+    import joblib
+    import xgboost as xgb
+
+    return xgb.Booster(model_file=path) if path.endswith(".ubj") else joblib.load(path)
+
+
+def publish(base_dir, name, model):
+    """
+    Writes model to the serving file of name, if it has one, and returns its path.
+    """
+    import joblib
+
+    if name not in SERVING_FILES:
+        return None
+    path = os.path.join(base_dir, SERVING_FILES[name])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    instrumentation.record_written(path)
+    return path
+
+
+def serving(base_dir, name):
+    """
+    The registry row of the serving version of name as a dict, or None.
+    """
+    connection = connect(base_dir)
+    with connection:
+        row = connection.execute("SELECT * FROM models WHERE name = ? AND status = 'serving'", (name,)).fetchone()
+    connection.close()
+    return dict(row) if row is not None else None
+
+
+def load_model(base_dir, name, version=None):
+    """
+    The serving model of name (or the given version); None when there is none.
+    """
+    connection = connect(base_dir)
+    with connection:
+        if version is None:
+            row = connection.execute("SELECT path FROM models WHERE name = ? AND status = 'serving'", (name,)).fetchone()
+        else:
+            row = connection.execute("SELECT path FROM models WHERE name = ? AND version = ?", (name, version)).fetchone()
+    connection.close()
+    return load_model_file(os.path.join(base_dir, row["path"])) if row is not None else None
+
+
+def should_promote(rmse, serving_row, serving_rmse=None, tolerance=PROMOTION_TOLERANCE):
+    if rmse is None or not math.isfinite(rmse):
+        return False
+    if serving_row is None:
+        return True
+    baseline = serving_rmse if serving_rmse is not None else serving_row["rmse"]
+    return baseline is None or not math.isfinite(baseline) or rmse <= baseline * (1 + tolerance)
+
+
+def register(base_dir, name, model, rmse, metrics=None, params=None, data_version=None, serving_rmse=None):
+    """
+    Stores model as the next version of name and promotes it to serving when
+    should_promote says so; the former serving version is then retired.
+    A rejected version is kept, but the serving model is left as it is.
+    serving_rmse is the serving model's RMSE on the new model's validation
+    rows, when the caller could compute it; its recorded RMSE is used otherwise.
+    """
+    connection = connect(base_dir)
+    with connection:
+        version = connection.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM models WHERE name = ?",
+                                     (name,)).fetchone()[0]
+        path = save_model_file(model, base_dir, name, version)
+
+        current = connection.execute("SELECT * FROM models WHERE name = ? AND status = 'serving'", (name,)).fetchone()
+        promoted = should_promote(rmse, current, serving_rmse)
+        if promoted and current is not None:
+            connection.execute("UPDATE models SET status = 'retired' WHERE name = ? AND version = ?",
+                               (name, current["version"]))
+        connection.execute(
+            "INSERT INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, version, os.path.relpath(path, base_dir), "serving" if promoted else "rejected",
+             None if rmse is None else float(rmse), None if serving_rmse is None else float(serving_rmse),
+             json.dumps(metrics or {}), json.dumps(params or {}, default=str), data_version,
+             os.getenv("PIPELINE_RUN_ID"), datetime.now().isoformat(timespec="microseconds")))
+    connection.close()
+    if promoted:
+        publish(base_dir, name, model)
+    return Registration(name, version, path, promoted)
+
+
+def promote(base_dir, name, version):
+    """
+    Makes a registered version the serving one, e.g. to roll back, and
+    rewrites the serving file of name with it.
+    """
+    connection = connect(base_dir)
+    with connection:
+        found = connection.execute("SELECT 1 FROM models WHERE name = ? AND version = ?", (name, version)).fetchone()
+        if found is not None:
+            connection.execute("UPDATE models SET status = 'retired' WHERE name = ? AND status = 'serving'", (name,))
+            connection.execute("UPDATE models SET status = 'serving' WHERE name = ? AND version = ?", (name, version))
+    connection.close()
+    if found is None:
+        print(f"Error: {name} has no version {version}.")
+        sys.exit(1)
+    publish(base_dir, name, load_model(base_dir, name, version))
+
+
+def versions(base_dir, name=None):
+    connection = connect(base_dir)
+    with connection:
+        query = "SELECT * FROM models" + (" WHERE name = ?" if name else "") + " ORDER BY name, version"
+        rows = [dict(row) for row in connection.execute(query, [name] if name else [])]
+    connection.close()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the registered models, or choose the serving version.")
+    parser.add_argument("name", nargs="?", help="only this model")
+    parser.add_argument("--promote", type=int, metavar="VERSION", help="make VERSION of NAME the serving model")
+    args = parser.parse_args()
+
+    if args.promote is not None:
+        if not args.name:
+            parser.error("--promote needs a model name")
+        promote(base_dir, args.name, args.promote)
+        print(f"{args.name} v{args.promote} is now serving.")
+        return
+    df = versions(base_dir, args.name)
+    print(df.drop(columns=["params"]).to_string(index=False) if not df.empty else "The registry is empty.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,128 +1,294 @@
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import sys
-from scipy.stats import zscore
+import argparse
+from typing import NamedTuple
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-merged_dir = os.path.join(base_dir, "data", "merged_data")
-merged_files = [f for f in os.listdir(merged_dir) if f.endswith(".csv.gz")]
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-if not merged_files:
-    print("\u26a0\ufe0f No merged dataset found in the merged_data directory. Risk detection cannot proceed.")
-    sys.exit(1)
-
-merged_files.sort()
-data_path = os.path.join(merged_dir, merged_files[0])
-
-df = pd.read_csv(data_path, compression='gzip')
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-print("🔍 Available columns in the dataset:", df.columns.tolist())
+from scripts.common import catalog, instrumentation, plotting
+from scripts.common.schema import TIMEZONE
+from scripts.common.storage import CHUNK_ROWS, MERGED_LAYOUT, Spool, iter_dataset, read_dataset
 
+risk_columns = ['timestamp', 'load_value', 'generation_forecast', 'energy_price']
 required_columns = ['load_value', 'generation_forecast', 'energy_price']
-missing_columns = [col for col in required_columns if col not in df.columns]
-
-if missing_columns:
-    print(f"\u26a0\ufe0f Required columns missing from dataset: {missing_columns}")
-    print("\u26a0\ufe0f Available columns:", df.columns.tolist())
-    sys.exit(1)
-
-numeric_cols = df.select_dtypes(include=[np.number]).columns 
-df_resampled = df.set_index('timestamp')[numeric_cols].resample('5D').mean().reset_index()
-
-df_resampled.reset_index(inplace=True)
-
-plots_dir = os.path.join(base_dir, "data", "plots")
-os.makedirs(plots_dir, exist_ok=True)
-
-# Graph 1: Actual Load vs Generation 
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (5-Day Avg)', color='blue', linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (5-Day Avg)', linestyle='dashed', color='orange', linewidth=2)
-ax2 = plt.gca().twinx()
-ax2.set_ylabel("Energy Price (€)")
-ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Energy Load (MW)", fontsize=14)
-plt.title("Actual Load, Generation Forecast, and Energy Price (5-Day Avg)", fontsize=16)
-
-lines, labels = plt.gca().get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-plt.legend(lines + lines2, labels + labels2, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot1_path = os.path.join(plots_dir, "actual_generation_forecast_price.png")
-plt.savefig(plot1_path)
-print(f"✅ Graph 1 saved to {plot1_path}")
-plt.show()
-
-# Graph 2: Actual Load vs Generation Forecast
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label="Actual Load (5-Day Avg)", color='blue', linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], linestyle='dashed', color='orange', linewidth=2, label='Generation Forecast (5-Day Avg)')
-ax2 = plt.gca().twinx()
-ax2.set_ylabel("Energy Price (€)")
-ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.5, label='Energy Price (5-Day Avg)')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Energy Load (MW)", fontsize=14)
-plt.title("Actual vs Generation Forecast (5-Day Avg)", fontsize=16)
-
-lines, labels = plt.gca().get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-plt.legend(lines + lines2, labels + labels2, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot2_path = os.path.join(plots_dir, "actual_vs_generation_forecast.png")
-plt.savefig(plot2_path)
-print(f"✅ Graph 2 saved to {plot2_path}")
-plt.show()
-
-# Risk Calculation
-forecast_dev_threshold = df['load_value'].mean() + 2.5 * df['generation_forecast'].std()
-df['risk_level'] = abs(df['load_value'] - df['generation_forecast']) + df['energy_price'].pct_change(fill_method=None).abs() * 100
-df['risk_flag'] = df['risk_level'] > forecast_dev_threshold
-
-df_resampled['baseline_risk'] = df_resampled['load_value'].rolling(window=5, min_periods=1).mean()
-df_resampled.loc[df['risk_flag'], 'baseline_risk'] = df_resampled.loc[df['risk_flag'], 'load_value']
-
-# Graph 3: Risk Visualization with Background
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (Muted)', color='blue', linestyle='dashed', alpha=0.3, linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (Muted)', linestyle='dashed', color='orange', alpha=0.3, linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
-plt.plot(df_resampled['timestamp'], df_resampled['baseline_risk'], label='Risk Level', linestyle='-', color='red', linewidth=3, alpha=1.0, marker='o')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Risk Level", fontsize=14)
-plt.title("Risk Detection Visualization (5-Day Avg)", fontsize=16)
-
-lines, labels = plt.gca().get_legend_handles_labels()
-plt.legend(lines, labels, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot3_path = os.path.join(plots_dir, "risk_visualization.png")
-plt.savefig(plot3_path)
-print(f"✅ Graph 3 saved to {plot3_path}")
-plt.show()
-
-risk_stats = pd.DataFrame({
-    "Metric": ["Mean Load Value", "Mean Generation Forecast", "Mean Energy Price", "Forecast Deviation Threshold"],
-    "Value": [df['load_value'].mean(), df['generation_forecast'].mean(), df['energy_price'].mean(), forecast_dev_threshold]
-})
-
-print("\n🔍 Risk Calculation Summary:\n")
-print(risk_stats.to_string(index=False))
-
-sys.exit(0)
-
-
-
-
-
-
-
-
-
-
-
+BUCKET = pd.Timedelta(days=5)
+# The chunked mode spools rows in blocks of this length; each holds several whole buckets.
+BLOCK = pd.Timedelta(days=30)
+EPOCH = pd.Timestamp("1970-01-01", tz=TIMEZONE)
+
+
+class RiskResult(NamedTuple):
+    resampled: pd.DataFrame
+    stats: pd.DataFrame
+
+
+def merged_path(base_dir=base_dir):
+    # The wide layout has load, generation and price on the same row per
+    # (country, timestamp), so the per-row risk terms below are defined.
+    merged_file = catalog.latest(base_dir, catalog.merged_kind(MERGED_LAYOUT))
+
+    if merged_file is None:
+        print("\u26a0\ufe0f No merged dataset found in the catalog. Risk detection cannot proceed.")
+        sys.exit(1)
+    return merged_file
+
+def merged_columns():
+    return risk_columns + (['country'] if MERGED_LAYOUT == 'wide' else [])
+
+def load_merged():
+    df = read_dataset(merged_path(), columns=merged_columns())
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def check_columns(columns):
+    print("🔍 Available columns in the dataset:", list(columns))
+
+    missing_columns = [col for col in required_columns if col not in columns]
+
+    if missing_columns:
+        print(f"\u26a0\ufe0f Required columns missing from dataset: {missing_columns}")
+        print("\u26a0\ufe0f Available columns:", list(columns))
+        sys.exit(1)
+
+def finish_risk(df_resampled: pd.DataFrame, bucket_flags: np.ndarray, means: dict, forecast_dev_threshold) -> RiskResult:
+    df_resampled.reset_index(inplace=True)
+    df_resampled['baseline_risk'] = df_resampled['load_value'].rolling(window=5, min_periods=1).mean()
+    df_resampled.loc[bucket_flags, 'baseline_risk'] = df_resampled.loc[bucket_flags, 'load_value']
+
+    risk_stats = pd.DataFrame({
+        "Metric": ["Mean Load Value", "Mean Generation Forecast", "Mean Energy Price", "Forecast Deviation Threshold"],
+        "Value": [means['load_value'], means['generation_forecast'], means['energy_price'], forecast_dev_threshold]
+    })
+    return RiskResult(df_resampled, risk_stats)
+
+def compute_risk(merged_df: pd.DataFrame) -> RiskResult:
+    """
+    5-day averages, per-row risk levels and the summary statistics. The
+    merged frame is only read, so it can be shared with other stages.
+    """
+    check_columns(merged_df.columns)
+
+    # Price changes are taken per country when rows are aligned per (country, timestamp).
+    wide = 'measurement_type' not in merged_df.columns and 'country' in merged_df.columns
+    df = merged_df[risk_columns + (['country'] if wide else [])]
+
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    df_resampled = df.set_index('timestamp')[numeric_cols].resample('5D').mean().reset_index()
+
+    # Risk Calculation
+    # Statistics are accumulated in float64 and kept as float32 like the
+    # columns, so compute_risk_chunked arrives at the same values.
+    means = {col: np.float32(df[col].astype('float64').mean()) for col in required_columns}
+    forecast_dev_threshold = means['load_value'] + 2.5 * np.float32(df['generation_forecast'].astype('float64').std())
+    if wide:
+        price_change = df.groupby('country', observed=True)['energy_price'].pct_change(fill_method=None)
+    else:
+        price_change = df['energy_price'].pct_change(fill_method=None)
+    risk_level = abs(df['load_value'] - df['generation_forecast']) + price_change.abs() * 100
+    risk_flag = risk_level > forecast_dev_threshold
+
+    # Flags are per row; a 5-day bucket is flagged when any of its rows is.
+    bucket_flags = risk_flag.set_axis(df['timestamp']).resample('5D').max().reindex(df_resampled['timestamp'], fill_value=False).fillna(False).astype(bool).to_numpy()
+    return finish_risk(df_resampled, bucket_flags, means, forecast_dev_threshold)
+
+class RunningMoments:
+    """
+    Count, sum and sum of squared deviations of a column over chunks,
+    combined with Chan et al.'s update, all in float64.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, values):
+        values = values[~np.isnan(values)].astype('float64')
+        if not len(values):
+            return
+        mean = values.mean()
+        delta = mean - self.mean
+        count = self.count + len(values)
+        self.m2 += ((values - mean) ** 2).sum() + delta ** 2 * self.count * len(values) / count
+        self.mean += delta * len(values) / count
+        self.total += values.sum()
+        self.count = count
+
+    def average(self):
+        return np.float32(self.total / self.count if self.count else np.nan)
+
+    def std(self):
+        return np.float32(np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan)
+
+def compute_risk_chunked(path: str, chunk_rows: int, columns: list) -> RiskResult:
+    """
+    compute_risk over a merged dataset on disk with bounded memory. Pass one
+    streams the file in order: it accumulates the statistics, carries the
+    previous price across chunks for the price changes, and spools rows with
+    their risk level into 30-day blocks. Pass two goes through the blocks in
+    time order and resamples whole buckets only, holding back a bucket that
+    continues into the next block, with rows in file order as resample sees
+    them. The buckets are the same as compute_risk's; the statistics agree
+    to float64 rounding before they are stored as float32.
+    """
+    check_columns(columns)
+    wide = 'country' in columns
+    moments = {col: RunningMoments() for col in required_columns}
+    last_price = {} if wide else np.nan
+    start = None
+    row = 0
+
+    with Spool() as spool:
+        for chunk in iter_dataset(path, chunk_rows, columns=columns):
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+            for col in required_columns:
+                moments[col].add(chunk[col].to_numpy())
+
+            prices = chunk['energy_price']
+            if wide:
+                previous = prices.groupby(chunk['country'], observed=True).shift(1)
+                first = ~chunk['country'].duplicated()
+                previous[first] = chunk.loc[first, 'country'].astype(object).map(last_price).astype(prices.dtype)
+                tail = chunk.groupby('country', observed=True).tail(1)
+                last_price.update(zip(tail['country'].astype(object), tail['energy_price']))
+            else:
+                previous = prices.shift(1)
+                if len(prices):
+                    previous.iloc[0] = last_price
+                    last_price = prices.iloc[-1]
+            price_change = prices / previous - 1
+
+            rows = chunk[risk_columns].copy()
+            rows['risk_level'] = abs(chunk['load_value'] - chunk['generation_forecast']) + price_change.abs() * 100
+            rows['_row'] = np.arange(row, row + len(rows))
+            row += len(rows)
+            rows = rows[rows['timestamp'].notna()]
+            if len(rows):
+                first_timestamp = rows['timestamp'].min()
+                start = first_timestamp if start is None else min(start, first_timestamp)
+                spool.append_groups(rows, (rows['timestamp'] - EPOCH) // BLOCK)
+
+        means = {col: moments[col].average() for col in required_columns}
+        forecast_dev_threshold = means['load_value'] + 2.5 * moments['generation_forecast'].std()
+        origin = start.normalize()
+
+        resampled, flags = [], []
+        held = None
+        blocks = sorted(spool.keys)
+        for i, block in enumerate(blocks):
+            part = spool.read(block)
+            if held is not None:
+                part = pd.concat([held, part]).sort_values('_row', kind='stable')
+            bucket_end = origin + ((part['timestamp'] - origin) // BUCKET + 1) * BUCKET
+            spans_next = bucket_end > EPOCH + (block + 1) * BLOCK
+            if i == len(blocks) - 1:
+                spans_next[:] = False
+            held, part = part[spans_next], part[~spans_next]
+            if part.empty:
+                continue
+            indexed = part.set_index('timestamp')
+            resampled.append(indexed[required_columns].resample('5D', origin=origin).mean())
+            flags.append((indexed['risk_level'] > forecast_dev_threshold).resample('5D', origin=origin).max())
+
+    df_resampled = pd.concat(resampled)
+    full_range = pd.date_range(df_resampled.index.min(), df_resampled.index.max(), freq='5D', name='timestamp')
+    df_resampled = df_resampled.reindex(full_range).reset_index()
+    bucket_flags = pd.concat(flags).reindex(df_resampled['timestamp'], fill_value=False).fillna(False).astype(bool).to_numpy()
+    return finish_risk(df_resampled, bucket_flags, means, forecast_dev_threshold)
+
+def plot_risk(df_resampled: pd.DataFrame, plots_dir: str):
+    plt = plotting.pyplot()
+    os.makedirs(plots_dir, exist_ok=True)
+
+    # Graph 1: Actual Load vs Generation
+    plt.figure(figsize=(14, 6))
+    plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (5-Day Avg)', color='blue', linewidth=2)
+    plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (5-Day Avg)', linestyle='dashed', color='orange', linewidth=2)
+    ax2 = plt.gca().twinx()
+    ax2.set_ylabel("Energy Price (€)")
+    ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
+    plt.xlabel("Time", fontsize=14)
+    plt.ylabel("Energy Load (MW)", fontsize=14)
+    plt.title("Actual Load, Generation Forecast, and Energy Price (5-Day Avg)", fontsize=16)
+
+    lines, labels = plt.gca().get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    plt.legend(lines + lines2, labels + labels2, loc='upper left')
+
+    plt.grid(True, linestyle="--", alpha=0.6)
+    plot1_path = os.path.join(plots_dir, "actual_generation_forecast_price.png")
+    plt.savefig(plot1_path)
+    instrumentation.record_written(plot1_path)
+    print(f"✅ Graph 1 saved to {plot1_path}")
+    plotting.done(plt)
+
+    # Graph 2: Actual Load vs Generation Forecast
+    plt.figure(figsize=(14, 6))
+    plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label="Actual Load (5-Day Avg)", color='blue', linewidth=2)
+    plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], linestyle='dashed', color='orange', linewidth=2, label='Generation Forecast (5-Day Avg)')
+    ax2 = plt.gca().twinx()
+    ax2.set_ylabel("Energy Price (€)")
+    ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.5, label='Energy Price (5-Day Avg)')
+    plt.xlabel("Time", fontsize=14)
+    plt.ylabel("Energy Load (MW)", fontsize=14)
+    plt.title("Actual vs Generation Forecast (5-Day Avg)", fontsize=16)
+
+    lines, labels = plt.gca().get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    plt.legend(lines + lines2, labels + labels2, loc='upper left')
+
+    plt.grid(True, linestyle="--", alpha=0.6)
+    plot2_path = os.path.join(plots_dir, "actual_vs_generation_forecast.png")
+    plt.savefig(plot2_path)
+    instrumentation.record_written(plot2_path)
+    print(f"✅ Graph 2 saved to {plot2_path}")
+    plotting.done(plt)
+
+    # Graph 3: Risk Visualization with Background
+    plt.figure(figsize=(14, 6))
+    plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (Muted)', color='blue', linestyle='dashed', alpha=0.3, linewidth=2)
+    plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (Muted)', linestyle='dashed', color='orange', alpha=0.3, linewidth=2)
+    plt.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
+    plt.plot(df_resampled['timestamp'], df_resampled['baseline_risk'], label='Risk Level', linestyle='-', color='red', linewidth=3, alpha=1.0, marker='o')
+    plt.xlabel("Time", fontsize=14)
+    plt.ylabel("Risk Level", fontsize=14)
+    plt.title("Risk Detection Visualization (5-Day Avg)", fontsize=16)
+
+    lines, labels = plt.gca().get_legend_handles_labels()
+    plt.legend(lines, labels, loc='upper left')
+
+    plt.grid(True, linestyle="--", alpha=0.6)
+    plot3_path = os.path.join(plots_dir, "risk_visualization.png")
+    plt.savefig(plot3_path)
+    instrumentation.record_written(plot3_path)
+    print(f"✅ Graph 3 saved to {plot3_path}")
+    plotting.done(plt)
+
+def risk_stage(merged_df: pd.DataFrame, base_dir: str) -> RiskResult:
+    return publish_risk(compute_risk(merged_df), base_dir)
+
+def publish_risk(result: RiskResult, base_dir: str) -> RiskResult:
+    plot_risk(result.resampled, os.path.join(base_dir, "data", "plots"))
+
+    print("\n🔍 Risk Calculation Summary:\n")
+    print(result.stats.to_string(index=False))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect supply/demand risk periods in the merged dataset.")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="stream the dataset in chunks of this many rows with bounded memory (0: in memory)")
+    args = parser.parse_args()
+    if args.chunk_rows:
+        publish_risk(compute_risk_chunked(merged_path(), args.chunk_rows, merged_columns()), base_dir)
+    else:
+        risk_stage(load_merged(), base_dir)
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
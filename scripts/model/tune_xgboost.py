@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import instrumentation
+from scripts.data_splitting.train_test_split import fold_positions, load_manifest
+from scripts.model.xgboost_model import (EARLY_STOPPING_ROUNDS, MAX_ROUNDS, NATIVE_PARAMS, TUNED_PARAMS_PATH,
+                                         limit_threads, native_matrices, read_split_source, store_features,
+                                         training_rows)
+
+# Wall-clock budget of a search, in seconds; trials still queued when it runs
+# out are skipped and running ones are stopped at their next round.
+TUNING_BUDGET_S = float(os.getenv("TUNING_BUDGET_S", "600"))
+# Concurrent trials (0: one per core); each gets an equal share of the cores.
+TUNING_WORKERS = int(os.getenv("TUNING_WORKERS", "0"))
+# Successive halving: CONFIGS random configurations start at MIN_ROUNDS
+# boosting rounds; after each rung the best 1/ETA go on with ETA times the rounds.
+TUNING_CONFIGS = int(os.getenv("TUNING_CONFIGS", "27"))
+TUNING_MIN_ROUNDS = int(os.getenv("TUNING_MIN_ROUNDS", "50"))
+TUNING_ETA = int(os.getenv("TUNING_ETA", "3"))
+
+# (scale, low, high) per parameter. max_bin is fixed: it is a property of the
+# cached matrices, which every trial shares.
+SEARCH_SPACE = {
+    'learning_rate': ('log', 0.02, 0.3),
+    'max_depth': ('int', 3, 10),
+    'min_child_weight': ('log', 1.0, 50.0),
+    'subsample': ('uniform', 0.5, 1.0),
+    'colsample_bytree': ('uniform', 0.5, 1.0),
+    'lambda': ('log', 0.1, 10.0),
+}
+
+# Fold matrices of this process: built on the first trial and reused by every
+# later one, so the features are quantized once per fold and worker.
+_fold_rows = None
+_fold_matrices = None
+_threads = 1
+
+
+class Trial(NamedTuple):
+    config: int
+    params: dict
+    rounds: int
+    # Mean best validation RMSE and best round over the folds.
+    rmse: float
+    best_rounds: int
+    seconds: float
+    # False when the budget ran out before every fold was trained.
+    complete: bool
+
+
+def deadline_callback(deadline: float):
+    """
+    An xgboost callback that stops boosting once the wall-clock deadline has
+    passed, and records that it did.
+    """
+    import xgboost as xgb
+
+    class Deadline(xgb.callback.TrainingCallback):
+        stopped = False
+
+        def after_iteration(self, model, epoch, evals_log):
+            self.stopped = time.time() >= deadline
+            return self.stopped
+
+    return Deadline()
+
+
+def sample_params(rng) -> dict:
+    params = {}
+    for name, (scale, low, high) in SEARCH_SPACE.items():
+        if scale == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        elif scale == 'int':
+            params[name] = int(rng.integers(low, high + 1))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    return params
+
+
+def fold_rows(manifest: dict) -> list:
+    """
+    (train, validation) model rows of every rolling-origin fold of the split,
+    with the stored features when training uses them.
+    """
+    if manifest['mode'] != 'chronological' or not manifest.get('folds'):
+        print("Error: Tuning needs rolling folds; split with SPLIT_MODE=chronological and ROLLING_FOLDS > 0.")
+        sys.exit(1)
+    df = read_split_source(manifest, through='validation')
+    features = store_features(manifest, through='validation')
+    folds = []
+    for train_rows, val_rows in fold_positions(df, manifest):
+        df_train, df_val = training_rows(df.iloc[train_rows], features), training_rows(df.iloc[val_rows], features)
+        if df_train.empty or df_val.empty:
+            print("Error: A fold has no 'generation_forecast' rows. Check the input data.")
+            sys.exit(1)
+        folds.append((df_train, df_val))
+    return folds
+
+
+def init_worker(rows: list, threads: int):
+    global _fold_rows, _fold_matrices, _threads
+    limit_threads(threads)
+    _fold_rows, _fold_matrices, _threads = rows, None, threads
+
+
+def fold_matrices() -> list:
+    global _fold_matrices
+    if _fold_matrices is None:
+        _fold_matrices = [native_matrices(df_train, df_val, _threads) for df_train, df_val in _fold_rows]
+    return _fold_matrices
+
+
+def run_trial(config: int, params: dict, rounds: int, deadline: float) -> Trial:
+    """
+    Trains params for up to `rounds` rounds on every fold, with early
+    stopping on the fold's validation rows.
+    """
+    import xgboost as xgb
+
+    start = time.perf_counter()
+    scores, best_rounds = [], []
+    for matrices in fold_matrices():
+        if time.time() >= deadline:
+            break
+        stop = deadline_callback(deadline)
+        booster = xgb.train({**NATIVE_PARAMS, **params, 'nthread': _threads}, matrices.train, num_boost_round=rounds,
+                            evals=[(matrices.validation, 'validation')], early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                            verbose_eval=False, callbacks=[stop])
+        # A fold cut short by the deadline is not comparable with the others.
+        if stop.stopped:
+            break
+        scores.append(booster.best_score)
+        best_rounds.append(booster.best_iteration + 1)
+    complete = len(scores) == len(fold_matrices())
+    return Trial(config, params, rounds, float(np.mean(scores)) if complete else math.inf,
+                 int(round(np.mean(best_rounds))) if complete else 0, time.perf_counter() - start, complete)
+
+
+def successive_halving(rows: list, configs: int = TUNING_CONFIGS, min_rounds: int = TUNING_MIN_ROUNDS,
+                       eta: int = TUNING_ETA, budget_s: float = TUNING_BUDGET_S, workers: int = TUNING_WORKERS,
+                       seed: int = 42) -> list:
+    """
+    Random configurations, scored on every fold at a growing number of
+    rounds; each rung keeps the best 1/eta for the next one, until one is
+    left, MAX_ROUNDS is reached or the budget runs out. Trials run in a pool
+    whose workers keep the fold matrices between trials. Returns every trial.
+    """
+    rng = np.random.default_rng(seed)
+    candidates = [(k, sample_params(rng)) for k in range(configs)]
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, cores, configs))
+    threads = max(1, cores // workers)
+    deadline = time.time() + budget_s
+    print(f"Tuning {configs} configurations on {len(rows)} folds, {workers} worker(s) x {threads} thread(s), "
+          f"budget {budget_s:g}s")
+
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if workers == 1:
+            init_worker(rows, threads)
+        else:
+            # Spawned workers start without the parent's thread pools.
+            pool = stack.enter_context(ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                                           initializer=init_worker, initargs=(rows, threads)))
+
+        def evaluate(batch, rounds):
+            if pool is None:
+                return [run_trial(k, params, rounds, deadline) for k, params in batch]
+            futures = [pool.submit(run_trial, k, params, rounds, deadline) for k, params in batch]
+            return [future.result() for future in futures]
+
+        trials, rounds = [], min(min_rounds, MAX_ROUNDS)
+        while candidates:
+            rung = evaluate(candidates, rounds)
+            trials.extend(rung)
+            done = sorted((t for t in rung if t.complete), key=lambda t: t.rmse)
+            print(f"  {rounds:>5} rounds: {len(done)} of {len(rung)} trials done, "
+                  + (f"best RMSE {done[0].rmse:.2f}" if done else "none within the budget"))
+            # Trials that stopped early would score the same with more rounds.
+            stopped_early = all(t.best_rounds + EARLY_STOPPING_ROUNDS < rounds for t in done)
+            if time.time() >= deadline or len(done) <= 1 or rounds >= MAX_ROUNDS or stopped_early:
+                break
+            candidates = [(t.config, t.params) for t in done[:max(1, len(done) // eta)]]
+            rounds = min(rounds * eta, MAX_ROUNDS)
+    return trials
+
+
+def best_trial(trials: list):
+    """
+    The lowest cross-validated RMSE among the trials of the last rung any
+    trial completed, or None.
+    """
+    done = [t for t in trials if t.complete]
+    if not done:
+        return None
+    last = max(t.rounds for t in done)
+    return min((t for t in done if t.rounds == last), key=lambda t: t.rmse)
+
+
+def save_best(best: Trial, trials: list, path: str = TUNED_PARAMS_PATH) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"params": best.params, "cv_rmse": round(best.rmse, 3), "best_rounds": best.best_rounds,
+                   "trials": len(trials), "tuned_at": datetime.now().isoformat(timespec="seconds")}, f, indent=2)
+    instrumentation.record_written(path)
+    print(f"Tuned parameters saved to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Successive-halving search over the native XGBoost parameters on the rolling folds of the "
+                    "split; the best configuration is used by the training stage.")
+    parser.add_argument("--budget", type=float, default=TUNING_BUDGET_S, help="wall-clock budget in seconds")
+    parser.add_argument("--configs", type=int, default=TUNING_CONFIGS)
+    parser.add_argument("--min-rounds", type=int, default=TUNING_MIN_ROUNDS)
+    parser.add_argument("--eta", type=int, default=TUNING_ETA)
+    parser.add_argument("--workers", type=int, default=TUNING_WORKERS, help="0: one per core")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="report the best configuration without saving it")
+    args = parser.parse_args()
+    if args.eta < 2 or args.configs < 1 or args.min_rounds < 1:
+        parser.error("--eta must be at least 2, --configs and --min-rounds at least 1")
+
+    with instrumentation.stage("tune") as metrics:
+        rows = fold_rows(load_manifest())
+        metrics.count(rows_in=sum(len(df_train) + len(df_val) for df_train, df_val in rows))
+        trials = successive_halving(rows, args.configs, args.min_rounds, args.eta, args.budget, args.workers,
+                                    args.seed)
+    best = best_trial(trials)
+    if best is None:
+        print("Error: No trial finished within the budget; raise --budget or lower --configs.")
+        sys.exit(1)
+    print(f"Best of {len(trials)} trials: CV RMSE {best.rmse:.2f} at {best.best_rounds} rounds with "
+          + ", ".join(f"{k}={v:.4g}" for k, v in best.params.items()))
+    if not args.dry_run:
+        save_best(best, trials)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,104 @@
 import os
 import pandas as pd
 import numpy as np
-from sklearn.metrics import mean_squared_error
-from xgboost import XGBRegressor
-from sklearn.preprocessing import OneHotEncoder
-import joblib
-import matplotlib.pyplot as plt
+import sys
+import json
+import time
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+from dotenv import load_dotenv
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-splits_dir = os.path.join(base_dir, "data", "data_splitting")
-processed_data_dir = os.path.join(base_dir, "data", "processed_data")
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
 
-train_file = os.path.join(splits_dir, "train_dataset.csv.gz")
-val_file = os.path.join(splits_dir, "validation_dataset.csv.gz")
+from scripts.common import catalog, instrumentation
+from scripts.common.schema import measurement_rows
+from scripts.common.storage import MERGED_LAYOUT, read_dataset
+from scripts.data_splitting.train_test_split import load_manifest, split_views
+from scripts.features.feature_store import FEATURE_COLUMNS, data_version, join_features, read_features, store_dir
+from scripts.model import registry
 
-df_train = pd.read_csv(train_file, compression="gzip")
-df_val = pd.read_csv(val_file, compression="gzip")
+load_dotenv()
 
-df_train.columns = df_train.columns.str.lower()
-df_val.columns = df_val.columns.str.lower()
+features = ['hour', 'day_of_week', 'day', 'month', 'year', 'country']
+numeric_features = ['hour', 'day_of_week', 'day', 'month', 'year']
+target = 'measurement'
+# Only the model columns are read; with Parquet the rest is never decoded.
+calendar_columns = ['timestamp', 'hour', 'day_of_week', 'day', 'month', 'year', 'country']
 
-df_train = df_train[df_train['measurement_type'] == 'generation_forecast']
-df_val = df_val[df_val['measurement_type'] == 'generation_forecast']
+# "native" trains on float32 features with country as a categorical, in a
+# QuantileDMatrix with hist trees and early stopping; "onehot" is the former
+# dense one-hot path with a fixed 100 rounds, kept for comparison.
+TRAIN_MODE = os.getenv("TRAIN_MODE", "native")
+# Threads per model; 0 uses every core.
+XGB_THREADS = int(os.getenv("XGB_THREADS", "0")) or os.cpu_count()
+MAX_ROUNDS = int(os.getenv("MAX_ROUNDS", "1000"))
+EARLY_STOPPING_ROUNDS = int(os.getenv("EARLY_STOPPING_ROUNDS", "20"))
+# Native mode also uses the lag and rolling features of the feature store.
+LAG_FEATURES = os.getenv("LAG_FEATURES", "1") == "1"
+# "global" trains one model on every country; "country" trains one native
+# model per country, in parallel over TRAIN_WORKERS processes (0: one per core).
+TRAIN_SCOPE = os.getenv("TRAIN_SCOPE", "global")
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", "0"))
+MODEL_NAME = "generation_forecast"
+# The serving global model, rewritten by the registry whenever the serving version changes.
+SERVING_MODEL_PATH = registry.SERVING_FILES[MODEL_NAME]
+NATIVE_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'rmse',
+    'tree_method': 'hist',
+    'learning_rate': 0.1,
+    'max_bin': 256,
+    'seed': 42,
+}
+# Written by tune_xgboost.py; native training uses its parameters over
+# NATIVE_PARAMS unless TUNED_PARAMS=0.
+TUNED_PARAMS_PATH = os.path.join(base_dir, "models", "xgboost_params.json")
+TUNED_PARAMS = os.getenv("TUNED_PARAMS", "1") == "1"
+
+
+# xgboost and scikit-learn are imported where a model is fitted or saved,
+# so importing this module (e.g. for read_split_source) stays cheap.
+class NativeMatrices(NamedTuple):
+    train: object
+    validation: object
+    categories: list
+
+
+class TrainingResult(NamedTuple):
+    model: object
+    # The fitted OneHotEncoder, or the country categories in native mode.
+    encoder: object
+    rmse: float
+    predictions: pd.DataFrame
 
-if df_train.empty or df_val.empty:
-    print("Error: One or both filtered datasets for 'generation_forecast' are empty. Check the input data.")
-    exit(1)
+
+def read_split_source(manifest, through: str = 'test'):
+    """
+    The merged dataset a split manifest refers to, with the model columns.
+    Chronological splits are only read up to the end of the `through`
+    period (training needs validation, the promotion gate the test period
+    too), and their boundaries do not depend on which rows are read; random
+    splits are row positions into the whole dataset.
+    """
+    path = os.path.join(base_dir, manifest['dataset'])
+    filters = {}
+    if manifest['mode'] == 'chronological':
+        filters['end'] = manifest['periods'][through][1]
+    if MERGED_LAYOUT == 'wide':
+        df = read_dataset(path, columns=calendar_columns + ['generation_forecast'], **filters)
+    else:
+        if manifest['mode'] == 'chronological':
+            filters['measurement_types'] = ['generation_forecast']
+        df = read_dataset(path, columns=calendar_columns + ['measurement_type', 'measurement'], **filters)
+    df.columns = df.columns.str.lower()
+    return df
 
 def add_time_features(df):
-    if not np.issubdtype(df['timestamp'].dtype, np.datetime64):
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
         df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
     for col, func in zip(['hour', 'day', 'month', 'year'],
                            [lambda x: x.dt.hour, lambda x: x.dt.day, lambda x: x.dt.month, lambda x: x.dt.year]):
@@ -36,63 +106,339 @@ def add_time_features(df):
             df[col] = func(df['timestamp'])
     return df
 
-df_train = add_time_features(df_train)
-df_val = add_time_features(df_val)
-
-features = ['hour', 'day_of_week', 'day', 'month', 'year', 'country']
-target = 'measurement'
-
-# Combine training and validation to ensure consistent encoding for 'country'
-combined = pd.concat([df_train[features], df_val[features]], axis=0)
+def training_rows(df: pd.DataFrame, features: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    The generation_forecast rows of a split (long or wide), with the calendar
+    features and, when given, the stored features of their hours.
+    """
+    rows = add_time_features(measurement_rows(df, 'generation_forecast'))
+    return rows if features is None else join_features(rows, features)
 
-if combined.empty:
-    print("Error: Combined features for OneHotEncoder are empty. Check filtering conditions on 'measurement_type'.")
-    exit(1)
-
-encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-encoder.fit(combined[['country']])
+def store_features(manifest: dict = None, base_dir: str = base_dir, through: str = 'test'):
+    """
+    The feature store rows training needs (up to the end of the `through`
+    period for chronological splits), or None when the model does not use them.
+    """
+    if TRAIN_MODE != 'native' or not LAG_FEATURES:
+        return None
+    end = manifest['periods'][through][1] if manifest and manifest['mode'] == 'chronological' else None
+    return read_features(base_dir, end=end)
 
-def prepare_features(df):
+def prepare_features(df: pd.DataFrame, encoder) -> pd.DataFrame:
     X_numeric = df[['hour', 'day_of_week', 'day', 'month', 'year']].copy()
     X_cat = encoder.transform(df[['country']])
     X_cat_df = pd.DataFrame(X_cat, columns=encoder.get_feature_names_out(['country']), index=df.index)
     X = pd.concat([X_numeric, X_cat_df], axis=1)
     return X
 
-X_train = prepare_features(df_train)
-y_train = df_train[target].values
-
-X_val = prepare_features(df_val)
-y_val = df_val[target].values
-
-model = XGBRegressor(
-    objective='reg:squarederror',
-    n_estimators=100,
-    learning_rate=0.1,
-    random_state=42
-)
-
-model.fit(
-    X_train,
-    y_train,
-    eval_set=[(X_val, y_val)],
-    verbose=True
-)
-
-y_pred = model.predict(X_val)
-rmse = np.sqrt(mean_squared_error(y_val, y_pred))
-print(f"Validation RMSE: {rmse:.2f}")
-
-predictions_path = os.path.join(processed_data_dir, "model_predictions.csv")
-pd.DataFrame({
-    'timestamp': df_val['timestamp'],
-    'actual_load': y_val,
-    'forecasted_load': y_pred
-}).to_csv(predictions_path, index=False)
-print(f"Model predictions saved to {predictions_path}")
-
-model_dir = os.path.join(base_dir, "models")
-os.makedirs(model_dir, exist_ok=True)
-model_path = os.path.join(model_dir, "xgboost_generation_forecast_model.joblib")
-joblib.dump(model, model_path)
-print(f"Model saved to {model_path}")
\ No newline at end of file
+def train_onehot(df_train: pd.DataFrame, df_val: pd.DataFrame) -> TrainingResult:
+    from sklearn.preprocessing import OneHotEncoder
+    from xgboost import XGBRegressor
+
+    # Combine training and validation to ensure consistent encoding for 'country'
+    combined = pd.concat([df_train[features], df_val[features]], axis=0)
+
+    if combined.empty:
+        print("Error: Combined features for OneHotEncoder are empty. Check filtering conditions on 'measurement_type'.")
+        exit(1)
+
+    encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+    encoder.fit(combined[['country']])
+
+    X_train = prepare_features(df_train, encoder)
+    y_train = df_train[target].values
+
+    X_val = prepare_features(df_val, encoder)
+    y_val = df_val[target].values
+
+    model = XGBRegressor(
+        objective='reg:squarederror',
+        n_estimators=100,
+        learning_rate=0.1,
+        random_state=42
+    )
+
+    model.fit(
+        X_train,
+        y_train,
+        eval_set=[(X_val, y_val)],
+        verbose=True
+    )
+
+    return scored(model, encoder, df_val, model.predict(X_val))
+
+def tuned_params(path: str = TUNED_PARAMS_PATH) -> dict:
+    if not TUNED_PARAMS or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['params']
+
+def train_params() -> dict:
+    return {**NATIVE_PARAMS, **tuned_params()}
+
+def native_features(df: pd.DataFrame, categories: list) -> pd.DataFrame:
+    X = df[numeric_features + [c for c in FEATURE_COLUMNS if c in df.columns]].astype('float32')
+    # Fixed categories, so every frame gets the same codes.
+    X['country'] = pd.Categorical(df['country'].astype(str), categories=categories)
+    return X
+
+def native_matrices(df_train: pd.DataFrame, df_val: pd.DataFrame, threads: int = XGB_THREADS) -> NativeMatrices:
+    """
+    Quantized training and validation matrices. The validation matrix uses
+    the training bins; both can be reused by any number of fits with the
+    same max_bin.
+    """
+    import xgboost as xgb
+
+    categories = sorted(set(df_train['country'].astype(str)) | set(df_val['country'].astype(str)))
+    dtrain = xgb.QuantileDMatrix(native_features(df_train, categories), df_train[target].to_numpy('float32'),
+                                 enable_categorical=True, max_bin=NATIVE_PARAMS['max_bin'], nthread=threads)
+    dval = xgb.QuantileDMatrix(native_features(df_val, categories), df_val[target].to_numpy('float32'),
+                               enable_categorical=True, ref=dtrain, nthread=threads)
+    return NativeMatrices(dtrain, dval, categories)
+
+def train_native(df_train: pd.DataFrame, df_val: pd.DataFrame, params: dict = None,
+                 matrices: NativeMatrices = None, threads: int = XGB_THREADS) -> TrainingResult:
+    """
+    hist trees on the native matrices, stopped once the validation RMSE has
+    not improved for EARLY_STOPPING_ROUNDS rounds; the model keeps the best
+    round. `params` override NATIVE_PARAMS and the tuned parameters.
+    """
+    import xgboost as xgb
+
+    matrices = matrices or native_matrices(df_train, df_val, threads)
+    booster = xgb.train({**train_params(), 'nthread': threads, **(params or {})}, matrices.train,
+                        num_boost_round=MAX_ROUNDS, evals=[(matrices.validation, 'validation')],
+                        early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=25)
+    rounds, best_rounds = booster.num_boosted_rounds(), booster.best_iteration + 1
+    booster = booster[:best_rounds]
+    print(f"Best validation RMSE after {best_rounds} of {rounds} rounds")
+    return scored(booster, matrices.categories, df_val, booster.predict(matrices.validation))
+
+def scored(model, encoder, df_val: pd.DataFrame, y_pred) -> TrainingResult:
+    y_val = df_val[target].values
+    rmse = float(np.sqrt(np.mean((y_val - y_pred.astype('float64')) ** 2)))
+    print(f"Validation RMSE: {rmse:.2f}")
+
+    predictions = pd.DataFrame({
+        'timestamp': df_val['timestamp'],
+        'actual_load': y_val,
+        'forecasted_load': y_pred
+    })
+    return TrainingResult(model, encoder, rmse, predictions)
+
+def train_model(df_train: pd.DataFrame, df_val: pd.DataFrame, mode: str = TRAIN_MODE) -> TrainingResult:
+    """
+    Fits the generation forecast model on the training rows and scores it on
+    the validation rows.
+    """
+    if df_train.empty or df_val.empty:
+        print("Error: One or both filtered datasets for 'generation_forecast' are empty. Check the input data.")
+        exit(1)
+    if mode == "native":
+        return train_native(df_train, df_val)
+    if mode == "onehot":
+        return train_onehot(df_train, df_val)
+    print(f"Error: Unknown TRAIN_MODE {mode!r}; use 'native' or 'onehot'.")
+    exit(1)
+
+def rescore(model, categories, df_val: pd.DataFrame):
+    """
+    RMSE of a stored native model on df_val, or None when it cannot score
+    these rows (a one-hot model, or other feature columns).
+    """
+    import xgboost as xgb
+
+    if not isinstance(model, xgb.Booster) or categories is None:
+        return None
+    X = native_features(df_val, categories)
+    if list(X.columns) != list(model.feature_names or []):
+        return None
+    y_pred = model.predict(xgb.DMatrix(X, enable_categorical=True))
+    return float(np.sqrt(np.mean((df_val[target].to_numpy('float64') - y_pred) ** 2)))
+
+def result_rmse(result: TrainingResult, df: pd.DataFrame) -> float:
+    """
+    RMSE of a freshly trained model on other rows than its validation ones.
+    """
+    if isinstance(result.encoder, list):
+        return rescore(result.model, result.encoder, df)
+    y_pred = result.model.predict(prepare_features(df, result.encoder))
+    return float(np.sqrt(np.mean((df[target].to_numpy('float64') - y_pred.astype('float64')) ** 2)))
+
+def register_model(name: str, result: TrainingResult, df_val: pd.DataFrame, base_dir: str,
+                   version: str = None, metrics: dict = None, df_test: pd.DataFrame = None) -> registry.Registration:
+    """
+    Registers a trained model as a new version of name. It only becomes the
+    serving model when it is not worse than the serving one on the same
+    rows: the test rows when given, which training never sees. The
+    validation rows chose the new model's stopping round, so its validation
+    RMSE flatters it; they are only compared on when there are no test rows.
+    The registered RMSE is the one compared on.
+    """
+    holdout, label = (df_test, 'test') if df_test is not None and not df_test.empty else (df_val, 'validation')
+    rmse = result.rmse
+    if label == 'test':
+        rmse = result_rmse(result, holdout)
+        metrics = {**(metrics or {}), 'rmse_validation': round(result.rmse, 3), 'rows_test': len(holdout)}
+    current = registry.serving(base_dir, name)
+    serving_rmse = None
+    if current is not None and holdout is not None:
+        serving_rmse = rescore(registry.load_model(base_dir, name), json.loads(current['params']).get('categories'),
+                               holdout)
+    native = TRAIN_MODE == 'native'
+    booster = result.model if native else result.model.get_booster()
+    # Everything needed to rebuild the model's input from (country, timestamp)
+    # rows: its columns in order, the countries it knows and the feature store
+    # version the stored columns come from.
+    params = {'mode': TRAIN_MODE,
+              'categories': result.encoder if native else [str(c) for c in result.encoder.categories_[0]],
+              'features': list(booster.feature_names),
+              'feature_store': os.path.basename(store_dir(base_dir))
+              if any(c in FEATURE_COLUMNS for c in booster.feature_names) else None,
+              'train_params': train_params() if native else None}
+    registration = registry.register(base_dir, name, result.model, rmse, metrics=metrics, params=params,
+                                     data_version=version, serving_rmse=serving_rmse)
+    if registration.promoted:
+        print(f"{name} v{registration.version} is now serving ({label} RMSE {rmse:.2f}).")
+    elif current is None:
+        print(f"{name} v{registration.version} not promoted: {label} RMSE {rmse}.")
+    else:
+        baseline = serving_rmse if serving_rmse is not None else current['rmse']
+        print(f"{name} v{registration.version} not promoted: {label} RMSE {rmse:.2f} against "
+              f"{baseline:.2f} for the serving v{current['version']}.")
+    return registration
+
+def save_predictions(predictions: pd.DataFrame, base_dir: str) -> str:
+    predictions_path = os.path.join(base_dir, "data", "processed_data", "model_predictions.csv")
+    predictions.to_csv(predictions_path, index=False)
+    instrumentation.record_written(predictions_path, len(predictions))
+    catalog.register(base_dir, "predictions", predictions_path, predictions)
+    print(f"Model predictions saved to {predictions_path}")
+    return predictions_path
+
+def save_training(result: TrainingResult, base_dir: str, df_val: pd.DataFrame = None, version: str = None,
+                  df_test: pd.DataFrame = None) -> str:
+    """
+    Saves the predictions and registers the model; the registry replaces
+    the serving model file when it promotes it.
+    """
+    save_predictions(result.predictions, base_dir)
+    metrics = {'rows_validation': len(df_val)} if df_val is not None else None
+    registration = register_model(MODEL_NAME, result, df_val, base_dir, version, metrics, df_test)
+    model_path = os.path.join(base_dir, SERVING_MODEL_PATH)
+    if registration.promoted:
+        print(f"Model saved to {model_path}")
+    return model_path
+
+def limit_threads(threads: int):
+    # Native thread pools in a worker follow its share of the cores too.
+    for name in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+        os.environ[name] = str(threads)
+
+def train_country(country: str, df_train: pd.DataFrame, df_val: pd.DataFrame, threads: int):
+    """
+    One country's native model, without the training log; run in a pool worker.
+    """
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = train_native(df_train, df_val, threads=threads)
+    return country, result, time.perf_counter() - start
+
+def train_countries(df_train: pd.DataFrame, df_val: pd.DataFrame, workers: int = TRAIN_WORKERS) -> dict:
+    """
+    One native model per country with both training and validation rows.
+    Countries are spread over `workers` processes (default and at most: one
+    per core, and one per country), each training with an equal share of the
+    cores, so the pool never runs more threads than there are cores. Returns
+    {country: (TrainingResult, seconds)}.
+    """
+    if TRAIN_MODE != "native":
+        print("Error: TRAIN_SCOPE=country needs TRAIN_MODE=native.")
+        exit(1)
+    train_groups = dict(tuple(df_train.groupby(df_train['country'].astype(str), sort=True)))
+    val_groups = dict(tuple(df_val.groupby(df_val['country'].astype(str), sort=True)))
+    countries = [c for c in train_groups if c in val_groups]
+    skipped = sorted(set(train_groups) ^ set(val_groups))
+    if skipped:
+        print(f"Skipping countries without both training and validation rows: {', '.join(skipped)}")
+    # Largest first, so the last tasks to start are short ones.
+    countries.sort(key=lambda c: -len(train_groups[c]))
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, cores, len(countries)))
+    threads = max(1, cores // workers)
+    print(f"Training {len(countries)} country models on {workers} worker(s) x {threads} thread(s)")
+
+    results = {}
+    if workers == 1:
+        tasks = (train_country(c, train_groups[c], val_groups[c], threads) for c in countries)
+        for country, result, seconds in tasks:
+            results[country] = (result, seconds)
+            print(f"  {country}: RMSE {result.rmse:.2f} in {seconds:.2f}s")
+        return results
+    # Spawned workers start without the parent's thread pools.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=limit_threads, initargs=(threads,)) as pool:
+        futures = [pool.submit(train_country, c, train_groups[c], val_groups[c], threads) for c in countries]
+        for future in as_completed(futures):
+            country, result, seconds = future.result()
+            results[country] = (result, seconds)
+            print(f"  {country}: RMSE {result.rmse:.2f} in {seconds:.2f}s")
+    return results
+
+def save_country_training(results: dict, df_val: pd.DataFrame, base_dir: str, version: str = None,
+                          df_test: pd.DataFrame = None) -> str:
+    """
+    Saves the predictions of every country model and registers each as
+    generation_forecast/<country>, promoted per country.
+    """
+    predictions = pd.concat([result.predictions.assign(country=country) for country, (result, _) in results.items()],
+                            ignore_index=True) if results else pd.DataFrame()
+    save_predictions(predictions, base_dir)
+    val_groups = dict(tuple(df_val.groupby(df_val['country'].astype(str), sort=True)))
+    test_groups = dict(tuple(df_test.groupby(df_test['country'].astype(str), sort=True))) if df_test is not None else {}
+    promoted = 0
+    for country, (result, seconds) in sorted(results.items()):
+        metrics = {'rows_validation': len(val_groups[country]), 'train_s': round(seconds, 3)}
+        registration = register_model(f"{MODEL_NAME}/{country}", result, val_groups[country], base_dir, version,
+                                      metrics, test_groups.get(country))
+        promoted += registration.promoted
+    squared = sum(result.rmse ** 2 * len(result.predictions) for result, _ in results.values())
+    rows = sum(len(result.predictions) for result, _ in results.values())
+    print(f"{promoted} of {len(results)} country models promoted to serving; "
+          f"pooled validation RMSE {np.sqrt(squared / max(rows, 1)):.2f}")
+    return registry.registry_dir(base_dir)
+
+def train_and_save(df_train: pd.DataFrame, df_val: pd.DataFrame, base_dir: str, version: str = None,
+                   df_test: pd.DataFrame = None):
+    """
+    Trains in the configured scope and registers the result(s); df_test
+    are the rows the promotion compares the models on.
+    """
+    if TRAIN_SCOPE == "country":
+        if df_train.empty or df_val.empty:
+            print("Error: One or both filtered datasets for 'generation_forecast' are empty. Check the input data.")
+            exit(1)
+        results = train_countries(df_train, df_val)
+        save_country_training(results, df_val, base_dir, version, df_test)
+        return results
+    if TRAIN_SCOPE != "global":
+        print(f"Error: Unknown TRAIN_SCOPE {TRAIN_SCOPE!r}; use 'global' or 'country'.")
+        exit(1)
+    result = train_model(df_train, df_val)
+    save_training(result, base_dir, df_val, version, df_test)
+    return result
+
+def main():
+    manifest = load_manifest()
+    splits = split_views(read_split_source(manifest), manifest)
+    features = store_features(manifest)
+
+    df_train = training_rows(splits.train, features)
+    df_val = training_rows(splits.validation, features)
+    df_test = training_rows(splits.test, features)
+
+    train_and_save(df_train, df_val, base_dir, data_version(base_dir) if features is not None else None, df_test)
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,118 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
 import sys
-from scipy.stats import zscore
-
+import argparse
+import pandas as pd
+from datetime import datetime, timedelta
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-merged_dir = os.path.join(base_dir, "data", "merged_data")
-merged_files = [f for f in os.listdir(merged_dir) if f.endswith(".csv.gz")]
-
-if not merged_files:
-    print("⚠️ No merged dataset found in the merged_data directory. Risk detection cannot proceed.")
-    sys.exit(1)
-
-merged_files.sort()
-data_path = os.path.join(merged_dir, merged_files[0])
-
-df = pd.read_csv(data_path, compression='gzip')
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-#Print columns
-print("Available columns in the dataset:", df.columns.tolist())
-
-required_columns = ['load_value', 'generation_forecast', 'energy_price']
-missing_columns = [col for col in required_columns if col not in df.columns]
-
-if missing_columns:
-    print(f"⚠️ Required columns missing from dataset: {missing_columns}")
-    print("⚠️ Available columns:", df.columns.tolist())
-    sys.exit(1)
-
-numeric_cols = df.select_dtypes(include=[np.number]).columns
-df_resampled = df.set_index('timestamp')[numeric_cols].resample('5D').mean().reset_index()
-
-df_resampled.reset_index(inplace=True)
-
-plots_dir = os.path.join(base_dir, "data", "plots")
-os.makedirs(plots_dir, exist_ok=True)
-
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (5-Day Avg)', color='blue', linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (5-Day Avg)', linestyle='dashed', color='orange', linewidth=2)
-ax2 = plt.gca().twinx()
-ax2.set_ylabel("Energy Price (€)")
-ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Energy Load (MW)", fontsize=14)
-plt.title("Actual Load, Generation Forecast, and Energy Price (5-Day Avg)", fontsize=16)
-
-
-lines, labels = plt.gca().get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-plt.legend(lines + lines2, labels + labels2, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot1_path = os.path.join(plots_dir, "actual_generation_forecast_price.png")
-plt.savefig(plot1_path)
-print(f"Graph 1 saved to {plot1_path}")
-plt.show()
-
-# Graph 2: Actual Load vs Generation Forecast
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label="Actual Load (5-Day Avg)", color='blue', linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], linestyle='dashed', color='orange', linewidth=2, label='Generation Forecast (5-Day Avg)')
-ax2 = plt.gca().twinx()
-ax2.set_ylabel("Energy Price (€)")
-ax2.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.5, label='Energy Price (5-Day Avg)')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Energy Load (MW)", fontsize=14)
-plt.title("Actual vs Generation Forecast (5-Day Avg)", fontsize=16)
-
-lines, labels = plt.gca().get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-plt.legend(lines + lines2, labels + labels2, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot2_path = os.path.join(plots_dir, "actual_vs_generation_forecast.png")
-plt.savefig(plot2_path)
-print(f"✅ Graph 2 saved to {plot2_path}")
-plt.show()
-
-forecast_dev_threshold = df['load_value'].mean() + 2.5 * df['generation_forecast'].std()
-df['risk_level'] = abs(df['load_value'] - df['generation_forecast']) + df['energy_price'].pct_change(fill_method=None).abs() * 100
-df['risk_flag'] = df['risk_level'] > forecast_dev_threshold
-
-df_resampled['baseline_risk'] = df_resampled['load_value'].rolling(window=5, min_periods=1).mean()
-df_resampled.loc[df['risk_flag'], 'baseline_risk'] = df_resampled.loc[df['risk_flag'], 'load_value']
-
-# Graph 3: Risk Visualization
-plt.figure(figsize=(14, 6))
-plt.plot(df_resampled['timestamp'], df_resampled['load_value'], label='Actual Load (Muted)', color='blue', linestyle='dashed', alpha=0.3, linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['generation_forecast'], label='Generation Forecast (Muted)', linestyle='dashed', color='orange', alpha=0.3, linewidth=2)
-plt.plot(df_resampled['timestamp'], df_resampled['energy_price'], linestyle='--', color='green', linewidth=2, marker='o', alpha=0.7, label='Energy Price (5-Day Avg)')
-plt.plot(df_resampled['timestamp'], df_resampled['baseline_risk'], label='Risk Level', linestyle='-', color='red', linewidth=3, alpha=1.0, marker='o')
-plt.xlabel("Time", fontsize=14)
-plt.ylabel("Risk Level", fontsize=14)
-plt.title("Risk Detection Visualization (5-Day Avg)", fontsize=16)
-
-lines, labels = plt.gca().get_legend_handles_labels()
-plt.legend(lines, labels, loc='upper left')
-
-plt.grid(True, linestyle="--", alpha=0.6)
-plot3_path = os.path.join(plots_dir, "risk_visualization.png")
-plt.savefig(plot3_path)
-print(f"✅ Graph 3 saved to {plot3_path}")
-plt.show()
-
-
-risk_stats = pd.DataFrame({
-    "Metric": ["Mean Load Value", "Mean Generation Forecast", "Mean Energy Price", "Forecast Deviation Threshold"],
-    "Value": [df['load_value'].mean(), df['generation_forecast'].mean(), df['energy_price'].mean(), forecast_dev_threshold]
-})
-
-print("\n🔍 Risk Calculation Summary:\n")
-print(risk_stats.to_string(index=False))
-
-sys.exit(0)
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common import catalog, instrumentation
+from scripts.ingestion.backfill import run_backfill
+from scripts.ingestion.fetch_engine import FetchEngine, fetch_first_available
+from scripts.ingestion.incremental import incremental_update, save_high_water_marks
+from scripts.ingestion.xml_decoder import decode_points, hourly_values
+from scripts.ingestion.zones import PRICE_COUNTRY_CODES as country_codes
+
+days_back = 365
+last_day = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+end_date = datetime.strptime(last_day, "%Y-%m-%d")
+start_date = end_date - timedelta(days=days_back - 1)
+timezone_offset = 1  # e.g., CET/CEST
+
+utc_start = (start_date - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M")
+utc_end = ((end_date + timedelta(days=1)) - timedelta(hours=timezone_offset)).strftime("%Y%m%d%H%M")
+current_time = datetime.now()
+FILE_PREFIX = "all_countries_energy_prices_day_ahead"
+
+def parse_and_format_prices(xml_data, country_name, timezone_offset):
+    """
+    Parses a day-ahead price document (documentType=A44). PT15M prices are
+    averaged to hourly values.
+    """
+    try:
+        points = decode_points(xml_data, value_tag="price.amount")
+        print(f"For {country_name}, decoded {len(points['value'])} Point elements "
+              f"(resolutions: {sorted(set(points['resolution'].tolist()))} min).")
+        hourly = hourly_values(points)
+        timestamps = hourly.index + pd.Timedelta(hours=timezone_offset)
+        keep = timestamps <= current_time
+        timestamps = timestamps[keep]
+        df = pd.DataFrame({
+            'timestamp': timestamps,
+            'energy_price': hourly.values[keep],
+            'day_of_week': timestamps.dayofweek,
+            'country': country_name,
+            'data_type': 'energy_price'
+        })
+        if df.empty:
+            print("Warning: The DataFrame is empty after parsing.")
+        df.sort_values(by='timestamp', inplace=True)
+        return df
+    except Exception as e:
+        print(f"Error parsing day-ahead price XML for {country_name}: {e}")
+        return pd.DataFrame()
+
+def parse_prices(xml_data, country_name):
+    return parse_and_format_prices(xml_data, country_name, timezone_offset)
+
+def main(incremental=False, backfill_start=None, chunk_days=None, allow_partial=False):
+    engine = FetchEngine()
+    output_dir = os.path.join(base_dir, "data", "price")
+    os.makedirs(output_dir, exist_ok=True)
+
+    if backfill_start:
+        run_backfill(engine, "energy_price", "energy_price", country_codes, parse_prices, output_dir, FILE_PREFIX,
+                     backfill_start, end_date, timezone_offset, chunk_days, allow_partial)
+        engine.client.report()
+        return
+
+    if incremental:
+        updated = incremental_update(
+            "energy_price", output_dir, FILE_PREFIX, country_codes, start_date, end_date, timezone_offset,
+            lambda windows: fetch_first_available(engine, "energy_price", country_codes, None, None, parse_prices, windows=windows)
+        )
+        if updated is not None:
+            engine.client.report()
+            return
+
+    print(f"Fetching Day-Ahead Prices for {len(country_codes)} countries "
+          f"({engine.max_workers} workers)...")
+    all_data = fetch_first_available(engine, "energy_price", country_codes, utc_start, utc_end, parse_prices)
+
+    engine.client.report()
+
+    if all_data:
+        final_df = pd.concat(all_data, ignore_index=True)
+        final_df.sort_values(by=['country', 'timestamp'], inplace=True)
+
+        print("Final Day-Ahead Price DataFrame preview:")
+        print(final_df.head())
+        print(f"Total number of records: {len(final_df)}")
+
+        output_path = os.path.join(
+            output_dir,
+            f"{FILE_PREFIX}_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv.gz"
+        )
+        final_df.to_csv(output_path, index=False, compression="gzip")
+        instrumentation.record_written(output_path, len(final_df))
+        catalog.register(base_dir, "price", output_path, final_df)
+        save_high_water_marks("energy_price", final_df.groupby('country')['timestamp'].max().to_dict())
+        print(f"Saved Day-Ahead Price data to {output_path}")
+    else:
+        print("No Day-Ahead Price data available.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch ENTSO-E day-ahead prices for all countries.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch hours after the stored high-water mark and upsert them")
+    parser.add_argument("--backfill-start", metavar="YYYY-MM-DD",
+                        help="fetch history from this date in checkpointed chunks (resumable)")
+    parser.add_argument("--chunk-days", type=int,
+                        help="backfill chunk size in days (default: calendar months)")
+    parser.add_argument("--allow-partial", action="store_true",
+                        help="save the backfilled chunks even if some failed (rerun later to fill them)")
+    args = parser.parse_args()
+    main(incremental=args.incremental, backfill_start=args.backfill_start, chunk_days=args.chunk_days,
+         allow_partial=args.allow_partial)
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import argparse
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.common.schema import TIMEZONE
+from scripts.features.feature_store import FEATURE_COLUMNS, data_version, read_features, store_dir
+from scripts.model import registry
+from scripts.model.xgboost_model import MODEL_NAME
+
+CALENDAR = {
+    'hour': lambda t: t.hour,
+    'day_of_week': lambda t: t.dayofweek,
+    'day': lambda t: t.day,
+    'month': lambda t: t.month,
+    'year': lambda t: t.year,
+}
+
+
+class Rows(NamedTuple):
+    """
+    (country, timestamp) rows to score; timestamps as UTC nanoseconds, so
+    the rows of many requests concatenate without pandas.
+    """
+    countries: np.ndarray
+    timestamps: np.ndarray
+
+    def __len__(self):
+        return len(self.countries)
+
+
+class Scores(NamedTuple):
+    predictions: np.ndarray
+    # False for rows the feature store has nothing for; their stored
+    # features are missing values to the model.
+    found: np.ndarray
+
+
+def concat_rows(batch: list) -> Rows:
+    if len(batch) == 1:
+        return batch[0]
+    return Rows(np.concatenate([rows.countries for rows in batch]), np.concatenate([rows.timestamps for rows in batch]))
+
+
+class Predictor:
+    """
+    The serving version of a registered model and its feature pipeline,
+    loaded once: the input columns and known countries recorded at
+    registration, and the stored features (up to the hours just past the
+    data) indexed by (country, timestamp). predict() scores any number of
+    rows with one call to the model.
+    """
+
+    def __init__(self, base_dir: str = base_dir, name: str = MODEL_NAME):
+        row = registry.serving(base_dir, name)
+        if row is None:
+            print(f"Error: {name} has no serving model; train it first.")
+            sys.exit(1)
+        model = registry.load_model(base_dir, name)
+        self.name, self.version, self.rmse = name, row['version'], row['rmse']
+        self.model = model if hasattr(model, 'inplace_predict') else model.get_booster()
+        self.pipeline = json.loads(row['params'])
+        self.columns = self.pipeline['features']
+        self.categories = self.pipeline['categories']
+        self.known = set(self.categories)
+        self.onehot = self.pipeline['mode'] == 'onehot'
+        self.stored = [c for c in self.columns if c in FEATURE_COLUMNS]
+        self.codes = {category: code for code, category in enumerate(self.categories)}
+        self.data_version = None
+        self.store_keys, self.store_values = np.empty(0, dtype='int64'), np.empty((0, 0), dtype='float32')
+        if self.stored:
+            if self.pipeline.get('feature_store') != os.path.basename(store_dir(base_dir)):
+                print(f"Error: {name} v{self.version} was trained on feature store "
+                      f"{self.pipeline.get('feature_store')}, not {os.path.basename(store_dir(base_dir))}; retrain it.")
+                sys.exit(1)
+            features = read_features(base_dir, countries=self.categories)
+            self.data_version = data_version(base_dir)
+            timestamps = pd.DatetimeIndex(features['timestamp']).tz_convert('UTC').as_unit('ns').asi8
+            keys = self.keys(self.country_codes(features['country'].astype(str).to_numpy()), timestamps)
+            order = np.argsort(keys, kind='stable')
+            self.store_keys = keys[order]
+            self.store_values = features[self.stored].to_numpy('float32')[order]
+
+    def country_codes(self, countries: np.ndarray) -> np.ndarray:
+        # The codes of the model's categories, as in training.
+        return np.fromiter((self.codes.get(c, -1) for c in countries), dtype='int64', count=len(countries))
+
+    @staticmethod
+    def keys(codes: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+        # One sortable int64 per (country, second).
+        return codes * (1 << 40) + timestamps // 1_000_000_000
+
+    def parse(self, payload: list) -> Rows:
+        """
+        Rows from a list of {"country", "timestamp"} objects. Timestamps
+        without an offset are wall-clock times of the stored data.
+        Raises ValueError on a malformed row or an unknown country.
+        """
+        if not isinstance(payload, list) or not payload:
+            raise ValueError("expected a non-empty list of rows")
+        try:
+            countries = np.array([str(row['country']) for row in payload], dtype=object)
+            timestamps = pd.to_datetime([row['timestamp'] for row in payload], format='ISO8601')
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"every row needs a country and a timestamp ({e})")
+        except (ValueError, OverflowError) as e:
+            raise ValueError(f"unreadable timestamp ({e})")
+        if not isinstance(timestamps, pd.DatetimeIndex):
+            raise ValueError("timestamps must all have the same UTC offset, or none")
+        unknown = set(countries) - self.known
+        if unknown:
+            raise ValueError(f"unknown countries: {', '.join(sorted(unknown))}")
+        if timestamps.tz is None:
+            timestamps = timestamps.tz_localize(TIMEZONE)
+        return Rows(countries, timestamps.tz_convert('UTC').as_unit('ns').asi8)
+
+    def features(self, rows: Rows):
+        """
+        The model input of rows as a float32 matrix in the model's column
+        order (country as its category code), and whether the store had
+        their features. A plain array skips the DataFrame checks of predict.
+        """
+        local = pd.DatetimeIndex(rows.timestamps.astype('datetime64[ns]')).tz_localize('UTC') \
+            .tz_convert(TIMEZONE).tz_localize(None)
+        codes = self.country_codes(rows.countries)
+        found = np.ones(len(rows), dtype=bool)
+        if self.stored:
+            keys = self.keys(codes, rows.timestamps)
+            positions = np.searchsorted(self.store_keys, keys)
+            found = positions < len(self.store_keys)
+            found[found] = self.store_keys[positions[found]] == keys[found]
+            stored = dict(zip(self.stored, range(len(self.stored))))
+        X = np.empty((len(rows), len(self.columns)), dtype='float32')
+        for k, column in enumerate(self.columns):
+            if column in CALENDAR:
+                X[:, k] = CALENDAR[column](local)
+            elif column == 'country':
+                X[:, k] = codes
+            elif column.startswith('country_') and self.onehot:
+                X[:, k] = codes == self.codes.get(column[len('country_'):], -2)
+            else:
+                X[:, k] = np.nan
+                X[found, k] = self.store_values[positions[found], stored[column]]
+        return X, found
+
+    def predict(self, rows: Rows) -> Scores:
+        X, found = self.features(rows)
+        return Scores(self.model.inplace_predict(X), found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast with the serving model, e.g. for the hours just past the data.")
+    parser.add_argument("rows", help='JSON list of {"country": ..., "timestamp": ...} objects, or @FILE')
+    parser.add_argument("--model", default=MODEL_NAME, help="registered model name")
+    args = parser.parse_args()
+
+    text = open(args.rows[1:]).read() if args.rows.startswith("@") else args.rows
+    predictor = Predictor(base_dir, args.model)
+    try:
+        payload = json.loads(text)
+        rows = predictor.parse(payload)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    scores = predictor.predict(rows)
+    for row, prediction, found in zip(payload, scores.predictions, scores.found):
+        print(f"{row['country']:<24}{row['timestamp']:<28}{prediction:>12.2f}" + ("" if found else "  (no stored features)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from scripts.model.xgboost_model import MODEL_NAME
+from scripts.serving.predictor import Predictor, concat_rows
+
+SERVING_HOST = os.getenv("SERVING_HOST", "127.0.0.1")
+SERVING_PORT = int(os.getenv("SERVING_PORT", "8080"))
+# Requests queued while a batch is scored go into the next one, up to
+# BATCH_MAX_ROWS rows; BATCH_WAIT_MS also waits that long after the first
+# request of a batch for more to arrive. BATCH_MAX_ROWS=1 scores every
+# request on its own.
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "8192"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "0"))
+MAX_BODY_BYTES = 1 << 22
+
+
+class MicroBatcher:
+    """
+    Collects the rows of concurrent requests and scores them with one
+    predict call per batch, off the event loop, so the loop keeps reading
+    requests for the next batch meanwhile.
+    """
+
+    def __init__(self, predictor: Predictor, max_rows: int = BATCH_MAX_ROWS, wait_ms: float = BATCH_WAIT_MS):
+        self.predictor = predictor
+        self.max_rows = max(1, max_rows)
+        self.wait_s = wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One thread: batches are scored one after the other, each with every core.
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="predict")
+        self.batches = 0
+        self.rows = 0
+
+    async def predict(self, rows):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((rows, future))
+        return await future
+
+    async def next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.wait_s
+        while size < self.max_rows:
+            if self.queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+            size += len(batch[-1][0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            try:
+                scores = await loop.run_in_executor(self.executor, self.predictor.predict,
+                                                    concat_rows([rows for rows, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            start = 0
+            for rows, future in batch:
+                end = start + len(rows)
+                if not future.done():
+                    future.set_result((scores.predictions[start:end], scores.found[start:end]))
+                start = end
+            self.rows += start
+
+
+class Service:
+    def __init__(self, predictor: Predictor, batcher: MicroBatcher):
+        self.predictor = predictor
+        self.batcher = batcher
+
+    def health(self):
+        return HTTPStatus.OK, {"model": self.predictor.name, "version": self.predictor.version,
+                               "rmse": self.predictor.rmse, "data_version": self.predictor.data_version,
+                               "batches": self.batcher.batches, "rows": self.batcher.rows}
+
+    async def forecast(self, body: bytes):
+        """
+        POST /predict with {"rows": [{"country": "DE", "timestamp": "2025-01-01T13:00"}, ...]}.
+        """
+        try:
+            rows = self.predictor.parse(json.loads(body).get("rows"))
+        except (ValueError, AttributeError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        predictions, found = await self.batcher.predict(rows)
+        return HTTPStatus.OK, {"model": self.predictor.name, "version": self.predictor.version,
+                               "predictions": predictions.tolist(), "missing_features": int(len(found) - found.sum())}
+
+    async def route(self, method: str, path: str, body: bytes):
+        if path == "/predict":
+            if method != "POST":
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use POST"}
+            return await self.forecast(body)
+        if path == "/health" and method == "GET":
+            return self.health()
+        return HTTPStatus.NOT_FOUND, {"error": f"no route {method} {path}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        A minimal HTTP/1.1 connection: Content-Length bodies and keep-alive.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": "malformed request"}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.route(method, target.split("?")[0], body)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict, keep_alive: bool):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(predictor: Predictor, host: str = SERVING_HOST, port: int = SERVING_PORT,
+                max_rows: int = BATCH_MAX_ROWS, wait_ms: float = BATCH_WAIT_MS):
+    batcher = MicroBatcher(predictor, max_rows, wait_ms)
+    service = Service(predictor, batcher)
+    batching = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.handle, host, port, backlog=1024)
+    print(f"Serving {predictor.name} v{predictor.version} on http://{host}:{port} "
+          f"(batches of up to {batcher.max_rows} rows, {wait_ms:g} ms wait)", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batching.cancel()
+        batcher.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP forecasts from the serving model: POST /predict, GET /health.")
+    parser.add_argument("--host", default=SERVING_HOST)
+    parser.add_argument("--port", type=int, default=SERVING_PORT)
+    parser.add_argument("--model", default=MODEL_NAME, help="registered model name")
+    parser.add_argument("--batch-max-rows", type=int, default=BATCH_MAX_ROWS)
+    parser.add_argument("--batch-wait-ms", type=float, default=BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    predictor = Predictor(base_dir, args.model)
+    try:
+        asyncio.run(serve(predictor, args.host, args.port, args.batch_max_rows, args.batch_wait_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
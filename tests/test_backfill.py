@@ -0,0 +1,79 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from scripts.ingestion.backfill import backfill, checkpoint_path, empty_marker_path, split_period
+from scripts.ingestion.client import NO_DATA, EntsoeClient
+
+COUNTRY_CODES = {"Germany": ["10Y1001A1001A83F", "10Y1001A1001A82H"]}
+START, END = datetime(2024, 1, 1), datetime(2024, 1, 31)
+ACKNOWLEDGEMENT = ("<Acknowledgement_MarketDocument><Reason><code>999</code>"
+                   "<text>No matching data found for Data item</text></Reason></Acknowledgement_MarketDocument>")
+
+
+class FakeEngine:
+    """
+    Answers each code with a scripted result: XML text, NO_DATA or None for a failure.
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+
+    def fetch_document(self, document, domain, start_str, end_str):
+        return self.answers[domain]
+
+    def map(self, func, items):
+        return {item: func(item) for item in items}
+
+
+def parse(xml_data, country_name):
+    return pd.DataFrame({"timestamp": [pd.Timestamp("2024-01-01")], "load_value": [float(xml_data)],
+                         "country": [country_name], "data_type": ["actual_load"]})
+
+
+def run(answers, checkpoint_dir):
+    df, failed = backfill(FakeEngine(answers), "actual_load", "actual_load", COUNTRY_CODES, parse,
+                          START, END, 0, checkpoint_dir=str(checkpoint_dir))
+    path = checkpoint_path("actual_load", "Germany", split_period(START, END, 0)[0], str(checkpoint_dir))
+    return df, failed, path
+
+
+def test_chunk_is_empty_only_when_every_code_has_no_data(tmp_path):
+    df, failed, path = run({"10Y1001A1001A83F": NO_DATA, "10Y1001A1001A82H": NO_DATA}, tmp_path)
+    assert not failed and df.empty
+    assert os.path.exists(empty_marker_path(path))
+
+
+def test_failed_code_leaves_the_chunk_for_a_retry(tmp_path):
+    df, failed, path = run({"10Y1001A1001A83F": None, "10Y1001A1001A82H": NO_DATA}, tmp_path)
+    assert failed == [("Germany", split_period(START, END, 0)[0])]
+    assert not os.path.exists(path) and not os.path.exists(empty_marker_path(path))
+
+
+def test_data_from_a_later_code_is_checkpointed(tmp_path):
+    df, failed, path = run({"10Y1001A1001A83F": None, "10Y1001A1001A82H": "42"}, tmp_path)
+    assert not failed and os.path.exists(path)
+    assert df["load_value"].tolist() == [42.0]
+
+
+class FakeResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = {}
+
+
+def client_answer(status_code, text):
+    client = EntsoeClient("http://localhost/api", retries=1)
+    client.session.get = lambda *args, **kwargs: FakeResponse(status_code, text)
+    return client.get({"documentType": "A65", "periodStart": "202401010000", "periodEnd": "202401020000"})
+
+
+def test_client_tells_no_data_from_failures():
+    assert client_answer(200, ACKNOWLEDGEMENT) is NO_DATA
+    assert client_answer(400, ACKNOWLEDGEMENT) is NO_DATA
+    assert client_answer(400, "<Acknowledgement_MarketDocument><text>Invalid parameter</text>") is None
+    assert client_answer(401, "Unauthorized") is None
+    assert client_answer(200, "<Publication_MarketDocument/>") == "<Publication_MarketDocument/>"
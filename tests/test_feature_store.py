@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from scripts.features.feature_store import FEATURE_COLUMNS, HORIZON, VALUE_COLUMNS, compute_features, source_rows
+
+COUNTRIES = ["Austria", "Belgium"]
+START = pd.Timestamp("2024-01-01")
+
+
+def history(days=12, skip=()):
+    """
+    Hourly values of every country, distinct per row, without the
+    (country, timestamp) pairs in skip.
+    """
+    timestamps = pd.date_range(START, periods=24 * days, freq="h")
+    rows = []
+    for k, country in enumerate(COUNTRIES):
+        hour = np.arange(len(timestamps), dtype="float64")
+        rows.append(pd.DataFrame({"country": country, "timestamp": timestamps, "load_value": 1000 + hour + 10000 * k,
+                                  "generation_forecast": 500 + 2 * hour + 10000 * k,
+                                  "energy_price": 50 + np.sin(hour) + 100 * k}))
+    df = pd.concat(rows, ignore_index=True)
+    df = df[[(country, ts) not in skip for country, ts in zip(df["country"], df["timestamp"])]]
+    return source_rows(df)
+
+
+def test_features_only_use_rows_a_horizon_before():
+    df = history()
+    features = compute_features(df)
+    for t in [START + pd.Timedelta(hours=h) for h in [200, 230, 287]]:
+        # Changing every value after t - HORIZON must not change the features at t.
+        changed = df.copy()
+        later = changed["timestamp"] > t - HORIZON
+        changed.loc[later, VALUE_COLUMNS] = changed.loc[later, VALUE_COLUMNS] * 7 + 3
+        keys = df[df["timestamp"] == t]
+        expected = features[features["timestamp"] == t].reset_index(drop=True)
+        pd.testing.assert_frame_equal(compute_features(changed, keys)[FEATURE_COLUMNS], expected[FEATURE_COLUMNS])
+
+        austria = df[df["country"] == "Austria"].set_index("timestamp")["load_value"]
+        row = expected.iloc[0]
+        assert row["load_value_lag_24h"] == np.float32(austria[t - HORIZON])
+        assert row["load_value_lag_168h"] == np.float32(austria[t - pd.Timedelta(hours=168)])
+        window = austria[(austria.index > t - 2 * HORIZON) & (austria.index <= t - HORIZON)]
+        assert len(window) == 24
+        assert np.isclose(row["load_value_mean_24h"], window.mean())
+
+
+def test_missing_hour_is_not_filled_by_a_neighbour():
+    missing = START + pd.Timedelta(hours=100)
+    df = history(skip={("Austria", missing)})
+    features = compute_features(df).set_index(["country", "timestamp"])
+    after = missing + pd.Timedelta(hours=24)
+    assert np.isnan(features.loc[("Austria", after), "load_value_lag_24h"])
+    assert np.isnan(features.loc[("Austria", missing + pd.Timedelta(hours=168)), "energy_price_lag_168h"])
+    assert np.isnan(features.loc[("Austria", after), "price_load_ratio_lag_24h"])
+    # The hours around it, and the other country at the same hour, keep their own lags.
+    assert features.loc[("Austria", after + pd.Timedelta(hours=1)), "load_value_lag_24h"] == 1000 + 101
+    assert features.loc[("Austria", after - pd.Timedelta(hours=1)), "load_value_lag_24h"] == 1000 + 99
+    assert features.loc[("Belgium", after), "load_value_lag_24h"] == 11000 + 100
+    # The window ending at the missing hour is missing too; the next one
+    # averages the 23 hours of its day that exist.
+    assert np.isnan(features.loc[("Austria", after), "load_value_mean_24h"])
+    window = [1000 + h for h in range(78, 102) if h != 100]
+    assert np.isclose(features.loc[("Austria", after + pd.Timedelta(hours=1)), "load_value_mean_24h"], np.mean(window))
@@ -0,0 +1,101 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scripts.ingestion.client import ResponseCache
+from scripts.ingestion.fetch_engine import FetchEngine
+from scripts.ingestion.stub_server import DEFAULT_FIXTURES_DIR, serve_in_thread
+
+GERMANY = "10Y1001A1001A83F"
+
+
+@pytest.fixture
+def stub():
+    """
+    Starts stub servers answering their first requests with the given statuses.
+    """
+    servers = []
+
+    def start(*statuses):
+        server, base_url = serve_in_thread(statuses=statuses)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def engine_for(base_url, cache=None, **kwargs):
+    engine = FetchEngine(base_url, api_key="test", use_cache=False, **kwargs)
+    engine.client.cache = cache
+    engine.client.backoff_base = 0.01
+    return engine
+
+
+def fixture_text(name):
+    with open(f"{DEFAULT_FIXTURES_DIR}/{name}", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_token_bucket_paces_requests(stub):
+    server, base_url = stub()
+    engine = engine_for(base_url, max_workers=4, requests_per_minute=600)
+    started = time.monotonic()
+    results = engine.map(lambda k: engine.fetch_document("actual_load", GERMANY, "202401010000", "202401020000"),
+                         range(12))
+    elapsed = time.monotonic() - started
+    assert all(results.values()) and len(server.requests) == 12
+    # 4 requests from the full bucket, the other 8 at 10 per second.
+    assert elapsed >= 0.75
+
+
+def test_retries_429_and_5xx(stub):
+    server, base_url = stub(429, 503, 500)
+    engine = engine_for(base_url, retries=5)
+    text = engine.fetch_document("actual_load", GERMANY, "202401010000", "202401020000")
+    assert text == fixture_text("A65.xml")
+    assert len(server.requests) == 4
+
+
+def test_gives_up_after_the_retries(stub):
+    server, base_url = stub(503, 503, 503)
+    engine = engine_for(base_url, retries=3)
+    assert engine.fetch_document("actual_load", GERMANY, "202401010000", "202401020000") is None
+    assert len(server.requests) == 3
+
+
+def test_gives_up_on_4xx(stub):
+    server, base_url = stub(401)
+    engine = engine_for(base_url, retries=5)
+    assert engine.fetch_document("actual_load", GERMANY, "202401010000", "202401020000") is None
+    assert len(server.requests) == 1
+
+
+def test_closed_period_is_served_from_the_cache(stub, tmp_path):
+    server, base_url = stub()
+    engine = engine_for(base_url, cache=ResponseCache(str(tmp_path)))
+    first = engine.fetch_document("generation_forecast", GERMANY, "202401010000", "202401020000")
+    second = engine.fetch_document("generation_forecast", GERMANY, "202401010000", "202401020000")
+    assert first == second == fixture_text("A71.xml")
+    assert len(server.requests) == 1
+    assert engine.client.stats["cache_hits"] == 1
+
+
+def test_open_day_is_refetched(stub, tmp_path):
+    server, base_url = stub()
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    start, end = today.strftime("%Y%m%d%H%M"), (today + timedelta(days=1)).strftime("%Y%m%d%H%M")
+    engine = engine_for(base_url, cache=ResponseCache(str(tmp_path), open_period_ttl=0))
+    engine.fetch_document("energy_price", GERMANY, start, end)
+    time.sleep(0.01)
+    engine.fetch_document("energy_price", GERMANY, start, end)
+    assert len(server.requests) == 2
+    assert engine.client.stats["cache_hits"] == 0
+
+    # Within the time to live, an open day is still served from the cache.
+    engine.client.cache.open_period_ttl = 3600
+    engine.fetch_document("energy_price", GERMANY, start, end)
+    assert len(server.requests) == 2
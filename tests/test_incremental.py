@@ -0,0 +1,144 @@
+import gzip
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from scripts.common import catalog
+from scripts.ingestion import incremental
+from scripts.ingestion.incremental import (KEY_COLUMNS, append_delta, load_appended_members, load_high_water_marks,
+                                           read_gzip_members, read_upserted, save_high_water_marks)
+
+COUNTRIES = ["Austria", "Belgium"]
+
+
+def fetch(start, hours, revision=0):
+    """
+    What a fetch of `hours` hours from `start` returns; a later fetch of
+    the same hours has a higher `revision` and revised values.
+    """
+    timestamps = pd.date_range(start, periods=hours, freq="h")
+    hour = (timestamps - pd.Timestamp("2024-01-01")) // pd.Timedelta(hours=1)
+    df = pd.DataFrame({
+        "timestamp": np.tile(timestamps, len(COUNTRIES)),
+        "load_value": np.concatenate([hour * 10.0 + 100000 * k + revision for k in range(len(COUNTRIES))]),
+        "country": np.repeat(COUNTRIES, hours),
+        "data_type": "actual_load",
+    })
+    return df.sort_values(["timestamp", "country"], ignore_index=True)
+
+
+def refreshed(path, runs, compact_after):
+    """
+    Ten days fetched in full, then `runs` daily refreshes that re-fetch the
+    last 48 hours with revised values. Returns the appended member count and
+    what a full refetch after the last run returns.
+    """
+    start, hours = pd.Timestamp("2024-01-01"), 24 * 10
+    initial = fetch(start, hours)
+    initial.to_csv(path, index=False, compression="gzip")
+    latest = {(row.timestamp, row.country): row.load_value for row in initial.itertuples()}
+    appended = 0
+    for run in range(1, runs + 1):
+        delta = fetch(start + pd.Timedelta(hours=hours - 48), 48 + 24, revision=run)
+        hours += 24
+        appended = append_delta(path, delta, appended, compact_after=compact_after)
+        latest.update({(row.timestamp, row.country): row.load_value for row in delta.itertuples()})
+    expected = pd.DataFrame([{"timestamp": ts, "load_value": value, "country": country, "data_type": "actual_load"}
+                             for (ts, country), value in latest.items()])
+    return appended, expected
+
+
+def canonical(df):
+    df = df.assign(timestamp=pd.to_datetime(df["timestamp"]))
+    return df.sort_values(KEY_COLUMNS, ignore_index=True)[["timestamp", "load_value", "country", "data_type"]]
+
+
+def test_appended_file_reads_like_a_full_refetch(tmp_path):
+    path = tmp_path / "load.csv.gz"
+    appended, expected = refreshed(path, runs=3, compact_after=0)
+    assert appended == 3
+    assert len(read_gzip_members(path)) == 4
+    pd.testing.assert_frame_equal(canonical(read_upserted(path)), canonical(expected))
+
+
+def test_compaction_leaves_a_plain_file_without_superseded_rows(tmp_path):
+    path = tmp_path / "load.csv.gz"
+    appended, expected = refreshed(path, runs=4, compact_after=4)
+    assert appended == 0
+    assert len(read_gzip_members(path)) == 1
+    with gzip.open(path, "rt") as f:
+        plain = pd.read_csv(f)
+    pd.testing.assert_frame_equal(canonical(plain), canonical(expected))
+    pd.testing.assert_frame_equal(canonical(read_upserted(path)), canonical(expected))
+
+
+def test_rows_within_one_run_are_kept(tmp_path):
+    path = tmp_path / "load.csv.gz"
+    df = fetch("2024-01-01", 4)
+    pd.concat([df, df.iloc[:1]], ignore_index=True).to_csv(path, index=False, compression="gzip")
+    append_delta(path, fetch("2024-01-01 03:00", 2, revision=10), compact_after=0)
+    upserted = read_upserted(path)
+    assert len(upserted) == len(df) + 1 + len(COUNTRIES)
+    assert (upserted["timestamp"] == str(df["timestamp"].iloc[0])).sum() == 3
+
+
+def test_appended_members_are_counted_until_a_full_write(tmp_path):
+    state = tmp_path / "state.json"
+    marks = {"Austria": pd.Timestamp("2024-01-02")}
+    save_high_water_marks("actual_load", marks, state_path=state, appended_members=3)
+    assert load_appended_members("actual_load", state_path=state) == 3
+    save_high_water_marks("actual_load", marks, state_path=state)
+    assert load_appended_members("actual_load", state_path=state) == 0
+
+
+def save_marks_repeatedly(state_path, data_type, calls):
+    for call in range(calls):
+        marks = {country: pd.Timestamp("2024-01-01") + pd.Timedelta(hours=call) for country in COUNTRIES}
+        save_high_water_marks(data_type, marks, state_path=state_path, appended_members=call)
+
+
+def test_concurrent_fetchers_keep_each_others_marks(tmp_path):
+    # The fetchers run as parallel processes and share one state file.
+    state = str(tmp_path / "state.json")
+    data_types = ["actual_load", "generation_forecast", "energy_price"]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(len(data_types), mp_context=context) as pool:
+        futures = [pool.submit(save_marks_repeatedly, state, data_type, 200) for data_type in data_types]
+        for future in futures:
+            future.result()
+    for data_type in data_types:
+        assert load_high_water_marks(data_type, state_path=state) == {
+            country: pd.Timestamp("2024-01-01") + pd.Timedelta(hours=199) for country in COUNTRIES}
+        assert load_appended_members(data_type, state_path=state) == 199
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_update_appends_to_the_newest_catalogued_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "base_dir", str(tmp_path))
+    load_dir = tmp_path / "data" / "load"
+    load_dir.mkdir(parents=True)
+    state_path = str(tmp_path / "data" / "state" / "high_water_marks.json")
+    monthly = load_dir / "all_countries_actual_total_load_20240101_to_20240110.csv.gz"
+    fetch("2024-01-01", 24 * 10).to_csv(monthly, index=False, compression="gzip")
+
+    def update(end_date):
+        return incremental.incremental_update(
+            "actual_load", str(load_dir), "all_countries_actual_total_load", COUNTRIES, datetime(2024, 1, 1),
+            end_date, 0, lambda windows: [fetch("2024-01-10", 48, revision=1)], state_path)
+
+    # A tree from before the catalog: the file on disk is indexed.
+    monthly = load_dir / "all_countries_actual_total_load_20240101_to_20240111.csv.gz"
+    assert update(datetime(2024, 1, 11)) == str(monthly)
+
+    # A later backfill sorts first by name, but is the newest dataset.
+    backfill = load_dir / "all_countries_actual_total_load_20230101_to_20240111.csv.gz"
+    fetch("2023-01-01", 24 * 376).to_csv(backfill, index=False, compression="gzip")
+    catalog.register(str(tmp_path), "load", str(backfill))
+    updated = update(datetime(2024, 1, 12))
+    assert updated == str(load_dir / "all_countries_actual_total_load_20230101_to_20240112.csv.gz")
+    assert len(read_gzip_members(updated)) == 2
+    assert catalog.latest(str(tmp_path), "load") == updated
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+import main
+
+
+def test_failed_stage_is_recorded(monkeypatch, tmp_path):
+    def stages(base_dir, stage):
+        with stage("merge"):
+            pass
+        with stage("process"):
+            raise ValueError("cleaning broke")
+
+    monkeypatch.setattr(main, "run_stages", stages)
+    records = {}
+    with pytest.raises(ValueError):
+        main.run_in_process(str(tmp_path), records=records)
+    assert records["merge"]["status"] == "ok"
+    assert records["process"]["status"] == "failed"
+    assert records["process"]["error"] == "ValueError: cleaning broke"
+    assert [records[name]["status"] for name in main.IN_PROCESS_STAGES[2:]] == ["blocked"] * 5
+
+
+def test_dependencies_follow_patterns_and_directories(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "base_dir", str(tmp_path))
+    processed = os.path.join("data", "processed_data")
+    stages = [
+        main.Stage("process", "process.py", outputs=[os.path.join(processed, "processed_dataset_*")]),
+        main.Stage("train", "train.py", outputs=[os.path.join(processed, "model_predictions.csv")]),
+        main.Stage("report", "report.py", inputs=[os.path.join(processed, "processed_dataset_20240101.parquet")]),
+        main.Stage("archive", "archive.py", inputs=[processed]),
+    ]
+    deps = main.dependencies(stages)
+    assert deps["report"] == {"process"}
+    assert deps["archive"] == {"process", "train"}
+
+    assert not main.path_exists(stages[0].outputs[0])
+    (tmp_path / "data" / "processed_data").mkdir(parents=True)
+    (tmp_path / "data" / "processed_data" / "processed_dataset_20240101.parquet").touch()
+    assert main.path_exists(stages[0].outputs[0])
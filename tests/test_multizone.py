@@ -0,0 +1,40 @@
+import pandas as pd
+
+from scripts.ingestion.multizone import country_totals, save_zones, zone_active
+from scripts.ingestion.zones import BIDDING_ZONES
+
+ITALY = {"Italy": BIDDING_ZONES["Italy"]}
+
+
+def zone_rows(timestamps, skip=()):
+    return pd.DataFrame([
+        {"timestamp": pd.Timestamp(ts), "load_value": 1.0, "country": "Italy", "data_type": "actual_load", "zone": zone}
+        for ts in timestamps for zone in ITALY["Italy"] if (ts, zone) not in skip
+    ])
+
+
+def test_totals_follow_zone_validity():
+    # Calabria is only a zone from 2021; an hour before it is complete without it.
+    before, after = "2020-12-31 23:00", "2021-01-01 00:00"
+    df = zone_rows([before, after], skip={(before, "IT-Calabria")})
+    totals = country_totals(df, "load_value", ITALY)
+    assert totals["load_value"].tolist() == [6.0, 7.0]
+
+    totals = country_totals(df[df["zone"] != "IT-Calabria"], "load_value", ITALY)
+    assert totals["timestamp"].tolist() == [pd.Timestamp(before)]
+
+
+def test_zone_queried_only_once_it_exists():
+    calabria = ITALY["Italy"]["IT-Calabria"]
+    assert not zone_active(calabria, "202012312300")
+    assert zone_active(calabria, "202101010100")
+    assert zone_active(ITALY["Italy"]["IT-North"], "201501010000")
+
+
+def test_save_zones(tmp_path):
+    output_path = tmp_path / "all_countries_actual_total_load_20240101_to_20240131.csv.gz"
+    assert save_zones(pd.DataFrame(), str(output_path), "Actual Total Load") is None
+    df = zone_rows(["2024-01-01 01:00", "2024-01-01 00:00"])
+    path = save_zones(df, str(output_path), "Actual Total Load")
+    assert path == str(tmp_path / "zones" / "all_zones_actual_total_load_20240101_to_20240131.csv.gz")
+    assert len(pd.read_csv(path)) == len(df)
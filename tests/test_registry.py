@@ -0,0 +1,83 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from scripts.model import registry, xgboost_model
+
+NAME = "generation_forecast"
+
+
+def booster(rounds):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    return xgb.train({"seed": 0}, xgb.DMatrix(X, label=X[:, 0]), num_boost_round=rounds)
+
+
+def serving_file_rounds(base_dir):
+    return joblib.load(os.path.join(base_dir, registry.SERVING_FILES[NAME])).num_boosted_rounds()
+
+
+def test_serving_file_follows_promotions_and_rollbacks(tmp_path):
+    base_dir = str(tmp_path)
+    assert registry.register(base_dir, NAME, booster(2), rmse=10.0).promoted
+    assert serving_file_rounds(base_dir) == 2
+    assert registry.register(base_dir, NAME, booster(3), rmse=9.0).promoted
+    assert serving_file_rounds(base_dir) == 3
+
+    # A rejected retrain leaves the serving file alone.
+    assert not registry.register(base_dir, NAME, booster(4), rmse=20.0).promoted
+    assert serving_file_rounds(base_dir) == 3
+
+    registry.promote(base_dir, NAME, 1)
+    assert registry.serving(base_dir, NAME)["version"] == 1
+    assert serving_file_rounds(base_dir) == 2
+
+
+def test_names_without_a_serving_file(tmp_path):
+    base_dir = str(tmp_path)
+    assert registry.register(base_dir, f"{NAME}/DE", booster(2), rmse=1.0).promoted
+    assert not os.path.exists(os.path.join(base_dir, "models", "xgboost_generation_forecast_model.joblib"))
+
+
+def test_slightly_worse_retrain_is_not_promoted_by_default(tmp_path):
+    base_dir = str(tmp_path)
+    assert registry.register(base_dir, NAME, booster(2), rmse=10.0).promoted
+    assert not registry.register(base_dir, NAME, booster(3), rmse=10.01).promoted
+    assert serving_file_rounds(base_dir) == 2
+    assert registry.register(base_dir, NAME, booster(4), rmse=10.0).promoted
+    assert registry.should_promote(10.1, {"rmse": 10.0}, tolerance=0.02)
+
+
+def calendar_frame(hours, scale):
+    timestamps = pd.date_range("2024-01-01", periods=hours, freq="h")
+    return pd.DataFrame({"hour": timestamps.hour, "day_of_week": timestamps.dayofweek, "day": timestamps.day,
+                         "month": timestamps.month, "year": timestamps.year, "country": "Germany",
+                         "measurement": scale * timestamps.hour.astype("float64")})
+
+
+def calendar_booster(df):
+    X = xgboost_model.native_features(df, ["Germany"])
+    return xgb.train({"seed": 0}, xgb.DMatrix(X, label=df["measurement"], enable_categorical=True),
+                     num_boost_round=30)
+
+
+def test_retrain_is_compared_on_the_test_period(tmp_path, monkeypatch):
+    monkeypatch.setattr(xgboost_model, "TRAIN_MODE", "native")
+    base_dir = str(tmp_path)
+    # The serving model fits the test period; the retrain fits only the
+    # validation rows it stopped on.
+    df_val, df_test = calendar_frame(48, 1.0), calendar_frame(48, 2.0)
+    registry.register(base_dir, NAME, calendar_booster(df_test), rmse=5.0, params={"categories": ["Germany"]})
+    retrain = xgboost_model.TrainingResult(calendar_booster(df_val), ["Germany"], 0.0, None)
+
+    registration = xgboost_model.register_model(NAME, retrain, df_val, base_dir, df_test=df_test)
+    assert not registration.promoted
+    row = registry.versions(base_dir, NAME).iloc[-1]
+    assert row["rmse"] > 1.0
+    assert registry.serving(base_dir, NAME)["version"] == 1
+
+    # Without test rows, the validation rows flatter the retrain.
+    assert xgboost_model.register_model(NAME, retrain, df_val, base_dir).promoted
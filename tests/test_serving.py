@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from scripts.common.schema import TIMEZONE
+from scripts.features.feature_store import read_features, update_store
+from scripts.model import xgboost_model
+from scripts.serving.predictor import Predictor, Rows, Scores
+from scripts.serving.service import MicroBatcher
+
+# Not in sorted order, so a country's category code is not its position here.
+COUNTRIES = ["France", "Austria", "Belgium"]
+
+
+def wide(days=21):
+    timestamps = pd.date_range("2024-01-01", periods=24 * days, freq="h", tz=TIMEZONE)
+    hour = np.arange(len(timestamps), dtype="float64")
+    return pd.concat([pd.DataFrame({
+        "timestamp": timestamps, "country": country, "day_of_week": timestamps.dayofweek,
+        "load_value": 1000 * (k + 1) + 50 * np.sin(hour / 24 * 2 * np.pi) + hour,
+        "generation_forecast": 900 * (k + 1) + 40 * np.sin(hour / 24 * 2 * np.pi + k) + hour,
+        "energy_price": 50 + 10 * k + np.cos(hour / 12),
+    }) for k, country in enumerate(COUNTRIES)], ignore_index=True)
+
+
+def test_predictor_matches_the_booster_on_training_features(tmp_path, monkeypatch):
+    monkeypatch.setattr(xgboost_model, "TRAIN_MODE", "native")
+    monkeypatch.setattr(xgboost_model, "MAX_ROUNDS", 40)
+    base_dir = str(tmp_path)
+    frame = wide()
+    update_store(base_dir, source_path=str(tmp_path / "merged_wide.parquet"), wide=frame)
+    rows = xgboost_model.training_rows(frame, read_features(base_dir))
+    cut = rows["timestamp"].quantile(0.75)
+    df_train, df_val = rows[rows["timestamp"] < cut], rows[rows["timestamp"] >= cut]
+    result = xgboost_model.train_native(df_train, df_val, threads=1)
+    assert xgboost_model.register_model(xgboost_model.MODEL_NAME, result, df_val, base_dir).promoted
+
+    predictor = Predictor(base_dir)
+    X = xgboost_model.native_features(df_val, result.encoder)
+    expected = result.model.predict(xgb.DMatrix(X, enable_categorical=True))
+    scores = predictor.predict(Rows(df_val["country"].to_numpy(object),
+                                    pd.DatetimeIndex(df_val["timestamp"]).tz_convert("UTC").as_unit("ns").asi8))
+    assert scores.found.all()
+    np.testing.assert_allclose(scores.predictions, expected, rtol=1e-6)
+
+
+class EchoPredictor:
+    """
+    Scores each row with its own timestamp, so a caller can tell its rows.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, rows):
+        self.batches.append(len(rows))
+        return Scores(rows.timestamps.astype("float32"), rows.timestamps % 2 == 0)
+
+
+def test_batcher_returns_each_caller_its_own_rows():
+    predictor = EchoPredictor()
+
+    async def run():
+        batcher = MicroBatcher(predictor, max_rows=64, wait_ms=20)
+        batching = asyncio.create_task(batcher.run())
+        requests = [Rows(np.array(["Austria"] * n, dtype=object), np.arange(100 * k, 100 * k + n, dtype="int64"))
+                    for k, n in enumerate([3, 1, 7, 40, 30, 5])]
+        results = await asyncio.gather(*(batcher.predict(rows) for rows in requests))
+        batching.cancel()
+        batcher.executor.shutdown()
+        return requests, results, batcher
+
+    requests, results, batcher = asyncio.run(run())
+    for rows, (predictions, found) in zip(requests, results):
+        np.testing.assert_array_equal(predictions, rows.timestamps.astype("float32"))
+        np.testing.assert_array_equal(found, rows.timestamps % 2 == 0)
+    # Several requests shared a batch.
+    assert len(predictor.batches) < len(requests)
+    assert sum(predictor.batches) == batcher.rows == 86
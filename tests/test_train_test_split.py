@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from scripts.common.schema import TIMEZONE
+from scripts.data_splitting.train_test_split import (SPLIT_FRACTIONS, Splits, fold_positions, manifest_positions,
+                                                     split_manifest)
+
+COUNTRIES = ["Austria", "Belgium", "France"]
+
+
+def merged(hours=1000):
+    timestamps = pd.date_range("2024-03-01", periods=hours, freq="h", tz="UTC").tz_convert(TIMEZONE)
+    return pd.DataFrame({"timestamp": np.repeat(timestamps, len(COUNTRIES)),
+                         "country": np.tile(COUNTRIES, hours), "measurement": 1.0})
+
+
+def rows(df, positions):
+    return np.arange(len(df))[positions]
+
+
+def bounds(period):
+    return [pd.Timestamp(ts) for ts in period]
+
+
+def test_periods_cover_every_row_once_in_order():
+    df = merged()
+    manifest = split_manifest(df, mode="chronological")
+    periods = [bounds(manifest["periods"][name]) for name in Splits._fields]
+    assert periods[0][0] == df["timestamp"].min() and periods[-1][1] > df["timestamp"].max()
+    for (start, end), (next_start, _) in zip(periods, periods[1:]):
+        assert start < end == next_start
+
+    # Shuffled, the periods are positions instead of slices; they hold the same rows.
+    shuffled = df.sample(frac=1, random_state=0)
+    for frame in [df, shuffled]:
+        positions = manifest_positions(frame, manifest)
+        taken = np.concatenate([rows(frame, p) for p in positions])
+        assert np.array_equal(np.sort(taken), np.arange(len(frame)))
+        for p, (start, end), fraction in zip(positions, periods, SPLIT_FRACTIONS.values()):
+            timestamps = frame["timestamp"].iloc[p]
+            assert timestamps.min() >= start and timestamps.max() < end
+            # Cut at whole hours, so within one hour's rows of the fraction.
+            assert abs(len(timestamps) - fraction * len(frame)) <= len(COUNTRIES)
+
+
+def test_folds_expand_over_train_and_validation():
+    df = merged()
+    manifest = split_manifest(df, mode="chronological")
+    first, validation_end = bounds(manifest["periods"]["train"])[0], bounds(manifest["periods"]["validation"])[1]
+    folds = [(bounds(fold["train"]), bounds(fold["validation"])) for fold in manifest["folds"]]
+    assert len(folds) == 3
+    for k, (train, validation) in enumerate(folds):
+        assert train[0] == first and train[0] < train[1] == validation[0] < validation[1]
+        if k:
+            # Each fold trains on the previous fold's rows and its validation block.
+            assert train[1] == folds[k - 1][1][1]
+    assert folds[-1][1][1] == validation_end
+
+    for (train_rows, validation_rows), (train, _) in zip(fold_positions(df, manifest), folds):
+        train_rows, validation_rows = rows(df, train_rows), rows(df, validation_rows)
+        assert len(train_rows) and len(validation_rows)
+        assert not np.intersect1d(train_rows, validation_rows).size
+        assert df["timestamp"].iloc[train_rows].max() < df["timestamp"].iloc[validation_rows].min()
+        assert df["timestamp"].iloc[validation_rows].max() < validation_end
+        assert np.array_equal(train_rows, np.flatnonzero(df["timestamp"] < train[1]))
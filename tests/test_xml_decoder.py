@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.ingestion.stub_server import DEFAULT_FIXTURES_DIR
+from scripts.ingestion.xml_decoder import decode_points, hourly_values
+from scripts.price.energy_prices import parse_and_format_prices
+
+
+def read_fixture(name):
+    with open(os.path.join(DEFAULT_FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def expected_hourly(start, values):
+    index = pd.DatetimeIndex(pd.date_range(start, periods=len(values), freq="h").as_unit("ns"), freq=None,
+                             name="timestamp")
+    return pd.Series(values, index=index, name="value", dtype="float64")
+
+
+A44_DAY = [56.57, 55.44, 55.39, 54.89, 55.19, 55.07, 56.81, 59.92, 62.38, 62.39, 56.0, 53.93,
+           50.0, 46.03, 49.84, 55.0, 66.31, 77.36, 88.67, 78.64, 69.92, 65.66, 65.23, 58.38]
+# A03 points at positions 1, 2, 5, 10, 18 and 23 of the 23-hour DST day; the
+# positions in between repeat the last published value.
+A03_DAY = [50.0, 48.5, 48.5, 48.5, 45.0, 45.0, 45.0, 45.0, 45.0, 60.25, 60.25, 60.25,
+           60.25, 60.25, 60.25, 60.25, 60.25, 81.0, 81.0, 81.0, 81.0, 81.0, 70.0]
+
+
+def test_a44_full_day():
+    points = decode_points(read_fixture("A44.xml"), value_tag="price.amount")
+    assert len(points["value"]) == 24
+    assert set(points["resolution"].tolist()) == {60}
+    pd.testing.assert_series_equal(hourly_values(points), expected_hourly("2024-02-24 23:00", A44_DAY))
+
+
+def test_a44_curve_expansion_and_several_periods():
+    points = decode_points(read_fixture("A44_10Y1001A1001A82H.xml"), value_tag="price.amount")
+    # 23 expanded hourly positions of the first TimeSeries, then two PT15M
+    # periods of four points each in the second one.
+    assert points["series"].tolist() == [0] * 23 + [1] * 8
+    assert points["resolution"].tolist() == [60] * 23 + [15] * 8
+    np.testing.assert_array_equal(points["position"], np.r_[1:24, 1:5, 1:5])
+    np.testing.assert_array_equal(points["value"][:23], A03_DAY)
+    expected = expected_hourly("2024-03-30 23:00", A03_DAY + [83.0, 92.0])
+    pd.testing.assert_series_equal(hourly_values(points), expected)
+
+
+def test_price_parser_frame():
+    df = parse_and_format_prices(read_fixture("A44_10Y1001A1001A82H.xml"), "Germany", 1)
+    timestamps = pd.date_range("2024-03-31 00:00", periods=25, freq="h").as_unit("ns")
+    expected = pd.DataFrame({
+        "timestamp": timestamps,
+        "energy_price": A03_DAY + [83.0, 92.0],
+        "day_of_week": timestamps.dayofweek,
+        "country": "Germany",
+        "data_type": "energy_price",
+    })
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected)